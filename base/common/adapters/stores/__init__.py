@@ -1,4 +1,5 @@
 from .common import *  # noqa
 from .dynamo import *  # noqa
+from .dynamo_memory import *  # noqa
 from .mongo import *  # noqa
 from .postgres import *  # noqa
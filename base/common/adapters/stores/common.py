@@ -1,8 +1,28 @@
 import abc
 import sys
-from contextlib import AbstractContextManager, contextmanager
-from dataclasses import dataclass
-from typing import Any, Callable, ContextManager, Generic, Literal, Optional, Tuple, TypeVar
+import threading
+import time
+from contextlib import (
+    AbstractAsyncContextManager,
+    AbstractContextManager,
+    asynccontextmanager,
+    contextmanager,
+)
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import (
+    Any,
+    AsyncContextManager,
+    Callable,
+    ContextManager,
+    Dict,
+    Generic,
+    Literal,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
 from pydantic import BaseModel, ConfigDict
 
@@ -29,6 +49,9 @@ class StoreErrors:
     class ForeignKeyViolation(BaseError):
         pass
 
+    class Timeout(BaseError):
+        pass
+
 
 C = TypeVar("C")
 S = TypeVar("S")
@@ -46,10 +69,117 @@ class StoreConfig(BaseModel):
     class_name: str
 
 
-class StoreConnection(Generic[C, S]):
+@dataclass
+class SessionMetrics:
+    connection: str
+    checkout_ms: float
+    session_ms: float
+    outcome: Literal["commit", "rollback", "autocommit", "error"]
+
+
+@dataclass
+class StoreConnectionStats:
+    sessions: int = 0
+    commits: int = 0
+    rollbacks: int = 0
+    errors: int = 0
+    checkout_ms_total: float = 0.0
+    checkout_ms_max: float = 0.0
+    session_ms_total: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, metrics: SessionMetrics):
+        with self._lock:
+            self.sessions += 1
+            self.commits += metrics.outcome == "commit"
+            self.rollbacks += metrics.outcome == "rollback"
+            self.errors += metrics.outcome in ("rollback", "error")
+            self.checkout_ms_total += metrics.checkout_ms
+            self.checkout_ms_max = max(self.checkout_ms_max, metrics.checkout_ms)
+            self.session_ms_total += metrics.session_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+
+
+class StoreMetricsSink:
+    """Receives the metrics of every store session, e.g. to push them to a monitoring
+    system. The base implementation discards them."""
+
+    def record(self, metrics: SessionMetrics): ...
+
+
+_session_metrics_ctx_var: ContextVar[Optional[SessionMetrics]] = ContextVar(
+    "store-session-metrics", default=None
+)
+_session_checkout_ctx_var: ContextVar[Optional[float]] = ContextVar(
+    "store-session-checkout", default=None
+)
+
+
+def check_session_options(connection: Any, options: dict):
+    """Rejects the session options not declared by the connection, e.g. a misspelled one"""
+    if unknown := sorted(set(options) - set(connection.session_options)):
+        msg = f"{type(connection).__name__}: unsupported session options {unknown}"
+        raise StoreErrors.BaseError(msg)
+
+
+class InstrumentedConnection:
+    """Collects the session metrics of a store connection"""
+
+    metrics_sink: StoreMetricsSink = StoreMetricsSink()
+
+    @cached_property
+    def stats(self) -> StoreConnectionStats:
+        return StoreConnectionStats()
+
+    @staticmethod
+    def last_session_metrics() -> Optional[SessionMetrics]:
+        """Metrics of the last session closed in the current context"""
+        return _session_metrics_ctx_var.get()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {}
+
+    @staticmethod
+    def _mark_checkout():
+        """Called by create_session as soon as the connection is checked out of the pool, so
+        that the checkout wait excludes the session setup"""
+        _session_checkout_ctx_var.set(time.perf_counter())
+
+    def translate_error(self, err: Exception) -> Exception:
+        """Maps the errors of the store driver raised inside a session to StoreErrors"""
+        return err
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats.snapshot(), "pool": self.pool_stats()}
+
+    def _record_session(
+        self, started: float, checked_out: Optional[float], outcome: str
+    ) -> SessionMetrics:
+        ended = time.perf_counter()
+        metrics = SessionMetrics(
+            connection=self.__class__.__name__,
+            checkout_ms=round(1000 * ((checked_out or ended) - started), 2),
+            session_ms=round(1000 * (ended - checked_out), 2) if checked_out else 0.0,
+            outcome=outcome,
+        )
+        self.stats.add(metrics)
+        _session_metrics_ctx_var.set(metrics)
+        try:
+            self.metrics_sink.record(metrics)
+        except Exception as err:
+            self.logger.warning(f"StoreConnection: unable to record metrics. {str(err)}")
+        return metrics
+
+
+class StoreConnection(InstrumentedConnection, Generic[C, S]):
     logger: Logger
     config: StoreConfig
     connection: Optional[C] = None
+    # the options of create_session supported by the store
+    session_options: Tuple[str, ...] = ()
 
     @abc.abstractmethod
     def connect(self) -> C:
@@ -60,7 +190,11 @@ class StoreConnection(Generic[C, S]):
         raise NotImplementedError()  # pragma: no cover
 
     @abc.abstractmethod
-    def create_session(self, connection: C, autocommit: bool) -> Tuple[S, Optional[ContextManager]]:
+    def create_session(
+        self, connection: C, autocommit: bool, **options
+    ) -> Tuple[S, Optional[ContextManager]]:
+        """Options are specific of each store, the cursor rejects the ones not listed
+        in `session_options`"""
         raise NotImplementedError()  # pragma: no cover
 
     @abc.abstractmethod
@@ -81,42 +215,132 @@ class StoreConnection(Generic[C, S]):
 
     @contextmanager
     def cursor(
-        self, autocommit: bool = False
+        self, autocommit: bool = False, **options
     ) -> Callable[..., AbstractContextManager[StoreCursor]]:
+        check_session_options(self, options)
+        started = time.perf_counter()
+        checked_out = None
+        outcome = "error"
         active_connection = self.connection
         if not self.is_connected(active_connection):
             active_connection = self.connect()
             self.connection = active_connection
         session = None
         ctx_mng = None
+        _session_checkout_ctx_var.set(None)
         try:
-            session, ctx_mng = self.create_session(active_connection, autocommit)
+            session, ctx_mng = self.create_session(active_connection, autocommit, **options)
+            checked_out = _session_checkout_ctx_var.get() or time.perf_counter()
             yield self.create_cursor(session)
         except Exception as err:
             self.logger.error(f"StoreConnection: {str(err)}")
-            self.rollback_session(session) if not autocommit else None
+            self.rollback_session(session) if session is not None and not autocommit else None
+            outcome = "rollback" if session is not None and not autocommit else "error"
+            if (store_err := self.translate_error(err)) is not err:
+                raise store_err from err
             raise err
         else:
             self.commit_session(session) if not autocommit else None
+            outcome = "commit" if not autocommit else "autocommit"
         finally:
             if ctx_mng:
                 ctx_mng.__exit__(None, None, None)
             if session:
                 self.close_session(session)
+            self._record_session(started, checked_out, outcome)
+
+
+class AsyncStoreConnection(InstrumentedConnection, Generic[C, S]):
+    """Asyncio counterpart of StoreConnection, with the same session lifecycle"""
+
+    logger: Logger
+    config: StoreConfig
+    connection: Optional[C] = None
+    # the options of create_session supported by the store
+    session_options: Tuple[str, ...] = ()
+
+    @abc.abstractmethod
+    async def connect(self) -> C:
+        raise NotImplementedError()  # pragma: no cover
+
+    @abc.abstractmethod
+    async def is_connected(self, connection: C) -> bool:
+        raise NotImplementedError()  # pragma: no cover
+
+    @abc.abstractmethod
+    async def create_session(
+        self, connection: C, autocommit: bool, **options
+    ) -> Tuple[S, Optional[AsyncContextManager]]:
+        raise NotImplementedError()  # pragma: no cover
+
+    @abc.abstractmethod
+    async def rollback_session(self, session: S):
+        raise NotImplementedError()  # pragma: no cover
+
+    @abc.abstractmethod
+    async def commit_session(self, session: S):
+        raise NotImplementedError()  # pragma: no cover
+
+    @abc.abstractmethod
+    async def close_session(self, session: S):
+        raise NotImplementedError()  # pragma: no cover
+
+    @abc.abstractmethod
+    def create_cursor(self, session: S) -> StoreCursor:
+        raise NotImplementedError()  # pragma: no cover
+
+    @asynccontextmanager
+    async def cursor(
+        self, autocommit: bool = False, **options
+    ) -> Callable[..., AbstractAsyncContextManager[StoreCursor]]:
+        check_session_options(self, options)
+        started = time.perf_counter()
+        checked_out = None
+        outcome = "error"
+        active_connection = self.connection
+        if not await self.is_connected(active_connection):
+            active_connection = await self.connect()
+            self.connection = active_connection
+        session = None
+        ctx_mng = None
+        _session_checkout_ctx_var.set(None)
+        try:
+            session, ctx_mng = await self.create_session(active_connection, autocommit, **options)
+            checked_out = _session_checkout_ctx_var.get() or time.perf_counter()
+            yield self.create_cursor(session)
+        except Exception as err:
+            self.logger.error(f"AsyncStoreConnection: {str(err)}")
+            await self.rollback_session(session) if session is not None and not autocommit else None
+            outcome = "rollback" if session is not None and not autocommit else "error"
+            if (store_err := self.translate_error(err)) is not err:
+                raise store_err from err
+            raise err
+        else:
+            await self.commit_session(session) if not autocommit else None
+            outcome = "commit" if not autocommit else "autocommit"
+        finally:
+            if ctx_mng:
+                await ctx_mng.__aexit__(None, None, None)
+            if session:
+                await self.close_session(session)
+            self._record_session(started, checked_out, outcome)
 
 
 class Repository(abc.ABC):
     pass
 
 
-def get_db_instance(config: StoreConnectionSettings, parent_logger: Logger):
+def get_db_instance(
+    config: StoreConnectionSettings, parent_logger: Logger, class_name: Optional[str] = None
+):
     settings_class_name = config.class_name_settings.split(".")[-1]
     settings_class_name_module = ".".join(config.class_name_settings.split(".")[:-1])
     settings_clz = getattr(sys.modules[settings_class_name_module], settings_class_name)
     settings = settings_clz()
 
-    class_name = config.class_name.split(".")[-1]
-    class_name_module = ".".join(config.class_name.split(".")[:-1])
+    full_class_name = class_name or config.class_name
+    class_name = full_class_name.split(".")[-1]
+    class_name_module = ".".join(full_class_name.split(".")[:-1])
     clz = getattr(sys.modules[class_name_module], class_name)
 
     return clz(config=settings, parent_logger=parent_logger)
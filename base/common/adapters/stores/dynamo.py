@@ -1,13 +1,38 @@
 import abc
-from dataclasses import dataclass
+import base64
+import copy
+import json
+import queue
+import random
+import sys
+import threading
+import time as timer
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import date, datetime, time
 from decimal import Decimal
 from functools import partial
-from typing import Any, Dict, List, Optional, Tuple, Type
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
 import boto3
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Attr, AttributeBase
 from boto3.dynamodb.conditions import ConditionBase as DynamoConditionBase
+from boto3.dynamodb.conditions import ConditionExpressionBuilder
 from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from botocore.config import Config
 from botocore.exceptions import ClientError
@@ -65,17 +90,108 @@ def dynamo_direct_serializer(o: Dict) -> Dict:
     return {k: _ser(v) for k, v in o.items()}
 
 
+def _to_attribute(v: Any) -> Dict:
+    if isinstance(v, str):
+        return {"S": v}
+    if isinstance(v, bool):
+        return {"BOOL": v}
+    if isinstance(v, (int, Decimal)):
+        return {"N": str(v)}
+    if v is None:
+        return {"NULL": True}
+    if isinstance(v, dict):
+        return {"M": {k: _to_attribute(x) for k, x in v.items()}}
+    if isinstance(v, list):
+        return {"L": [_to_attribute(x) for x in v]}
+    # sets, binaries and the types not supported by dynamo
+    return botodynamoser(v)
+
+
+def _from_attribute(v: Dict) -> Any:
+    ((tag, value),) = v.items()
+    if tag == "S":
+        return value
+    if tag == "N":
+        return Decimal(value)
+    if tag == "M":
+        return {k: _from_attribute(x) for k, x in value.items()}
+    if tag == "L":
+        return [_from_attribute(x) for x in value]
+    if tag == "BOOL":
+        return value
+    if tag == "NULL":
+        return None
+    return botodynamodeser(v)
+
+
+def dynamo_fast_serializer(o: Dict) -> Dict:
+    """Single pass equivalent of botodynamoser on the dynamo_direct_serializer output,
+    producing the attribute values of the low level client"""
+    return {k: _to_attribute(v) for k, v in dynamo_direct_serializer(o).items()}
+
+
+def dynamo_fast_deserializer(o: Dict) -> Dict:
+    """Single pass equivalent of dynamo_direct_deserializer on the botodynamodeser output,
+    reading the attribute values of the low level client"""
+
+    def _des(v):
+        if "M" in v:
+            d = v["M"]
+            if "datetime" in d:
+                return datetime.fromisoformat(d["datetime"]["S"])
+            elif "date" in d:
+                return date.fromisoformat(d["date"]["S"])
+            elif "time" in d:
+                return time.fromisoformat(d["time"]["S"])
+            elif "float" in d:
+                return float(d["float"]["N"])
+        return _from_attribute(v)
+
+    return {k: _des(v) for k, v in o.items()}
+
+
+def encode_start_key(key: Optional[dict]) -> Optional[str]:
+    """Opaque cursor of a LastEvaluatedKey, e.g. for Pagination.after_cursor"""
+    if not key:
+        return None
+    data = json.dumps({k: botodynamoser(v) for k, v in key.items()})
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("utf-8")
+
+
+def decode_start_key(cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    data = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+    return {k: botodynamodeser(v) for k, v in data.items()}
+
+
 Boto3Session = boto3.session.Session
 DynamoDbResource = boto3.session.Session.resource
 
 
-@dataclass
 class DynamoDbCursor(StoreCursor):
-    cursor: DynamoDbResource
+    # boto3 resources are created at runtime, so they cannot be validated by type
+    cursor: Any
     one_table_name: str
+    # plain client of the low level requests: the client of the resource (de)serializes
+    # the attribute values of the requests and of the responses
+    client: Any
+
+    def table(self, name: Optional[str] = None) -> Any:
+        """Table of the resource, carrying the plain client of the low level requests of
+        DynamoDbRepo. The tables created otherwise can be used only by the other requests"""
+        table = self.cursor.Table(name or self.one_table_name)
+        table.low_level_client = self.client
+        return table
+
+
+def low_level_client(dynamo_table: Any) -> Any:
+    if (client := getattr(dynamo_table, "low_level_client", None)) is None:
+        msg = "low level requests need a table carrying a plain client, see DynamoDbCursor.table"
+        raise StoreErrors.BaseError(msg)
+    return client
 
 
-@dataclass
 class DynamoDbConnectionConfig(StoreConfig):
     region: str
     one_table_name: str
@@ -87,23 +203,31 @@ class DynamoDbConnection(StoreConnection[None, Boto3Session]):
     config: DynamoDbConnectionConfig
 
     def __init__(self, config: DynamoDbConnectionSettings, parent_logger: Logger):
-        self.config = DynamoDbConnectionConfig(**config)
+        self.config = DynamoDbConnectionConfig(**config.model_dump())
         self.opts = {
             "config": BOTO3_CONFIG,
             "region_name": self.config.region,
         }
         self.logger = parent_logger.child("dynamo")
+        self._local = threading.local()
 
     def connect(self) -> None:
         return None
 
     def is_connected(self, connection: None) -> bool:
-        # Resource are not thread safe, so in this way
-        # everytime the client requests a cursor, it creates a new one
+        # There is no connection to keep: sessions and resources are not thread safe,
+        # so they are cached per thread by create_session and create_cursor
         return False
 
-    def create_session(self, connection: None, autocommit: bool) -> Tuple[Boto3Session, None]:
-        return boto3.session.Session(region_name=self.opts["region_name"]), None
+    def create_session(
+        self, connection: None, autocommit: bool, **options
+    ) -> Tuple[Boto3Session, None]:
+        if (session := getattr(self._local, "session", None)) is None:
+            session = self._local.session = self._new_session()
+        return session, None
+
+    def _new_session(self) -> Boto3Session:
+        return boto3.session.Session(region_name=self.opts["region_name"])
 
     def rollback_session(self, session: Boto3Session):
         return
@@ -115,13 +239,197 @@ class DynamoDbConnection(StoreConnection[None, Boto3Session]):
         return
 
     def create_cursor(self, session: Boto3Session) -> DynamoDbCursor:
+        if (resource := getattr(self._local, "resource", None)) is None:
+            resource = self._local.resource = session.resource("dynamodb", **self.opts)
+            self._local.client = session.client("dynamodb", **self.opts)
         return DynamoDbCursor(
-            cursor=session.resource("dynamodb", **self.opts),
-            one_table_name=self.config.one_table_name,
+            cursor=resource, one_table_name=self.config.one_table_name, client=self._local.client
         )
 
 
+class CapacityRateLimiter:
+    """Paces the requests sharing it to consume on average at most `units_per_second`"""
+
+    def __init__(self, units_per_second: float):
+        self.units_per_second = units_per_second
+        self._available_at = timer.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, units: float):
+        with self._lock:
+            now = timer.monotonic()
+            start = max(now, self._available_at)
+            self._available_at = start + units / self.units_per_second
+        if (wait := start - now) > 0:
+            timer.sleep(wait)
+
+
+def approx_size(obj: Any) -> int:
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(approx_size(x) for x in obj)
+    return sys.getsizeof(obj)
+
+
+def condition_key(condition: Any) -> Hashable:
+    """Hashable representation of a boto3 condition, with its values"""
+    if isinstance(condition, DynamoConditionBase):
+        expression = condition.get_expression()
+        return (expression["operator"], tuple(condition_key(x) for x in expression["values"]))
+    if isinstance(condition, AttributeBase):
+        return ("attribute", condition.name)
+    if isinstance(condition, dict):
+        return ("map", tuple(sorted((k, condition_key(v)) for k, v in condition.items())))
+    if isinstance(condition, (set, frozenset)):
+        return frozenset(condition_key(x) for x in condition)
+    if isinstance(condition, (list, tuple)):
+        return tuple(condition_key(x) for x in condition)
+    return condition
+
+
+def item_key(item: dict, key_names: Iterable[str]) -> Tuple:
+    return tuple(sorted((k, item[k]) for k in key_names))
+
+
+def table_name(dynamo_table: Any) -> str:
+    # the batch writers do not expose the name of their table
+    return getattr(dynamo_table, "name", None) or getattr(dynamo_table, "_table_name", "")
+
+
+QUERIES_TAG = "queries"
+_item_cache_bypass_ctx_var: ContextVar[bool] = ContextVar("dynamo-item-cache-bypass", default=False)
+
+
+class ItemCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+    currbytes: int
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+
+class ItemCache:
+    """Thread safe cache of items with TTL and LRU eviction, bounded in number and memory.
+    Every entry has tags, used to invalidate it"""
+
+    def __init__(self, maxsize: int, max_bytes: int):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.currbytes = 0
+        # key: (expires at, size, tags, item)
+        self._entries: OrderedDict[Hashable, Tuple[float, int, Tuple, dict]] = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            if (entry := self._entries.get(key)) is not None and entry[0] > timer.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                item = entry[3]
+            else:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+        return copy.deepcopy(item)
+
+    def set(self, key: Hashable, item: dict, tags: Iterable[Hashable], ttl_seconds: float):
+        if (size := approx_size(item)) > self.max_bytes:
+            return
+        entry = (timer.monotonic() + ttl_seconds, size, tuple(tags), copy.deepcopy(item))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.currbytes += size
+            for tag in entry[2]:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize or self.currbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags: Iterable[Hashable]):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def _remove(self, key: Hashable):
+        _, size, tags, _ = self._entries.pop(key)
+        self.currbytes -= size
+        for tag in tags:
+            if keys := self._tags.get(tag):
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def info(self) -> ItemCacheInfo:
+        with self._lock:
+            return ItemCacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._entries), self.currbytes
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.hits = self.misses = self.currbytes = 0
+
+
 class DynamoDbRepo(Repository, abc.ABC):
+    # limits and retries of the batch operations
+    batch_get_max_keys: int = 100
+    batch_write_max_items: int = 25
+    transact_write_max_items: int = 100
+    batch_max_attempts: int = 8
+    batch_backoff_seconds: float = 0.05
+    batch_backoff_max_seconds: float = 5.0
+    # queries through the low level client, converting the items in a single pass
+    use_low_level_client: bool = False
+    # in-process cache of _find_one and _find_many, disabled when the ttl is None;
+    # repositories are created for each request, so the items are cached per repo class
+    item_cache_ttl_seconds: Optional[float] = None
+    item_cache_size: int = 1024
+    item_cache_max_bytes: int = 16 * 1024 * 1024
+    _item_cache: ItemCache = ItemCache(item_cache_size, item_cache_max_bytes)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._item_cache = ItemCache(cls.item_cache_size, cls.item_cache_max_bytes)
+
+    @classmethod
+    def item_cache_info(cls) -> ItemCacheInfo:
+        return cls._item_cache.info()
+
+    @staticmethod
+    @contextmanager
+    def item_cache_bypass():
+        """Reads skip the item cache inside the block, e.g. in a read-modify-write flow"""
+        token = _item_cache_bypass_ctx_var.set(True)
+        try:
+            yield
+        finally:
+            _item_cache_bypass_ctx_var.reset(token)
+
+    def _item_cache_enabled(self) -> bool:
+        return self.item_cache_ttl_seconds is not None and not _item_cache_bypass_ctx_var.get()
+
+    def _invalidate_items(self, dynamo_table: Any, keys: Iterable[dict], queries: bool = False):
+        """Drops the cached items with the written keys; an insert or an update can change
+        the result of any query, so they drop also the cached queries of the table"""
+        if self.item_cache_ttl_seconds is None:
+            return
+        table = table_name(dynamo_table)
+        tags = [(table, item_key(x, x)) for x in keys]
+        self._item_cache.invalidate([*tags, (table, QUERIES_TAG)] if queries else tags)
+
     def _create_id(self):
         return str(ulid.new())
 
@@ -182,8 +490,145 @@ class DynamoDbRepo(Repository, abc.ABC):
             if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
                 raise StoreErrors.DuplicateKey("element already exists: " + str(keys))
             raise StoreErrors.BaseError(str(e))
+        self._invalidate_items(dynamo_table, [keys], queries=True)
         return item
 
+    def _low_level_item(self, item: dict) -> dict:
+        return dynamo_fast_serializer(item)
+
+    def _from_low_level_item(self, item: dict) -> dict:
+        return dynamo_fast_deserializer(item)
+
+    def _low_level_args(self, dynamo_table: Any, args: dict) -> dict:
+        """Translates the arguments of a resource request to the ones of the low level client"""
+        builder = ConditionExpressionBuilder()
+        client_args = {**args, "TableName": dynamo_table.name}
+        names, values = {}, {}
+        for name in ("KeyConditionExpression", "FilterExpression", "ConditionExpression"):
+            if isinstance(condition := args.get(name), DynamoConditionBase):
+                built = builder.build_expression(
+                    condition, is_key_condition=name == "KeyConditionExpression"
+                )
+                client_args[name] = built.condition_expression
+                names.update(built.attribute_name_placeholders)
+                values.update(built.attribute_value_placeholders)
+        if names:
+            client_args["ExpressionAttributeNames"] = names
+        if values:
+            client_args["ExpressionAttributeValues"] = {
+                k: _to_attribute(v) for k, v in values.items()
+            }
+        if start_key := args.get("ExclusiveStartKey"):
+            client_args["ExclusiveStartKey"] = {k: _to_attribute(v) for k, v in start_key.items()}
+        return client_args
+
+    def _query_page(self, dynamo_table: Any, args: dict) -> Tuple[List[dict], Optional[dict]]:
+        """Runs a query returning the deserialized items and the LastEvaluatedKey"""
+        if not self.use_low_level_client:
+            res = dynamo_table.query(**args)
+            items = [dynamo_direct_deserializer(x) for x in res.get("Items", [])]
+            return items, res.get("LastEvaluatedKey")
+        res = low_level_client(dynamo_table).query(**self._low_level_args(dynamo_table, args))
+        items = [dynamo_fast_deserializer(x) for x in res.get("Items", [])]
+        last_key = res.get("LastEvaluatedKey")
+        return items, {k: _from_attribute(v) for k, v in last_key.items()} if last_key else None
+
+    def _prepare_insert(self, item: dict, now: datetime, with_dates: bool) -> dict:
+        keys = self._insert_primary_key(item)
+        if with_dates:
+            item["created_at"] = item["updated_at"] = now
+        return keys
+
+    def _batch_write_chunk(self, dynamo_table: Any, requests: List[dict]):
+        client = low_level_client(dynamo_table)
+        request = {dynamo_table.name: requests}
+        for attempt in range(self.batch_max_attempts):
+            try:
+                res = client.batch_write_item(RequestItems=request)
+            except ClientError as e:
+                raise StoreErrors.BaseError(str(e))
+            if not (request := res.get("UnprocessedItems")):
+                return
+            self._batch_backoff(attempt)
+        msg = f"items still unprocessed after {self.batch_max_attempts} attempts"
+        raise StoreErrors.BaseError(msg)
+
+    def _batch_write(self, dynamo_table: Any, requests: List[dict], workers: int):
+        chunks = [
+            requests[i : i + self.batch_write_max_items]
+            for i in range(0, len(requests), self.batch_write_max_items)
+        ]
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda x: self._batch_write_chunk(dynamo_table, x), chunks))
+        else:
+            for chunk in chunks:
+                self._batch_write_chunk(dynamo_table, chunk)
+
+    def _insert_many(
+        self,
+        dynamo_table: Any,
+        items: List[dict],
+        with_dates: bool = True,
+        workers: int = 1,
+    ) -> List[dict]:
+        """Writes the items with batch_write_item, `batch_write_max_items` per request,
+        on `workers` threads. Batch writes cannot be conditional, so existing items
+        are overwritten: use _transact_insert_many to fail on duplicate keys"""
+        now = self._utcnow()
+        keys = [self._prepare_insert(x, now, with_dates) for x in items]
+        requests = [{"PutRequest": {"Item": self._low_level_item(x)}} for x in items]
+        self._batch_write(dynamo_table, requests, workers)
+        self._invalidate_items(dynamo_table, keys, queries=True)
+        return items
+
+    def _delete_many(self, dynamo_table: Any, keys: List[dict], workers: int = 1):
+        requests = [{"DeleteRequest": {"Key": self._low_level_item(x)}} for x in keys]
+        self._batch_write(dynamo_table, requests, workers)
+        self._invalidate_items(dynamo_table, keys)
+
+    def _transact_insert_many(
+        self,
+        dynamo_table: Any,
+        items: List[dict],
+        with_dates: bool = True,
+    ) -> List[dict]:
+        """Inserts the items with transact_write_items, keeping the duplicate key condition of
+        _insert. Every `transact_write_max_items` items are inserted all together or none"""
+        client = low_level_client(dynamo_table)
+        builder = ConditionExpressionBuilder()
+        now = self._utcnow()
+        for i in range(0, len(items), self.transact_write_max_items):
+            chunk = items[i : i + self.transact_write_max_items]
+            keys, transaction = [], []
+            for item in chunk:
+                keys.append(self._prepare_insert(item, now, with_dates))
+                condition = builder.build_expression(
+                    self._transform_in_condition_expression(keys[-1])
+                )
+                put = {
+                    "TableName": dynamo_table.name,
+                    "Item": self._low_level_item(item),
+                    "ConditionExpression": condition.condition_expression,
+                    "ExpressionAttributeNames": condition.attribute_name_placeholders,
+                }
+                if condition.attribute_value_placeholders:
+                    put["ExpressionAttributeValues"] = self._low_level_item(
+                        condition.attribute_value_placeholders
+                    )
+                transaction.append({"Put": put})
+            try:
+                client.transact_write_items(TransactItems=transaction)
+            except ClientError as e:
+                reasons = e.response.get("CancellationReasons", [])
+                if duplicates := [
+                    k for k, r in zip(keys, reasons) if r.get("Code") == "ConditionalCheckFailed"
+                ]:
+                    raise StoreErrors.DuplicateKey("elements already exist: " + str(duplicates))
+                raise StoreErrors.BaseError(str(e))
+            self._invalidate_items(dynamo_table, keys, queries=True)
+        return items
+
     def _find_one(
         self,
         dynamo_table: Any,
@@ -194,7 +639,6 @@ class DynamoDbRepo(Repository, abc.ABC):
         ascending: bool = True,
     ) -> dict:
         items = []
-        res = None
         projection = self._projected_attributes(proj_class) if proj_class else self._get_key_names()
         args = {
             "ProjectionExpression": ",".join(projection),
@@ -205,16 +649,32 @@ class DynamoDbRepo(Repository, abc.ABC):
             args["IndexName"] = key_name
         if further_condition:
             args["FilterExpression"] = further_condition
-        while (res is None or "LastEvaluatedKey" in res) and len(items) == 0:
-            if res is not None and "LastEvaluatedKey" in res:
-                args["ExclusiveStartKey"] = res["LastEvaluatedKey"]
-            res = dynamo_table.query(**args)
-            items.extend(res.get("Items", []))
+        cache_key = None
+        if self._item_cache_enabled():
+            cache_key = (
+                table_name(dynamo_table),
+                key_name,
+                condition_key(key_condition),
+                condition_key(further_condition),
+                tuple(projection),
+                ascending,
+            )
+            if (item := self._item_cache.get(cache_key)) is not None:
+                return item
+        while True:
+            page, last_key = self._query_page(dynamo_table, args)
+            items.extend(page)
+            if items or last_key is None:
+                break
+            args["ExclusiveStartKey"] = last_key
         if len(items) != 1:
             msg = f"element not found for query={key_condition} {further_condition}"
             raise StoreErrors.NotFound(msg)
-        res_des = dynamo_direct_deserializer(items[0])
-        return res_des
+        if cache_key:
+            item_tag = item_key(items[0], self._get_key_names())
+            tags = [(cache_key[0], QUERIES_TAG), (cache_key[0], item_tag)]
+            self._item_cache.set(cache_key, items[0], tags, self.item_cache_ttl_seconds)
+        return items[0]
 
     def _find_all(
         self,
@@ -226,28 +686,211 @@ class DynamoDbRepo(Repository, abc.ABC):
         project_attributes: Optional[List[str]] = None,
         ascending: bool = True,
     ) -> List[dict]:
-        items = []
-        res = None
+        return list(
+            self._iter_all(
+                dynamo_table,
+                key_condition,
+                key_name=key_name,
+                further_condition=further_condition,
+                limit=limit,
+                project_attributes=project_attributes,
+                ascending=ascending,
+            )
+        )
+
+    def _iter_all(
+        self,
+        dynamo_table: Any,
+        key_condition: DynamoConditionBase,
+        key_name: Optional[str] = None,
+        further_condition: Optional[DynamoConditionBase] = None,
+        limit: Optional[int] = 0,
+        project_attributes: Optional[List[str]] = None,
+        ascending: bool = True,
+        exclusive_start_key: Optional[dict] = None,
+        page_size: Optional[int] = None,
+    ) -> Generator[dict, None, Optional[dict]]:
+        """Lazily yields the items of the query page by page, up to `limit` items (0 for all).
+        Returns the LastEvaluatedKey to resume from, None when there are no more items:
+        `last_key = yield from self._iter_all(...)`, see encode_start_key for the cursors"""
         args = {
             "KeyConditionExpression": key_condition,
             "ScanIndexForward": ascending,
         }
-        if limit != 0:
-            args["Limit"] = limit
         if key_name:
             args["IndexName"] = key_name
         if project_attributes:
             args["ProjectionExpression"] = ",".join(project_attributes)
         if further_condition:
             args["FilterExpression"] = further_condition
-        while (res is None or "LastEvaluatedKey" in res) and (
-            (limit != 0 and len(items) <= limit) or (limit == 0)
-        ):
-            if res is not None and "LastEvaluatedKey" in res:
+        if exclusive_start_key:
+            args["ExclusiveStartKey"] = exclusive_start_key
+        remaining = limit or None
+        while True:
+            # the limit is applied before the filter, so more pages can be needed
+            if limits := [x for x in (remaining, page_size) if x]:
+                args["Limit"] = min(limits)
+            items, last_key = self._query_page(dynamo_table, args)
+            yield from items
+            if remaining is not None and (remaining := remaining - len(items)) <= 0:
+                return last_key
+            if last_key is None:
+                return None
+            args["ExclusiveStartKey"] = last_key
+
+    def _batch_backoff(self, attempt: int):
+        delay = min(self.batch_backoff_max_seconds, self.batch_backoff_seconds * 2**attempt)
+        timer.sleep(random.uniform(0, delay))
+
+    def _batch_get_chunk(
+        self,
+        dynamo_table: Any,
+        keys: List[dict],
+        projection: List[str],
+        consistent_read: bool,
+    ) -> List[dict]:
+        # the low level client is thread safe, unlike the resources
+        client = low_level_client(dynamo_table)
+        request = {
+            dynamo_table.name: {
+                "Keys": [
+                    {k: botodynamoser(v) for k, v in dynamo_direct_serializer(x).items()}
+                    for x in keys
+                ],
+                "ProjectionExpression": ",".join(projection),
+                "ConsistentRead": consistent_read,
+            }
+        }
+        items = []
+        for attempt in range(self.batch_max_attempts):
+            try:
+                res = client.batch_get_item(RequestItems=request)
+            except ClientError as e:
+                raise StoreErrors.BaseError(str(e))
+            items.extend(res.get("Responses", {}).get(dynamo_table.name, []))
+            if not (request := res.get("UnprocessedKeys")):
+                return [self._from_low_level_item(x) for x in items]
+            self._batch_backoff(attempt)
+        msg = f"keys still unprocessed after {self.batch_max_attempts} attempts"
+        raise StoreErrors.BaseError(msg)
+
+    def _find_many(
+        self,
+        dynamo_table: Any,
+        keys: List[dict],
+        proj_class: Optional[Type[BaseEntity]] = None,
+        workers: int = 1,
+        consistent_read: bool = False,
+    ) -> List[dict]:
+        """Fetches the items of the keys with batch_get_item, `batch_get_max_keys` keys
+        per request, on `workers` threads. The items are returned in the order of the keys,
+        skipping the ones not found."""
+        if not keys:
+            return []
+        key_names = tuple(keys[0])
+        unique_keys = list({tuple(x[k] for k in key_names): x for x in keys}.values())
+        projection = self._projected_attributes(proj_class) if proj_class else self._get_key_names()
+        projection = list(dict.fromkeys([*projection, *key_names]))
+        table, cached = table_name(dynamo_table), {}
+        use_cache = self._item_cache_enabled() and not consistent_read
+        if use_cache:
+            for key in unique_keys:
+                cache_key = (table, item_key(key, key_names), tuple(projection))
+                if (item := self._item_cache.get(cache_key)) is not None:
+                    cached[tuple(key[k] for k in key_names)] = item
+            unique_keys = [x for x in unique_keys if tuple(x[k] for k in key_names) not in cached]
+        chunks = [
+            unique_keys[i : i + self.batch_get_max_keys]
+            for i in range(0, len(unique_keys), self.batch_get_max_keys)
+        ]
+
+        def fetch(chunk: List[dict]) -> List[dict]:
+            return self._batch_get_chunk(dynamo_table, chunk, projection, consistent_read)
+
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(fetch, chunks))
+        else:
+            results = [fetch(x) for x in chunks]
+        found = {tuple(x[k] for k in key_names): x for items in results for x in items}
+        if use_cache:
+            for item in found.values():
+                tag = (table, item_key(item, key_names))
+                cache_key = (table, tag[1], tuple(projection))
+                self._item_cache.set(cache_key, item, [tag], self.item_cache_ttl_seconds)
+        found.update(cached)
+        return [found[k] for k in (tuple(x[k] for k in key_names) for x in keys) if k in found]
+
+    def _scan_segment(
+        self,
+        dynamo_table: Any,
+        args: dict,
+        pages: queue.Queue,
+        stop: threading.Event,
+        limiter: Optional[CapacityRateLimiter],
+    ):
+        client = low_level_client(dynamo_table)
+        res = None
+        while not stop.is_set() and (res is None or "LastEvaluatedKey" in res):
+            if res is not None:
                 args["ExclusiveStartKey"] = res["LastEvaluatedKey"]
-            res = dynamo_table.query(**args)
-            items.extend(res.get("Items", []))
-        return [dynamo_direct_deserializer(x) for x in items[: limit or None]]
+            res = client.scan(**args)
+            if limiter:
+                limiter.consume(res.get("ConsumedCapacity", {}).get("CapacityUnits", 0))
+            items = [self._from_low_level_item(x) for x in res.get("Items", [])]
+            while not stop.is_set():
+                try:
+                    pages.put(items, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def _scan_parallel(
+        self,
+        dynamo_table: Any,
+        total_segments: int = 4,
+        workers: Optional[int] = None,
+        further_condition: Optional[DynamoConditionBase] = None,
+        project_attributes: Optional[List[str]] = None,
+        max_capacity_per_second: Optional[float] = None,
+    ) -> Iterator[dict]:
+        """Lazily yields the items of the table, scanning its `total_segments` segments on
+        `workers` threads. At most `max_capacity_per_second` read capacity units are
+        consumed on average; the scan stops when the iterator is closed"""
+        args = {"TotalSegments": total_segments}
+        if max_capacity_per_second:
+            args["ReturnConsumedCapacity"] = "TOTAL"
+        if project_attributes:
+            args["ProjectionExpression"] = ",".join(project_attributes)
+        if further_condition:
+            args["FilterExpression"] = further_condition
+        args = self._low_level_args(dynamo_table, args)
+        workers = workers or total_segments
+        limiter = CapacityRateLimiter(max_capacity_per_second) if max_capacity_per_second else None
+        pages: queue.Queue = queue.Queue(maxsize=2 * workers)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [
+            executor.submit(
+                self._scan_segment, dynamo_table, {**args, "Segment": x}, pages, stop, limiter
+            )
+            for x in range(total_segments)
+        ]
+        try:
+            while True:
+                try:
+                    yield from pages.get(timeout=0.1)
+                    continue
+                except queue.Empty:
+                    pass
+                # raises the errors of the segments as soon as they fail
+                for future in (x for x in futures if x.done()):
+                    future.result()
+                if all(x.done() for x in futures) and pages.empty():
+                    break
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
 
     def _update_one(
         self,
@@ -274,6 +917,7 @@ class DynamoDbRepo(Repository, abc.ABC):
         if further_condition:
             args["ConditionExpression"] = further_condition
         dynamo_table.update_item(**args)
+        self._invalidate_items(dynamo_table, [key_condition], queries=True)
 
         return updates
 
@@ -287,3 +931,4 @@ class DynamoDbRepo(Repository, abc.ABC):
             "ReturnValues": "NONE",
         }
         dynamo_table.delete_item(**args)
+        self._invalidate_items(dynamo_table, [key_condition])
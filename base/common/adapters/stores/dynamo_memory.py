@@ -0,0 +1,854 @@
+import base64
+import json
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from botocore.awsrequest import AWSResponse
+
+from base.common.adapters.stores.dynamo import (
+    Boto3Session,
+    DynamoDbConnection,
+    DynamoDbConnectionConfig,
+)
+from base.common.settings import InMemoryDynamoDbConnectionSettings
+from base.common.utils.logger import Logger
+
+# low level attribute values and items, e.g. {"pk": {"S": "x"}, "n": {"N": "1"}}
+Attribute = Dict[str, Any]
+Item = Dict[str, Attribute]
+KeySchema = Tuple[str, Optional[str]]
+
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+TRANSACT_WRITE_MAX_ITEMS = 100
+
+
+class InMemoryDynamoDbError(Exception):
+    def __init__(self, code: str, message: str, **response):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.response = response
+
+
+def validation_error(message: str) -> InMemoryDynamoDbError:
+    return InMemoryDynamoDbError("ValidationException", message)
+
+
+###
+# attribute values
+###
+def _typed(attribute: Attribute) -> Tuple[str, Any]:
+    """Comparable representation of an attribute value, with its type"""
+    ((kind, value),) = attribute.items()
+    if kind == "N":
+        return kind, Decimal(value)
+    if kind == "NS":
+        return kind, frozenset(Decimal(x) for x in value)
+    if kind in ("SS", "BS"):
+        return kind, frozenset(value)
+    if kind == "L":
+        return kind, tuple(_typed(x) for x in value)
+    if kind == "M":
+        return kind, tuple(sorted((k, _typed(v)) for k, v in value.items()))
+    return kind, value
+
+
+def _copy(attribute: Attribute) -> Attribute:
+    ((kind, value),) = attribute.items()
+    if kind == "M":
+        return {"M": {k: _copy(v) for k, v in value.items()}}
+    if kind == "L":
+        return {"L": [_copy(x) for x in value]}
+    if kind in ("SS", "NS", "BS"):
+        return {kind: list(value)}
+    return {kind: value}
+
+
+def _copy_item(item: Item) -> Item:
+    return {k: _copy(v) for k, v in item.items()}
+
+
+_BINARY = re.compile(rb'"BS?"\s*:')
+
+
+def _decode_binary(value: dict) -> dict:
+    """The binary values are base64 encoded in the requests, and decoded in the responses"""
+    if len(value) == 1:
+        if isinstance(binary := value.get("B"), str):
+            return {"B": base64.b64decode(binary)}
+        if isinstance(binaries := value.get("BS"), list):
+            return {"BS": [base64.b64decode(x) for x in binaries]}
+    return value
+
+
+###
+# expressions, parsed once in a tree of tuples and interpreted for each item
+###
+_TOKEN = re.compile(
+    r"\s*(?:(?P<op><>|<=|>=|=|<|>|\(|\)|,|\+|-)|(?P<value>:[A-Za-z0-9_]+)"
+    r"|(?P<word>[#A-Za-z_][#A-Za-z0-9_\-\.\[\]]*))"
+)
+_KEYWORDS = {"AND", "OR", "NOT", "BETWEEN", "IN", "SET", "REMOVE", "ADD", "DELETE"}
+_COMPARATORS = {"=", "<>", "<", "<=", ">", ">="}
+_PATH_ELEMENT = re.compile(r"([^\.\[\]]+)|\[(\d+)\]")
+
+
+def _tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens, pos, expression = [], 0, expression.strip()
+    while pos < len(expression):
+        if not (match := _TOKEN.match(expression, pos)) or match.end() == pos:
+            raise validation_error(f"invalid expression: {expression}")
+        kind = match.lastgroup
+        token = match.group(kind)
+        if kind == "word" and token.upper() in _KEYWORDS:
+            kind, token = "keyword", token.upper()
+        tokens.append((kind, token))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset]
+        return None, None
+
+    def take(self, token: Optional[str] = None) -> str:
+        kind, value = self.peek()
+        if kind is None or (token is not None and value != token):
+            raise validation_error(f"invalid expression: {self.expression}")
+        self.pos += 1
+        return value
+
+    def done(self):
+        if self.pos != len(self.tokens):
+            raise validation_error(f"invalid expression: {self.expression}")
+
+    def condition(self) -> tuple:
+        node = self.conjunction()
+        while self.peek() == ("keyword", "OR"):
+            self.take()
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self) -> tuple:
+        node = self.negation()
+        while self.peek() == ("keyword", "AND"):
+            self.take()
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self) -> tuple:
+        if self.peek() == ("keyword", "NOT"):
+            self.take()
+            return ("not", self.negation())
+        return self.predicate()
+
+    def predicate(self) -> tuple:
+        kind, value = self.peek()
+        if value == "(":
+            self.take()
+            node = self.condition()
+            self.take(")")
+            return node
+        if kind == "word" and value != "size" and self.peek(1)[1] == "(":
+            self.take()
+            return ("function", value, self.arguments())
+        operand = self.operand()
+        kind, value = self.peek()
+        if value in _COMPARATORS:
+            self.take()
+            return ("compare", value, operand, self.operand())
+        if value == "BETWEEN":
+            self.take()
+            low = self.operand()
+            self.take("AND")
+            return ("between", operand, low, self.operand())
+        if value == "IN":
+            self.take()
+            return ("in", operand, self.arguments())
+        raise validation_error(f"invalid expression: {self.expression}")
+
+    def arguments(self) -> Tuple[tuple, ...]:
+        self.take("(")
+        arguments = [self.operand()]
+        while self.peek()[1] == ",":
+            self.take()
+            arguments.append(self.operand())
+        self.take(")")
+        return tuple(arguments)
+
+    def operand(self) -> tuple:
+        kind, value = self.peek()
+        if kind == "value":
+            self.take()
+            return ("value", value)
+        if kind == "word" and self.peek(1)[1] == "(":
+            self.take()
+            return ("function", value, self.arguments())
+        if kind == "word":
+            self.take()
+            return ("path", value)
+        raise validation_error(f"invalid expression: {self.expression}")
+
+    def update(self) -> Tuple[tuple, ...]:
+        actions = []
+        while self.peek()[0] is not None:
+            clause = self.take()
+            if clause not in ("SET", "REMOVE", "ADD", "DELETE"):
+                raise validation_error(f"invalid update expression: {self.expression}")
+            while True:
+                path = self.operand()
+                if clause == "SET":
+                    self.take("=")
+                    operand = self.operand()
+                    if (operator := self.peek()[1]) in ("+", "-"):
+                        self.take()
+                        operand = ("arithmetic", operator, operand, self.operand())
+                    actions.append((clause, path, operand))
+                elif clause == "REMOVE":
+                    actions.append((clause, path, None))
+                else:
+                    actions.append((clause, path, self.operand()))
+                if self.peek()[1] != ",":
+                    break
+                self.take()
+        return tuple(actions)
+
+
+@lru_cache(maxsize=4096)
+def parse_condition(expression: str) -> tuple:
+    parser = _Parser(expression)
+    node = parser.condition()
+    parser.done()
+    return node
+
+
+@lru_cache(maxsize=4096)
+def parse_update(expression: str) -> Tuple[tuple, ...]:
+    return _Parser(expression).update()
+
+
+@lru_cache(maxsize=4096)
+def parse_projection(expression: str) -> Tuple[str, ...]:
+    return tuple(x.strip() for x in expression.split(","))
+
+
+class _Request:
+    """Names and values of the expressions of a request"""
+
+    def __init__(self, names: Optional[dict], values: Optional[dict]):
+        self.names = names or {}
+        self.values = values or {}
+
+    @classmethod
+    def of(cls, args: dict) -> "_Request":
+        return cls(args.get("ExpressionAttributeNames"), args.get("ExpressionAttributeValues"))
+
+    def path(self, raw: str) -> Tuple:
+        path = []
+        for name, index in _PATH_ELEMENT.findall(raw):
+            if index:
+                path.append(int(index))
+            elif name.startswith("#"):
+                if name not in self.names:
+                    raise validation_error(f"missing attribute name {name}")
+                path.append(self.names[name])
+            else:
+                path.append(name)
+        return tuple(path)
+
+    def value(self, placeholder: str) -> Attribute:
+        if placeholder not in self.values:
+            raise validation_error(f"missing attribute value {placeholder}")
+        return self.values[placeholder]
+
+
+def _get_path(item: Item, path: Tuple) -> Optional[Attribute]:
+    value = {"M": item}
+    for element in path:
+        if isinstance(element, int):
+            if "L" not in value or element >= len(value["L"]):
+                return None
+            value = value["L"][element]
+        else:
+            if "M" not in value or element not in value["M"]:
+                return None
+            value = value["M"][element]
+    return value
+
+
+def _parent(item: Item, path: Tuple) -> Attribute:
+    parent = _get_path(item, path[:-1])
+    kind = "L" if isinstance(path[-1], int) else "M"
+    if parent is None or kind not in parent:
+        raise validation_error("the document path provided in the update expression is invalid")
+    return parent
+
+
+def _set_path(item: Item, path: Tuple, value: Attribute):
+    parent = _parent(item, path)
+    if isinstance(path[-1], int):
+        if path[-1] >= len(parent["L"]):
+            parent["L"].append(value)
+        else:
+            parent["L"][path[-1]] = value
+    else:
+        parent["M"][path[-1]] = value
+
+
+def _remove_path(item: Item, path: Tuple):
+    parent = _parent(item, path)
+    if isinstance(path[-1], int):
+        if path[-1] < len(parent["L"]):
+            del parent["L"][path[-1]]
+    else:
+        parent["M"].pop(path[-1], None)
+
+
+def _operand(node: tuple, item: Item, request: _Request) -> Optional[Attribute]:
+    kind = node[0]
+    if kind == "value":
+        return request.value(node[1])
+    if kind == "path":
+        return _get_path(item, request.path(node[1]))
+    if kind == "function" and node[1] == "size":
+        if (value := _operand(node[2][0], item, request)) is None:
+            return None
+        ((attribute_kind, attribute),) = value.items()
+        size = len(attribute.encode() if attribute_kind == "S" else attribute)
+        return {"N": str(size)}
+    if kind == "function" and node[1] == "if_not_exists":
+        value = _operand(node[2][0], item, request)
+        return value if value is not None else _operand(node[2][1], item, request)
+    if kind == "function" and node[1] == "list_append":
+        first, second = (_operand(x, item, request) for x in node[2])
+        return {"L": [*(first or {}).get("L", []), *(second or {}).get("L", [])]}
+    if kind == "arithmetic":
+        left, right = _operand(node[2], item, request), _operand(node[3], item, request)
+        if left is None or right is None or "N" not in left or "N" not in right:
+            raise validation_error("an operand in the update expression has an incorrect type")
+        result = Decimal(left["N"]) + (1 if node[1] == "+" else -1) * Decimal(right["N"])
+        return {"N": str(result)}
+    raise validation_error(f"invalid operand {node}")
+
+
+def _compare(operator: str, left: Optional[Attribute], right: Optional[Attribute]) -> bool:
+    if left is None or right is None:
+        return operator == "<>" and (left is None) != (right is None)
+    (left_kind, left_value), (right_kind, right_value) = _typed(left), _typed(right)
+    if operator == "=":
+        return left_kind == right_kind and left_value == right_value
+    if operator == "<>":
+        return left_kind != right_kind or left_value != right_value
+    if left_kind != right_kind or left_kind not in ("S", "N", "B"):
+        return False
+    if operator == "<":
+        return left_value < right_value
+    if operator == "<=":
+        return left_value <= right_value
+    if operator == ">":
+        return left_value > right_value
+    return left_value >= right_value
+
+
+def _function(name: str, arguments: tuple, item: Item, request: _Request) -> bool:
+    if name == "attribute_exists":
+        return _operand(arguments[0], item, request) is not None
+    if name == "attribute_not_exists":
+        return _operand(arguments[0], item, request) is None
+    value, operand = (_operand(x, item, request) for x in arguments)
+    if value is None or operand is None:
+        return False
+    if name == "attribute_type":
+        return next(iter(value)) == operand["S"]
+    if name == "begins_with":
+        ((kind, attribute),) = value.items()
+        return kind in ("S", "B") and kind in operand and attribute.startswith(operand[kind])
+    if name == "contains":
+        ((kind, attribute),) = value.items()
+        if kind == "S":
+            return "S" in operand and operand["S"] in attribute
+        if kind in ("SS", "NS", "BS"):
+            return _typed(operand)[1] in {_typed({kind[0]: x})[1] for x in attribute}
+        if kind == "L":
+            return _typed(operand) in {_typed(x) for x in attribute}
+        return False
+    raise validation_error(f"invalid function: {name}")
+
+
+def evaluate(node: tuple, item: Item, request: _Request) -> bool:
+    kind = node[0]
+    if kind == "and":
+        return evaluate(node[1], item, request) and evaluate(node[2], item, request)
+    if kind == "or":
+        return evaluate(node[1], item, request) or evaluate(node[2], item, request)
+    if kind == "not":
+        return not evaluate(node[1], item, request)
+    if kind == "compare":
+        left, right = _operand(node[2], item, request), _operand(node[3], item, request)
+        return _compare(node[1], left, right)
+    if kind == "between":
+        value = _operand(node[1], item, request)
+        low, high = _operand(node[2], item, request), _operand(node[3], item, request)
+        return _compare(">=", value, low) and _compare("<=", value, high)
+    if kind == "in":
+        value = _operand(node[1], item, request)
+        return any(_compare("=", value, _operand(x, item, request)) for x in node[2])
+    return _function(node[1], node[2], item, request)
+
+
+def _key_conditions(node: tuple, request: _Request) -> Dict[str, tuple]:
+    """Conditions of a KeyConditionExpression, by attribute name"""
+    if node[0] == "and":
+        return {**_key_conditions(node[1], request), **_key_conditions(node[2], request)}
+    path_node = node[2][0] if node[0] == "function" else node[1 if node[0] == "between" else 2]
+    if path_node[0] != "path" or len(path := request.path(path_node[1])) != 1:
+        raise validation_error("invalid key condition expression")
+    return {path[0]: node}
+
+
+def _project(item: Item, expression: Optional[str], request: _Request) -> Item:
+    if not expression:
+        return _copy_item(item)
+    projected = {}
+    for path in (request.path(x) for x in parse_projection(expression)):
+        if (value := _get_path(item, path)) is None:
+            continue
+        # the nested paths are projected with their top level attribute
+        projected[path[0]] = _copy(item[path[0]]) if len(path) > 1 else _copy(value)
+    return projected
+
+
+###
+# tables
+###
+class _Partition:
+    """Items sharing the hash key of a table or index, sorted by range key and primary key"""
+
+    def __init__(self):
+        self.keys: List[Tuple] = []
+        self.items: List[Item] = []
+
+    def put(self, sort_key: Tuple, item: Item):
+        i = bisect_left(self.keys, sort_key)
+        if i < len(self.keys) and self.keys[i] == sort_key:
+            self.items[i] = item
+        else:
+            self.keys.insert(i, sort_key)
+            self.items.insert(i, item)
+
+    def remove(self, sort_key: Tuple):
+        i = bisect_left(self.keys, sort_key)
+        if i < len(self.keys) and self.keys[i] == sort_key:
+            del self.keys[i]
+            del self.items[i]
+
+    def bounds(self, condition: Optional[tuple], request: "_Request") -> Tuple[int, int]:
+        """Positions of the items matching the condition on the range key"""
+        low, high = 0, len(self.keys)
+        if condition is None:
+            return low, high
+
+        def left(node: tuple) -> int:
+            return bisect_left(self.keys, _typed(_operand(node, {}, request)), key=_range_value)
+
+        def right(node: tuple) -> int:
+            return bisect_right(self.keys, _typed(_operand(node, {}, request)), key=_range_value)
+
+        if condition[0] == "between":
+            return left(condition[2]), right(condition[3])
+        if condition[0] == "function":
+            # the items beginning with the prefix follow it, one after the other
+            low = high = left(condition[2][1])
+            while high < len(self.items) and evaluate(condition, self.items[high], request):
+                high += 1
+            return low, high
+        operator, value = condition[1], condition[3]
+        if operator == "=":
+            return left(value), right(value)
+        if operator in ("<", "<="):
+            return low, left(value) if operator == "<" else right(value)
+        return right(value) if operator == ">" else left(value), high
+
+
+def _range_value(sort_key: Tuple) -> Tuple[str, Any]:
+    return sort_key[0]
+
+
+class InMemoryDynamoDbTable:
+    def __init__(self, name: str, key_schema: KeySchema, indexes: Dict[str, KeySchema]):
+        self.name = name
+        self.key_schema = key_schema
+        self.key_names = [x for x in key_schema if x]
+        self.indexes = indexes
+        self.items: Dict[Tuple, Item] = {}
+        # the primary keys sorted, the order of the scans
+        self.keys: List[Tuple] = []
+        self.partitions: Dict[Optional[str], Dict[Any, _Partition]] = {
+            x: {} for x in [None, *indexes]
+        }
+
+    def schema(self, index: Optional[str]) -> KeySchema:
+        if index is None:
+            return self.key_schema
+        if index not in self.indexes:
+            raise validation_error(f"the table does not have the specified index: {index}")
+        return self.indexes[index]
+
+    def primary_key(self, key: Item) -> Tuple:
+        try:
+            return tuple(_typed(key[x]) for x in self.key_names)
+        except KeyError:
+            raise validation_error("the provided key element does not match the schema")
+
+    def key_of(self, item: Item, index: Optional[str] = None) -> Item:
+        names = {*self.key_schema, *self.schema(index)} - {None}
+        return {x: _copy(item[x]) for x in names if x in item}
+
+    def get(self, key: Item) -> Optional[Item]:
+        return self.items.get(self.primary_key(key))
+
+    def put(self, item: Item):
+        primary_key = self.primary_key(item)
+        if self._remove(primary_key, keep_position=True) is None:
+            insort(self.keys, primary_key)
+        self.items[primary_key] = item
+        for index, partitions in self.partitions.items():
+            if self.indexed(item, index):
+                hash_value = _typed(item[self.schema(index)[0]])
+                partitions.setdefault(hash_value, _Partition()).put(
+                    self.sort_key(item, index, primary_key), item
+                )
+
+    def delete(self, key: Item) -> Optional[Item]:
+        return self._remove(self.primary_key(key))
+
+    def _remove(self, primary_key: Tuple, keep_position: bool = False) -> Optional[Item]:
+        if (item := self.items.pop(primary_key, None)) is None:
+            return None
+        if not keep_position:
+            del self.keys[bisect_left(self.keys, primary_key)]
+        for index, partitions in self.partitions.items():
+            if self.indexed(item, index):
+                partition = partitions[_typed(item[self.schema(index)[0]])]
+                partition.remove(self.sort_key(item, index, primary_key))
+        return item
+
+    def indexed(self, item: Item, index: Optional[str]) -> bool:
+        return all(x in item for x in self.schema(index) if x)
+
+    def sort_key(
+        self, item: Item, index: Optional[str], primary_key: Optional[Tuple] = None
+    ) -> Tuple:
+        range_key = self.schema(index)[1]
+        primary_key = primary_key or self.primary_key(item)
+        return ((_typed(item[range_key]),) if range_key else ()) + primary_key
+
+
+class InMemoryDynamoDb:
+    """Emulates the DynamoDB API used by the repositories: item reads and writes with
+    condition and update expressions, queries and scans with filters and pagination, batch
+    and transactional operations. It answers the requests of the boto3 clients through their
+    `before-call` event, after boto3 built them as for the real service. Every table has the
+    same key schema; the pages are bounded only by Limit, not by their size"""
+
+    def __init__(self, key_schema: KeySchema, indexes: Optional[Dict[str, KeySchema]] = None):
+        self.key_schema = key_schema
+        self.indexes = indexes or {}
+        self.tables: Dict[str, InMemoryDynamoDbTable] = {}
+        self._lock = threading.RLock()
+
+    def table(self, name: str) -> InMemoryDynamoDbTable:
+        if (table := self.tables.get(name)) is None:
+            table = self.tables.setdefault(
+                name, InMemoryDynamoDbTable(name, self.key_schema, self.indexes)
+            )
+        return table
+
+    def handle(self, model: Any, params: dict, **kwargs) -> Tuple[AWSResponse, dict]:
+        """Handler of the `before-call.dynamodb` event, answering instead of the service"""
+        body = params["body"] or b"{}"
+        if _BINARY.search(body):
+            request = json.loads(body, object_hook=_decode_binary)
+        else:
+            request = json.loads(body)
+        if (operation := getattr(self, _snake_case(model.name), None)) is None:
+            error = {"Code": "UnknownOperationException", "Message": model.name}
+            return AWSResponse("", 400, {}, None), {"Error": error}
+        try:
+            with self._lock:
+                response = operation(request)
+        except InMemoryDynamoDbError as e:
+            return AWSResponse("", 400, {}, None), {
+                "Error": {"Code": e.code, "Message": e.message},
+                "ResponseMetadata": {"HTTPStatusCode": 400},
+                **e.response,
+            }
+        return AWSResponse("", 200, {}, None), {
+            **response,
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        }
+
+    def _check(self, item: Item, expression: Optional[str], request: _Request):
+        if expression and not evaluate(parse_condition(expression), item, request):
+            raise InMemoryDynamoDbError(
+                "ConditionalCheckFailedException", "The conditional request failed"
+            )
+
+    def _put(self, table: InMemoryDynamoDbTable, args: dict, request: _Request) -> Optional[Item]:
+        item = args["Item"]
+        old = table.get(item)
+        self._check(old or {}, args.get("ConditionExpression"), request)
+        table.put(item)
+        return old
+
+    def _update(
+        self, table: InMemoryDynamoDbTable, args: dict, request: _Request
+    ) -> Tuple[Optional[Item], Item]:
+        key = args["Key"]
+        old = table.get(key)
+        self._check(old or {}, args.get("ConditionExpression"), request)
+        # every clause reads the item as it was before the update
+        before = old or key
+        item = _copy_item(before)
+        paths = []
+        for action, path_node, operand in parse_update(args.get("UpdateExpression", "")):
+            path = request.path(path_node[1])
+            if path[0] in table.key_schema:
+                raise validation_error(f"cannot update attribute {path[0]}, part of the key")
+            if any(x[: len(path)] == path[: len(x)] for x in paths):
+                raise validation_error("two document paths overlap with each other")
+            paths.append(path)
+            if action == "SET":
+                _set_path(item, path, _operand(operand, before, request))
+            elif action == "REMOVE":
+                _remove_path(item, path)
+            else:
+                current = _get_path(before, path)
+                _add_or_delete(item, path, action, current, _operand(operand, before, request))
+        table.put(item)
+        return old, item
+
+    def _delete(self, table: InMemoryDynamoDbTable, args: dict, request: _Request):
+        key = args["Key"]
+        old = table.get(key)
+        self._check(old or {}, args.get("ConditionExpression"), request)
+        return table.delete(key)
+
+    def get_item(self, args: dict) -> dict:
+        request = _Request(args.get("ExpressionAttributeNames"), None)
+        table = self.table(args["TableName"])
+        if (item := table.get(args["Key"])) is None:
+            return {}
+        return {"Item": _project(item, args.get("ProjectionExpression"), request)}
+
+    def put_item(self, args: dict) -> dict:
+        request = _Request.of(args)
+        old = self._put(self.table(args["TableName"]), args, request)
+        return {"Attributes": _copy_item(old)} if old and args.get("ReturnValues") else {}
+
+    def update_item(self, args: dict) -> dict:
+        request = _Request.of(args)
+        old, item = self._update(self.table(args["TableName"]), args, request)
+        if (returned := args.get("ReturnValues", "NONE")) == "NONE":
+            return {}
+        attributes = old if returned in ("ALL_OLD", "UPDATED_OLD") else item
+        return {"Attributes": _copy_item(attributes or {})}
+
+    def delete_item(self, args: dict) -> dict:
+        request = _Request.of(args)
+        old = self._delete(self.table(args["TableName"]), args, request)
+        return {"Attributes": _copy_item(old)} if old and args.get("ReturnValues") else {}
+
+    def query(self, args: dict) -> dict:
+        request = _Request.of(args)
+        table, index = self.table(args["TableName"]), args.get("IndexName")
+        hash_key, range_key = table.schema(index)
+        conditions = _key_conditions(parse_condition(args["KeyConditionExpression"]), request)
+        hash_condition = conditions.pop(hash_key, None)
+        if (
+            not hash_condition
+            or hash_condition[:2] != ("compare", "=")
+            or set(conditions) - {range_key}
+        ):
+            raise validation_error("query condition missed key schema element")
+        hash_value = _operand(hash_condition[3], {}, request)
+        partition = table.partitions[index].get(_typed(hash_value)) or _Partition()
+        start, end = partition.bounds(conditions.get(range_key), request)
+        forward = args.get("ScanIndexForward", True)
+        if start_key := args.get("ExclusiveStartKey"):
+            sort_key = table.sort_key(start_key, index)
+            if forward:
+                start = max(start, bisect_right(partition.keys, sort_key))
+            else:
+                end = min(end, bisect_left(partition.keys, sort_key))
+        positions = range(start, end) if forward else range(end - 1, start - 1, -1)
+        return self._page(table, index, (partition.items[i] for i in positions), args, request)
+
+    def scan(self, args: dict) -> dict:
+        request = _Request.of(args)
+        table, index = self.table(args["TableName"]), args.get("IndexName")
+        hash_key = table.schema(index)[0]
+        start = 0
+        if start_key := args.get("ExclusiveStartKey"):
+            # the start item may have been deleted in the meantime
+            start = bisect_right(table.keys, table.primary_key(start_key))
+        items = (table.items[table.keys[i]] for i in range(start, len(table.keys)))
+        if index:
+            items = (x for x in items if table.indexed(x, index))
+        if segments := args.get("TotalSegments"):
+            segment = args.get("Segment", 0)
+            items = (x for x in items if hash(_typed(x[hash_key])) % segments == segment)
+        return self._page(table, index, items, args, request)
+
+    def _page(self, table, index, items, args: dict, request: _Request) -> dict:
+        """Reads up to Limit items, then applies the filter and the projection"""
+        limit, found, evaluated, last = args.get("Limit"), [], 0, None
+        further_condition = parse_condition(x) if (x := args.get("FilterExpression")) else None
+        capacity = args.get("ReturnConsumedCapacity", "NONE") != "NONE"
+        read_bytes = 0
+        for item in items:
+            evaluated += 1
+            if capacity:
+                read_bytes += len(json.dumps(item, default=str))
+            if not further_condition or evaluate(further_condition, item, request):
+                found.append(_project(item, args.get("ProjectionExpression"), request))
+            if limit and evaluated == limit:
+                last = item
+                break
+        response = {"Count": len(found), "ScannedCount": evaluated}
+        if args.get("Select") != "COUNT":
+            response["Items"] = found
+        if last is not None:
+            response["LastEvaluatedKey"] = table.key_of(last, index)
+        if capacity:
+            # a read unit is 4KB read with strong consistency, or 8KB eventually consistent
+            units = max(1, -(-read_bytes // 4096)) / (1 if args.get("ConsistentRead") else 2)
+            response["ConsumedCapacity"] = {"TableName": table.name, "CapacityUnits": units}
+        return response
+
+    def batch_get_item(self, args: dict) -> dict:
+        requested = args["RequestItems"]
+        if sum(len(x["Keys"]) for x in requested.values()) > BATCH_GET_MAX_KEYS:
+            raise validation_error("too many items requested for the BatchGetItem call")
+        responses = {}
+        for name, keys in requested.items():
+            request = _Request(keys.get("ExpressionAttributeNames"), None)
+            table = self.table(name)
+            items = (table.get(x) for x in keys["Keys"])
+            responses[name] = [
+                _project(x, keys.get("ProjectionExpression"), request) for x in items if x
+            ]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, args: dict) -> dict:
+        requested = args["RequestItems"]
+        if sum(len(x) for x in requested.values()) > BATCH_WRITE_MAX_ITEMS:
+            raise validation_error("too many items requested for the BatchWriteItem call")
+        request = _Request(None, None)
+        for name, writes in requested.items():
+            table = self.table(name)
+            for write in writes:
+                if "PutRequest" in write:
+                    self._put(table, write["PutRequest"], request)
+                else:
+                    self._delete(table, write["DeleteRequest"], request)
+        return {"UnprocessedItems": {}}
+
+    def transact_write_items(self, args: dict) -> dict:
+        transaction = args["TransactItems"]
+        if len(transaction) > TRANSACT_WRITE_MAX_ITEMS:
+            raise validation_error("too many items requested for the TransactWriteItems call")
+        operations, reasons = [], []
+        for write in transaction:
+            ((action, operation),) = write.items()
+            request = _Request.of(operation)
+            table = self.table(operation["TableName"])
+            key = operation["Item"] if action == "Put" else operation["Key"]
+            current = table.get(key)
+            try:
+                self._check(current or {}, operation.get("ConditionExpression"), request)
+                reasons.append({"Code": "None"})
+            except InMemoryDynamoDbError as e:
+                reasons.append({"Code": "ConditionalCheckFailed", "Message": e.message})
+            operations.append((action, table, operation, request))
+        if any(x["Code"] != "None" for x in reasons):
+            codes = ", ".join(x["Code"] for x in reasons)
+            raise InMemoryDynamoDbError(
+                "TransactionCanceledException",
+                f"Transaction cancelled, please refer cancellation reasons for specific reasons "
+                f"[{codes}]",
+                CancellationReasons=reasons,
+            )
+        for action, table, operation, request in operations:
+            # the conditions have been checked for all of the operations
+            operation = {k: v for k, v in operation.items() if k != "ConditionExpression"}
+            if action == "Put":
+                self._put(table, operation, request)
+            elif action == "Update":
+                self._update(table, operation, request)
+            elif action == "Delete":
+                self._delete(table, operation, request)
+        return {}
+
+
+def _add_or_delete(
+    item: Item, path: Tuple, action: str, current: Optional[Attribute], operand: Attribute
+):
+    ((kind, value),) = operand.items()
+    if kind == "N" and action == "ADD":
+        total = Decimal(current["N"] if current else 0) + Decimal(value)
+        _set_path(item, path, {"N": str(total)})
+    elif kind in ("SS", "NS", "BS"):
+        values = list((current or {}).get(kind, []))
+        if action == "ADD":
+            values.extend(x for x in value if x not in values)
+        else:
+            values = [x for x in values if x not in value]
+        _remove_path(item, path) if not values else _set_path(item, path, {kind: values})
+    else:
+        raise validation_error("an operand in the update expression has an incorrect type")
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+class InMemoryDynamoDbConnectionConfig(DynamoDbConnectionConfig):
+    hash_key: str
+    range_key: Optional[str]
+    indexes: Dict[str, List[Optional[str]]]
+
+
+class InMemoryDynamoDbConnection(DynamoDbConnection):
+    """DynamoDbConnection whose boto3 resources and clients are answered by an in-memory
+    database, e.g. to run benchmarks and tests of the repositories without AWS. The data is
+    kept by the connection, shared by its threads and lost with it"""
+
+    config: InMemoryDynamoDbConnectionConfig
+
+    def __init__(self, config: InMemoryDynamoDbConnectionSettings, parent_logger: Logger):
+        super().__init__(config, parent_logger)
+        self.config = InMemoryDynamoDbConnectionConfig(**config.model_dump())
+        # no requests are sent, the credentials are only needed to create the clients
+        self.opts = {**self.opts, "aws_access_key_id": "local", "aws_secret_access_key": "local"}
+        self.database = InMemoryDynamoDb(
+            (self.config.hash_key, self.config.range_key),
+            {k: (v[0], v[1] if len(v) > 1 else None) for k, v in self.config.indexes.items()},
+        )
+
+    def _new_session(self) -> Boto3Session:
+        session = super()._new_session()
+        session.events.register("before-call.dynamodb", self.database.handle)
+        return session
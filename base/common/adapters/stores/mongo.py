@@ -1,9 +1,12 @@
 from datetime import date, datetime, time
-from typing import List, Optional, Tuple
+from typing import Dict, Iterator, List, Literal, NamedTuple, Optional, Tuple, Union
 
-from pymongo import MongoClient, ReadPreference, WriteConcern
+import bson
+from pymongo import InsertOne, MongoClient, ReadPreference, UpdateOne, WriteConcern
 from pymongo.client_session import ClientSession as PyMongoClientSession
+from pymongo.client_session import TransactionOptions
 from pymongo.database import Database as MnCursor
+from pymongo.errors import BulkWriteError, ConnectionFailure
 from pymongo.read_concern import ReadConcern
 from tenacity import Retrying, stop_after_delay, wait_random_exponential
 from ulid import microsecond as ulid
@@ -26,8 +29,36 @@ def mn_json(v):
     return v
 
 
+DUPLICATE_KEY_CODE = 11000
+
+
+class WriteRequest(NamedTuple):
+    """Request of MongoRepo._bulk_write: the insert of `doc`, or the update (operators or
+    pipeline) or the replacement with `doc` of the document matching `filter`"""
+
+    op: Literal["insert", "update", "replace"]
+    doc: Union[dict, List[dict]]
+    filter: Optional[dict] = None
+    upsert: bool = False
+
+    @classmethod
+    def insert(cls, doc: dict) -> "WriteRequest":
+        return cls("insert", doc)
+
+    @classmethod
+    def update(
+        cls, filter: dict, update: Union[dict, List[dict]], upsert: bool = False
+    ) -> "WriteRequest":
+        return cls("update", update, filter, upsert)
+
+    @classmethod
+    def replace(cls, filter: dict, doc: dict, upsert: bool = False) -> "WriteRequest":
+        return cls("replace", doc, filter, upsert)
+
+
 class MongoCursor(StoreCursor):
     cursor: MnCursor
+    session: Optional[PyMongoClientSession] = None
 
 
 class MongoConnectionConfig(StoreConfig):
@@ -39,12 +70,14 @@ class MongoConnectionConfig(StoreConfig):
 
 class MongoConnection(StoreConnection[MongoClient, PyMongoClientSession]):
     config: MongoConnectionConfig
+    session_options = ("read_only",)
 
     def __init__(self, config: MongoConnectionSettings, parent_logger: Logger):
-        self.config = MongoConnectionConfig(**config)
+        self.config = MongoConnectionConfig(**config.model_dump())
         self.logger = parent_logger.child("mongo")
+        self.connection = self.connect()
 
-    def connect(self):
+    def connect(self) -> MongoClient:
         retry_strat = {
             "wait": wait_random_exponential(
                 multiplier=0.5, min=0.5, max=self.config.retry_max_total_delay_seconds
@@ -61,39 +94,79 @@ class MongoConnection(StoreConnection[MongoClient, PyMongoClientSession]):
             raise StoreErrors.Connection(msg)
 
     def is_connected(self, connection: MongoClient) -> bool:
-        if connection is None:
-            return False
-        try:
-            connection.server_info()
-        except Exception:
-            return False
-        return True
+        # pymongo monitors the servers in background, waits for a suitable one on each
+        # operation and reconnects by itself, so a cursor does not need a round trip and
+        # the client, shared by the threads, is never replaced
+        return connection is not None
+
+    def translate_error(self, err: Exception) -> Exception:
+        if isinstance(err, ConnectionFailure):
+            return StoreErrors.Connection(f"MongoConnection: {str(err)}")
+        return err
 
     def create_session(
-        self, connection: MongoClient, autocommit: bool
+        self, connection: MongoClient, autocommit: bool, read_only: bool = False, **options
     ) -> Tuple[PyMongoClientSession, None]:
-        session = connection.start_session()
-        session.start_transaction(
-            read_concern=ReadConcern("snapshot"),
-            write_concern=WriteConcern(w="majority"),
-            read_preference=ReadPreference.PRIMARY,
+        """By default the session runs a multi document transaction on the primary. With
+        `autocommit` it is a causally consistent session without transaction, each operation
+        is applied on its own. With `read_only` it is also without transaction and reads
+        from the secondaries when available, the writes still go to the primary"""
+        if read_only:
+            defaults = TransactionOptions(
+                read_concern=ReadConcern("majority"),
+                write_concern=WriteConcern(w="majority"),
+                read_preference=ReadPreference.SECONDARY_PREFERRED,
+            )
+        elif autocommit:
+            defaults = TransactionOptions(
+                read_concern=ReadConcern("majority"),
+                write_concern=WriteConcern(w="majority"),
+                read_preference=ReadPreference.PRIMARY,
+            )
+        else:
+            defaults = TransactionOptions(
+                read_concern=ReadConcern("snapshot"),
+                write_concern=WriteConcern(w="majority"),
+                read_preference=ReadPreference.PRIMARY,
+            )
+        session = connection.start_session(
+            causal_consistency=True, default_transaction_options=defaults
         )
+        if not (autocommit or read_only):
+            session.start_transaction()
         return session, None
 
     def rollback_session(self, session: PyMongoClientSession):
-        session.abort_transaction()
+        if session.in_transaction:
+            session.abort_transaction()
 
     def commit_session(self, session: PyMongoClientSession):
-        session.commit_transaction()
+        if session.in_transaction:
+            session.commit_transaction()
 
     def close_session(self, session: PyMongoClientSession):
         session.end_session()
 
     def create_cursor(self, session: PyMongoClientSession) -> MongoCursor:
-        return MongoCursor(cursor=session.client.get_database(self.config.database))
+        if session.in_transaction:
+            database = session.client.get_database(self.config.database)
+            return MongoCursor(cursor=database, session=session)
+        # outside of a transaction the session defaults are applied by the database
+        defaults = session.options.default_transaction_options
+        database = session.client.get_database(
+            self.config.database,
+            read_concern=defaults.read_concern,
+            write_concern=defaults.write_concern,
+            read_preference=defaults.read_preference,
+        )
+        return MongoCursor(cursor=database, session=session)
 
 
 class MongoRepo(Repository):
+    # limits of each bulk_write call, the ones of a write command on the server
+    bulk_write_max_ops: int = 100_000
+    bulk_write_max_bytes: int = 16 * 1024 * 1024
+
     def _create_id(self):
         return str(ulid.new())
 
@@ -106,7 +179,7 @@ class MongoRepo(Repository):
         ser = {k: mn_json(v) for k, v in item.items() if k not in ["id"]}
         ser["_id"] = new_id or self._create_id()
         ser["created_at"] = ser["updated_at"] = self._utcnow()
-        curs.cursor[collection_name].insert_one(ser)
+        curs.cursor[collection_name].insert_one(ser, session=curs.session)
         ser["id"] = ser["_id"]
         return ser
 
@@ -119,7 +192,7 @@ class MongoRepo(Repository):
     ) -> dict:
         if sort is None:
             sort = []
-        res = curs.cursor[collection_name].find_one(query, sort=sort)
+        res = curs.cursor[collection_name].find_one(query, sort=sort, session=curs.session)
         if not res:
             msg = f"element not found for query={query}"
             raise StoreErrors.NotFound(msg)
@@ -139,7 +212,9 @@ class MongoRepo(Repository):
             raise StoreErrors.BaseError("at least one field to update must be passed")
         updates["updated_at"] = self._utcnow()
         ser = {k: mn_json(v) for k, v in updates.items()}
-        res = curs.cursor[collection_name].update_one(filter=query, update={"$set": ser})
+        res = curs.cursor[collection_name].update_one(
+            filter=query, update={"$set": ser}, session=curs.session
+        )
         if not res or res.matched_count != 1:
             msg = f"element not found for query={query}"
             raise StoreErrors.NotFound(msg)
@@ -159,9 +234,145 @@ class MongoRepo(Repository):
         further_updates = {"updated_at": update_date}
         ser = {k: mn_json(v) for k, v in updates.items()}
         res = curs.cursor[collection_name].update_one(
-            filter=query, update={"$set": further_updates, **ser}
+            filter=query, update={"$set": further_updates, **ser}, session=curs.session
         )
         if not res or res.matched_count != 1:
             msg = f"element not found for query={query}"
             raise StoreErrors.NotFound(msg)
         return update_date
+
+    def _insert_many(
+        self, curs: MongoCursor, collection_name: str, items: List[dict], ordered: bool = True
+    ) -> List[dict]:
+        """Inserts the items with bulk writes, the ids and dates are set as in _insert.
+        Unordered, the items after a duplicate are still inserted"""
+        result = []
+        for item in items:
+            ser = {k: v for k, v in item.items() if k not in ["id"]}
+            ser["_id"] = item.get("id") or self._create_id()
+            result.append(ser)
+        requests = [WriteRequest.insert(x) for x in result]
+        self._bulk_write(curs, collection_name, requests, ordered)
+        for ser in result:
+            ser["id"] = ser["_id"]
+        return result
+
+    def _update_many(
+        self,
+        curs: MongoCursor,
+        collection_name: str,
+        supported_attributes: List[str],
+        items: List[dict],
+        ordered: bool = True,
+    ) -> List[dict]:
+        """Updates the `supported_attributes` of each item by id with bulk writes.
+        Returns the updates, including the ids not found"""
+        now = self._utcnow()
+        result, requests = [], []
+        for item in items:
+            if not (updates := {k: item[k] for k in supported_attributes if k in item}):
+                raise StoreErrors.BaseError("at least one field to update must be passed")
+            updates["updated_at"] = now
+            ser = {k: mn_json(v) for k, v in updates.items()}
+            requests.append(WriteRequest.update({"_id": item["id"]}, {"$set": ser}))
+            result.append({"id": item["id"], **updates})
+        self._bulk_write(curs, collection_name, requests, ordered)
+        return result
+
+    def _bulk_write(
+        self,
+        curs: MongoCursor,
+        collection_name: str,
+        requests: List[WriteRequest],
+        ordered: bool = True,
+    ) -> Dict[str, int]:
+        """Runs the requests with bulk_write, in chunks of at most `bulk_write_max_ops`
+        requests and `bulk_write_max_bytes`. The documents are converted with mn_json and
+        the dates are set: `updated_at` on every request, `created_at` on the inserts and the
+        upserts, the replacements keep it. Ordered, the requests after a failure are not
+        applied; unordered, all the chunks are written anyway. The duplicate keys are raised
+        after, with their ids"""
+        now = self._utcnow()
+        collection = curs.cursor[collection_name]
+        totals = {"inserted": 0, "matched": 0, "modified": 0, "upserted": 0}
+        duplicates, errors = [], []
+        for chunk in self._bulk_chunks(self._bulk_request(x, now) for x in requests):
+            operations = [self._bulk_operation(x) for x in chunk]
+            try:
+                res = collection.bulk_write(operations, ordered=ordered, session=curs.session)
+                details = res.bulk_api_result
+            except BulkWriteError as err:
+                details = err.details
+                for error in details["writeErrors"]:
+                    if error.get("code") == DUPLICATE_KEY_CODE:
+                        duplicates.append(self._bulk_error_id(error))
+                    else:
+                        errors.append(error.get("errmsg"))
+            for k, n in zip(totals, ["nInserted", "nMatched", "nModified", "nUpserted"]):
+                totals[k] += details.get(n, 0)
+            if ordered and (duplicates or errors):
+                break
+        if errors:
+            raise StoreErrors.BaseError(f"bulk write failed: {errors}")
+        if duplicates:
+            raise StoreErrors.DuplicateKey(f"elements already exist: {duplicates}")
+        return totals
+
+    @staticmethod
+    def _bulk_error_id(error: dict):
+        # the key of the error can be the one of another unique index, the id is read from
+        # the failed operation: the inserted document or the filter of the upsert
+        op = error.get("op", {})
+        if "_id" in op:
+            return op["_id"]
+        query = op.get("q", {})
+        return query.get("_id", query or error.get("keyValue"))
+
+    def _bulk_request(self, request: WriteRequest, now: datetime) -> WriteRequest:
+        if request.op == "insert":
+            # like insert_one, the inserted document is updated with the id and the dates
+            doc = request.doc
+            doc.update({k: mn_json(v) for k, v in doc.items()})
+            doc.setdefault("_id", self._create_id())
+            doc["created_at"] = doc["updated_at"] = now
+            return request
+        if request.op == "replace":
+            # a pipeline update replacing the document, keeping its id and creation date
+            doc = {k: v for k, v in mn_json(request.doc).items() if k != "created_at"}
+            kept = {"_id": "$_id", "created_at": {"$ifNull": ["$created_at", now]}}
+            merged = {"$mergeObjects": [{"$literal": {**doc, "updated_at": now}}, kept]}
+            return request._replace(op="update", doc=[{"$replaceWith": merged}])
+        doc = request.doc
+        if isinstance(doc, dict):
+            doc = {**mn_json(doc), "$set": {**mn_json(doc.get("$set", {})), "updated_at": now}}
+            if request.upsert:
+                doc["$setOnInsert"] = {"created_at": now, **doc.get("$setOnInsert", {})}
+        return request._replace(doc=doc)
+
+    @staticmethod
+    def _bulk_operation(request: WriteRequest) -> Union[InsertOne, UpdateOne]:
+        # the replacements are already turned into pipeline updates
+        if request.op == "insert":
+            return InsertOne(request.doc)
+        return UpdateOne(request.filter, request.doc, upsert=request.upsert)
+
+    def _bulk_chunks(self, requests: Iterator[WriteRequest]) -> Iterator[List[WriteRequest]]:
+        chunk, size = [], 0
+        for request in requests:
+            docs = [request.filter or {}, request.doc]
+            # the update pipelines are lists of stages
+            request_size = sum(
+                len(bson.encode(x))
+                for doc in docs
+                for x in (doc if isinstance(doc, list) else [doc])
+            )
+            if chunk and (
+                len(chunk) >= self.bulk_write_max_ops
+                or size + request_size > self.bulk_write_max_bytes
+            ):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(request)
+            size += request_size
+        if chunk:
+            yield chunk
@@ -1,24 +1,62 @@
 import abc
+import asyncio
 import decimal
+import itertools
 import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack, ExitStack
+from dataclasses import dataclass
 from datetime import datetime
-from typing import ContextManager, List, Optional, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    ContextManager,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 import psycopg
-from psycopg_pool import ConnectionPool
-from tenacity import Retrying, stop_after_delay, wait_random_exponential
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from tenacity import AsyncRetrying, Retrying, stop_after_delay, wait_random_exponential
 from ulid import microsecond as ulid
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 from base.common.adapters.stores.common import (
+    AsyncStoreConnection,
     Repository,
     StoreConfig,
     StoreConnection,
     StoreCursor,
     StoreErrors,
 )
+from base.common.entities.sorting import SortingSequence
 from base.common.settings import PostgresConnectionSettings
+from base.common.utils.context import CallContext
 from base.common.utils.logger import Logger
 
+if TYPE_CHECKING:
+    from base.common.usecases import Pagination, UsecaseListReq
+
 
 class JsonEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -30,11 +68,76 @@ class JsonEncoder(json.JSONEncoder):
 
 
 class PgJson(psycopg.types.json.Json):
-    """Dumps dictionaries to be postgres compatible, serializing also non-default types"""
+    """Dumps dictionaries to be postgres compatible, through the JsonCodec of the connection"""
 
-    def dumps(self, obj):
+
+class JsonCodec:
+    """Serializes json/jsonb values with the stdlib json, supporting also non-default types"""
+
+    def dumps(self, obj: Any) -> Union[str, bytes]:
         return json.dumps(obj, cls=JsonEncoder)
 
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+def orjson_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson serializes natively datetimes, falling back to JsonCodec for unsupported values"""
+
+    def dumps(self, obj: Any) -> Union[str, bytes]:
+        try:
+            return orjson.dumps(obj, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+# further codecs can be registered and selected by name with POSTGRES_JSON_CODEC
+JSON_CODECS: Dict[str, Type[JsonCodec]] = {"json": JsonCodec, "orjson": OrjsonCodec}
+
+
+# the oldest orjson supported, the one required by the orjson extra
+ORJSON_MIN_VERSION = (3, 10, 6)
+
+
+def orjson_supported() -> bool:
+    if orjson is None:
+        return False
+    return tuple(int(x) for x in re.findall(r"\d+", orjson.__version__)[:3]) >= ORJSON_MIN_VERSION
+
+
+def json_codec(name: str) -> JsonCodec:
+    if name == "auto":
+        name = "orjson" if orjson_supported() else "json"
+    if name == "orjson" and not orjson_supported():
+        version = ".".join(map(str, ORJSON_MIN_VERSION))
+        msg = f"orjson json codec selected, but orjson>={version} is not installed"
+        raise StoreErrors.Connection(msg)
+    if name not in JSON_CODECS:
+        raise StoreErrors.Connection(f"unknown json codec {name}")
+    return JSON_CODECS[name]()
+
+
+def json_adapters(codec: JsonCodec) -> psycopg.adapt.AdaptersMap:
+    """Adapters of the pool connections, dumping and loading json/jsonb with the codec"""
+    adapters = psycopg.adapt.AdaptersMap(psycopg.adapters)
+    psycopg.types.json.set_json_dumps(codec.dumps, adapters)
+    psycopg.types.json.set_json_loads(codec.loads, adapters)
+    return adapters
+
+
+Statement = Tuple[str, dict]
+IN_TRANSACTION = psycopg.pq.TransactionStatus.INTRANS
+MISSING_POLICY = Literal["raise", "skip"]
+
 
 def cast_token(v) -> str:
     if isinstance(v, dict):
@@ -44,6 +147,199 @@ def cast_token(v) -> str:
     return ""
 
 
+def store_error(err: psycopg.Error) -> StoreErrors.BaseError:
+    if isinstance(err, psycopg.errors.UniqueViolation):
+        return StoreErrors.DuplicateKey(f"unique violation: {err}")
+    if isinstance(err, psycopg.errors.ForeignKeyViolation):
+        return StoreErrors.ForeignKeyViolation(f"foreign key violation: {err}")
+    if isinstance(err, (psycopg.errors.QueryCanceled, psycopg.errors.LockNotAvailable)):
+        return StoreErrors.Timeout(f"timeout: {err}")
+    return StoreErrors.BaseError(str(err))
+
+
+def timeouts_statement(local: bool, **timeouts_ms: Optional[int]) -> Optional[Statement]:
+    """Sets the passed timeouts, for the current transaction only when `local`"""
+    if not (timeouts := {k: str(v) for k, v in timeouts_ms.items() if v is not None}):
+        return None
+    query = "SELECT " + ", ".join(
+        f"set_config('{k}', %({k})s, {str(local).lower()})" for k in timeouts
+    )
+    return query, timeouts
+
+
+def reset_timeouts_statement(timeouts: dict) -> Statement:
+    """Restores the timeouts overridden by a session to the ones of the connection"""
+    query = "SELECT set_config(name, reset_val, false) FROM pg_settings WHERE name = ANY(%(names)s)"
+    return query, {"names": [k for k, v in timeouts.items() if v is not None]}
+
+
+def keyset_operator(order: str, after: bool) -> str:
+    return ">" if (order == "ASC") == after else "<"
+
+
+def keyset_condition(
+    keys: List[Tuple[str, str]], ref: Callable[[str], psycopg.sql.Composable], after: bool
+) -> psycopg.sql.Composable:
+    """Condition selecting the rows after (or before) the `ref` values in the keys order"""
+    sql = psycopg.sql
+
+    def col(k):
+        return sql.SQL("t.{}").format(sql.Identifier(k))
+
+    if len({o for _, o in keys}) == 1:
+        # same direction for every key, the row comparison can use a composite index
+        return sql.SQL("({cols}) {op} ({refs})").format(
+            cols=sql.SQL(", ").join(col(k) for k, _ in keys),
+            op=sql.SQL(keyset_operator(keys[0][1], after)),
+            refs=sql.SQL(", ").join(ref(k) for k, _ in keys),
+        )
+    branches = []
+    for i, (k, o) in enumerate(keys):
+        terms = [sql.SQL("{} = {}").format(col(p), ref(p)) for p, _ in keys[:i]]
+        terms.append(sql.SQL("{} {} {}").format(col(k), sql.SQL(keyset_operator(o, after)), ref(k)))
+        branches.append(sql.SQL("({})").format(sql.SQL(" AND ").join(terms)))
+    return sql.SQL("({})").format(sql.SQL(" OR ").join(branches))
+
+
+def recordset_value(v):
+    """Adapts a value to be read by jsonb_populate_recordset, which parses the strings with
+    the input function of the column: the decimals and the bytes keep their exact value"""
+    if isinstance(v, decimal.Decimal):
+        return str(v)
+    elif isinstance(v, (bytes, bytearray, memoryview)):
+        return "\\x" + bytes(v).hex()
+    return v
+
+
+def copy_value(v):
+    """Adapts a value to be written by COPY, where no explicit cast can be used"""
+    if isinstance(v, dict):
+        return PgJson(v)
+    elif isinstance(v, list) and v and all(isinstance(x, dict) for x in v):
+        return [PgJson(x) for x in v]
+    return v
+
+
+PLAIN_SELECT = re.compile(r"\s*SELECT\b", re.IGNORECASE)
+
+
+@dataclass
+class SlowQueryLog:
+    """Logs the statements slower than the threshold, capturing the plan of a sample of them"""
+
+    logger: Logger
+    threshold_ms: float
+    explain_sample_rate: float = 0.0
+
+    def is_slow(self, started: float) -> Optional[float]:
+        if (elapsed_ms := 1000 * (time.perf_counter() - started)) >= self.threshold_ms:
+            return elapsed_ms
+        return None
+
+    def explain_statement(
+        self, cursor: Union[psycopg.Cursor, psycopg.AsyncCursor], query
+    ) -> Optional[str]:
+        # the statement is executed again, so only the plain SELECT are explained, a WITH
+        # can hide a data modifying CTE, and only inside a transaction, where the explain
+        # can be rolled back
+        if random.random() >= self.explain_sample_rate:
+            return None
+        if (
+            cursor.connection.autocommit
+            or cursor.connection.info.transaction_status != IN_TRANSACTION
+        ):
+            return None
+        statement = self.statement(cursor, query)
+        if not PLAIN_SELECT.match(statement):
+            return None
+        return f"EXPLAIN (ANALYZE, BUFFERS) {statement}"
+
+    def statement(self, cursor: Union[psycopg.Cursor, psycopg.AsyncCursor], query) -> str:
+        if isinstance(query, psycopg.sql.Composable):
+            return query.as_string(cursor)
+        return query.decode() if isinstance(query, bytes) else query
+
+    def log(self, cursor, query, elapsed_ms: float, plan: Optional[List[tuple]] = None):
+        self.logger.warning(
+            "slow query",
+            statement=self.statement(cursor, query),
+            elapsed_ms=round(elapsed_ms, 2),
+            rowcount=cursor.rowcount,
+            correlation_id=CallContext.get_correlation_id(),
+            **({"plan": "\n".join(x[0] for x in plan)} if plan else {}),
+        )
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor timing every execute, enabled only when POSTGRES_SLOW_QUERY_MS is set"""
+
+    slow_query_log: SlowQueryLog
+
+    def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        res = super().execute(query, params, **kwargs)
+        if (elapsed_ms := self.slow_query_log.is_slow(started)) is not None:
+            plan = None
+            if explain := self.slow_query_log.explain_statement(self, query):
+                plan = self._explain(explain, params)
+            self.slow_query_log.log(self, query, elapsed_ms, plan)
+        return res
+
+    def _explain(self, explain: str, params) -> Optional[List[tuple]]:
+        try:
+            with self.connection.transaction():
+                with psycopg.Cursor(self.connection, row_factory=psycopg.rows.tuple_row) as curs:
+                    curs.execute(explain, params)
+                    plan = curs.fetchall()
+                    raise psycopg.Rollback()
+        except psycopg.Error as err:
+            self.slow_query_log.logger.warning(f"unable to explain the slow query. {str(err)}")
+            return None
+        return plan
+
+
+class AsyncInstrumentedCursor(psycopg.AsyncCursor):
+    slow_query_log: SlowQueryLog
+
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        res = await super().execute(query, params, **kwargs)
+        if (elapsed_ms := self.slow_query_log.is_slow(started)) is not None:
+            plan = None
+            if explain := self.slow_query_log.explain_statement(self, query):
+                plan = await self._explain(explain, params)
+            self.slow_query_log.log(self, query, elapsed_ms, plan)
+        return res
+
+    async def _explain(self, explain: str, params) -> Optional[List[tuple]]:
+        try:
+            async with self.connection.transaction():
+                async with psycopg.AsyncCursor(
+                    self.connection, row_factory=psycopg.rows.tuple_row
+                ) as curs:
+                    await curs.execute(explain, params)
+                    plan = await curs.fetchall()
+                    raise psycopg.Rollback()
+        except psycopg.Error as err:
+            self.slow_query_log.logger.warning(f"unable to explain the slow query. {str(err)}")
+            return None
+        return plan
+
+
+def slow_query_cursor(
+    config: "PostgresConnectionConfig", logger: Logger, cursor_class: Type[psycopg.Cursor]
+) -> Optional[Type[psycopg.Cursor]]:
+    """Cursor class logging the slow queries, None when disabled to not add any overhead"""
+    if config.slow_query_ms is None:
+        return None
+    slow_query_log = SlowQueryLog(
+        logger=logger.child("slow_query"),
+        threshold_ms=config.slow_query_ms,
+        explain_sample_rate=config.slow_query_explain_sample_rate,
+    )
+    return type(cursor_class.__name__, (cursor_class,), {"slow_query_log": slow_query_log})
+
+
 class PostgresCursor(StoreCursor):
     cursor: psycopg.Cursor
     schema_name: str
@@ -64,70 +360,250 @@ class PostgresConnectionConfig(StoreConfig):
     pool_max_lifetime: float
     pool_max_idle: int
     pool_reconnect_timeout: int
+    pool_check_interval_seconds: float
+    pool_check_on_checkout: bool
+    replica_hosts: str
+    replica_selection: Literal["round_robin", "least_busy"]
+    replica_checkout_timeout: float
+    replica_retry_seconds: float
+    json_codec: str
+    statement_timeout_ms: Optional[int]
+    lock_timeout_ms: Optional[int]
+    slow_query_ms: Optional[float]
+    slow_query_explain_sample_rate: float
+
+
+def pool_options(
+    config: PostgresConnectionConfig,
+    check: Optional[Callable] = None,
+    cursor_factory: Optional[Type] = None,
+) -> dict:
+    """Options shared by the sync and the async connection pools"""
+    timeouts = {
+        "statement_timeout": config.statement_timeout_ms,
+        "lock_timeout": config.lock_timeout_ms,
+    }
+    startup = " ".join(f"-c {k}={v}" for k, v in timeouts.items() if v is not None)
+    return {
+        "check": check if config.pool_check_on_checkout else None,
+        "min_size": config.pool_min_size,
+        "max_size": config.pool_max_size,
+        "timeout": config.pool_client_timeout,
+        "max_lifetime": config.pool_max_lifetime,
+        "max_idle": config.pool_max_idle,
+        "reconnect_timeout": config.pool_reconnect_timeout,
+        "kwargs": {
+            "user": config.user,
+            "password": config.password,
+            "host": config.host,
+            "port": config.port,
+            "dbname": config.database,
+            "row_factory": psycopg.rows.dict_row,
+            "autocommit": False,
+            "context": json_adapters(json_codec(config.json_codec)),
+            **({"options": startup} if startup else {}),
+            **({"cursor_factory": cursor_factory} if cursor_factory else {}),
+        },
+        "open": False,
+    }
+
+
+@dataclass
+class PostgresReplica:
+    address: str
+    pool: Union[ConnectionPool, AsyncConnectionPool]
+    unhealthy_until: float = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def busy(self) -> int:
+        stats = self.pool.get_stats()
+        return (
+            stats.get("pool_size", 0)
+            - stats.get("pool_available", 0)
+            + stats.get("requests_waiting", 0)
+        )
+
+
+class PostgresReplicas:
+    """Read replicas of the primary, each one with its own pool. A replica failing to give
+    a connection is skipped for `replica_retry_seconds`, then it is tried again."""
+
+    def __init__(self, config: PostgresConnectionConfig, pool_class: Type, options: dict):
+        self.config = config
+        self.items: List[PostgresReplica] = []
+        for address in filter(None, (x.strip() for x in config.replica_hosts.split(","))):
+            host, _, port = address.partition(":")
+            kwargs = {**options["kwargs"], "host": host, "port": port or config.port}
+            pool = pool_class(**{**options, "kwargs": kwargs, "name": f"replica-{address}"})
+            self.items.append(PostgresReplica(address=address, pool=pool))
+        self._counter = itertools.count()
+
+    def select(self) -> List[PostgresReplica]:
+        """Healthy replicas in the order they should be tried"""
+        healthy = [x for x in self.items if x.healthy]
+        if not healthy:
+            return []
+        if self.config.replica_selection == "least_busy":
+            return sorted(healthy, key=lambda x: x.busy())
+        start = next(self._counter) % len(healthy)
+        return healthy[start:] + healthy[:start]
+
+    def mark_unhealthy(self, replica: PostgresReplica):
+        replica.unhealthy_until = time.monotonic() + self.config.replica_retry_seconds
+
+
+def connect_retry_strategy(config: PostgresConnectionConfig) -> dict:
+    return {
+        "wait": wait_random_exponential(
+            multiplier=0.5, min=0.5, max=config.retry_max_total_delay_seconds
+        ),
+        "stop": stop_after_delay(max_delay=config.retry_max_timeout_seconds),
+        "reraise": True,
+    }
+
+
+SESSION_OPTIONS = ("pipeline", "read_only", "statement_timeout_ms", "lock_timeout_ms")
 
 
 class PostgresConnection(StoreConnection[ConnectionPool, psycopg.Cursor]):
     config: PostgresConnectionConfig
+    session_options = SESSION_OPTIONS
 
     def __init__(self, config: PostgresConnectionSettings, parent_logger: Logger):
         self.config = PostgresConnectionConfig(**config.model_dump())
         self.logger = parent_logger.child("postgres")
-        self.connection_kwargs = {
-            "user": self.config.user,
-            "password": self.config.password,
-            "host": self.config.host,
-            "port": self.config.port,
-            "dbname": self.config.database,
-            "row_factory": psycopg.rows.dict_row,
-            "autocommit": False,
-        }
-        self.pool: ConnectionPool = ConnectionPool(
-            min_size=self.config.pool_min_size,
-            max_size=self.config.pool_max_size,
-            timeout=self.config.pool_client_timeout,
-            max_lifetime=self.config.pool_max_lifetime,
-            max_idle=self.config.pool_max_idle,
-            reconnect_timeout=self.config.pool_reconnect_timeout,
-            kwargs=self.connection_kwargs,
-            open=False,
+        options = pool_options(
+            self.config,
+            check=ConnectionPool.check_connection,
+            cursor_factory=slow_query_cursor(self.config, self.logger, InstrumentedCursor),
         )
+        self.connection_kwargs = options["kwargs"]
+        self.pool: ConnectionPool = ConnectionPool(**options)
+        self.replicas = PostgresReplicas(self.config, ConnectionPool, options)
+        self._health_checker: Optional[threading.Thread] = None
+        self._stop_health_checker = threading.Event()
         self.connection = self.connect()
 
     def connect(self) -> ConnectionPool:
         self.logger.debug("PostgresConnection: connecting to database with pool")
-        retry_strat = {
-            "wait": wait_random_exponential(
-                multiplier=0.5, min=0.5, max=self.config.retry_max_total_delay_seconds
-            ),
-            "stop": stop_after_delay(max_delay=self.config.retry_max_timeout_seconds),
-            "reraise": True,
-        }
+        retry_strat = connect_retry_strategy(self.config)
         try:
             for att in Retrying(**retry_strat):
                 with att:
                     self.pool.open(wait=True, timeout=self.config.pool_client_timeout)
+                    # an unavailable replica must not prevent the service to start
+                    for replica in self.replicas.items:
+                        replica.pool.open(wait=False)
+                    self._start_health_checker()
                     return self.pool
         except Exception as err:
             msg = f"PostgresConnection: unable to establish connection. {str(err)}"
             raise StoreErrors.Connection(msg)
 
     def is_connected(self, connection: ConnectionPool) -> bool:
-        self.pool.check()
-        return True
+        # idle connections are probed by the health checker and the one handed out
+        # is validated on checkout, so a cursor only pays for its own connection
+        return connection is not None and not connection.closed
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            "primary": self.pool.get_stats(),
+            **{f"replica-{x.address}": x.pool.get_stats() for x in self.replicas.items},
+        }
+
+    def close(self):
+        self._stop_health_checker.set()
+        for replica in self.replicas.items:
+            replica.pool.close()
+        self.pool.close()
+
+    def _start_health_checker(self):
+        if self.config.pool_check_interval_seconds <= 0 or self._health_checker is not None:
+            return
+        self._health_checker = threading.Thread(
+            target=self._health_check, name="postgres-pool-health-checker", daemon=True
+        )
+        self._health_checker.start()
+
+    def _health_check(self):
+        while not self._stop_health_checker.wait(self.config.pool_check_interval_seconds):
+            for pool in [self.pool, *(x.pool for x in self.replicas.items)]:
+                try:
+                    pool.check()
+                except Exception as err:
+                    msg = f"PostgresConnection: pool {pool.name} health check failed. {str(err)}"
+                    self.logger.warning(msg)
 
     def create_session(
-        self, connection: ConnectionPool, autocommit: bool
+        self,
+        connection: ConnectionPool,
+        autocommit: bool,
+        pipeline: bool = False,
+        read_only: bool = False,
+        statement_timeout_ms: Optional[int] = None,
+        lock_timeout_ms: Optional[int] = None,
+        **options,
     ) -> Tuple[psycopg.Cursor, Optional[ContextManager]]:
-        conn_manager = connection.connection()
-        conn = conn_manager.__enter__()
-        conn.autocommit = autocommit
-        return conn.cursor(), conn_manager
+        """With `pipeline` the statements are sent without waiting for the results,
+        which are synced when fetched or on commit. With `read_only` the session runs
+        on a replica if available, otherwise on a read only transaction on the primary.
+        The timeouts override the configured ones for this session only"""
+        session_manager = ExitStack()
+        conn = None
+        for replica in self.replicas.select() if read_only else []:
+            try:
+                conn = session_manager.enter_context(
+                    replica.pool.connection(timeout=self.config.replica_checkout_timeout)
+                )
+                break
+            except Exception as err:
+                msg = f"PostgresConnection: replica {replica.address} unavailable. {str(err)}"
+                self.logger.warning(msg)
+                self.replicas.mark_unhealthy(replica)
+        try:
+            if conn is None:
+                conn = session_manager.enter_context(connection.connection())
+            self._mark_checkout()
+            conn.autocommit = autocommit
+            if read_only:
+                conn.read_only = True
+                session_manager.callback(setattr, conn, "read_only", None)
+            timeouts = {
+                "statement_timeout": statement_timeout_ms,
+                "lock_timeout": lock_timeout_ms,
+            }
+            if statement := timeouts_statement(not autocommit, **timeouts):
+                conn.execute(*statement)
+                if autocommit:
+                    session_manager.callback(conn.execute, *reset_timeouts_statement(timeouts))
+            if pipeline:
+                session_manager.enter_context(conn.pipeline())
+            return conn.cursor(), session_manager
+        except BaseException as err:
+            # no session is returned to the cursor: the connection goes back to the pool here
+            session_manager.__exit__(type(err), err, err.__traceback__)
+            raise
+
+    def translate_error(self, err: Exception) -> Exception:
+        return store_error(err) if isinstance(err, psycopg.Error) else err
 
     def rollback_session(self, session: psycopg.Cursor):
-        session.connection.rollback()
+        try:
+            session.connection.rollback()
+        except psycopg.errors.PipelineAborted:
+            # the first rollback discards the results of the aborted pipeline
+            session.connection.rollback()
 
     def commit_session(self, session: psycopg.Cursor):
-        session.connection.commit()
+        try:
+            session.connection.commit()
+        except psycopg.Error as err:
+            # in pipeline mode the errors of the statements can be raised on commit
+            self.rollback_session(session)
+            raise store_error(err)
 
     def close_session(self, session: psycopg.Cursor):
         pass
@@ -139,38 +615,773 @@ class PostgresConnection(StoreConnection[ConnectionPool, psycopg.Cursor]):
         )
 
 
-class PostgresRepo(Repository, abc.ABC):
+class AsyncPostgresCursor(StoreCursor):
+    cursor: psycopg.AsyncCursor
+    schema_name: str
+
+
+class AsyncPostgresConnection(AsyncStoreConnection[AsyncConnectionPool, psycopg.AsyncCursor]):
+    config: PostgresConnectionConfig
+    session_options = SESSION_OPTIONS
+
+    def __init__(self, config: PostgresConnectionSettings, parent_logger: Logger):
+        self.config = PostgresConnectionConfig(**config.model_dump())
+        self.logger = parent_logger.child("postgres-async")
+        options = pool_options(
+            self.config,
+            check=AsyncConnectionPool.check_connection,
+            cursor_factory=slow_query_cursor(self.config, self.logger, AsyncInstrumentedCursor),
+        )
+        self.connection_kwargs = options["kwargs"]
+        # the pool can be opened only inside a running event loop, it happens on the first cursor
+        self.pool: AsyncConnectionPool = AsyncConnectionPool(**options)
+        self.replicas = PostgresReplicas(self.config, AsyncConnectionPool, options)
+        self._health_checker: Optional[asyncio.Task] = None
+
+    async def connect(self) -> AsyncConnectionPool:
+        self.logger.debug("AsyncPostgresConnection: connecting to database with pool")
+        retry_strat = connect_retry_strategy(self.config)
+        try:
+            async for att in AsyncRetrying(**retry_strat):
+                with att:
+                    await self.pool.open(wait=True, timeout=self.config.pool_client_timeout)
+                    for replica in self.replicas.items:
+                        await replica.pool.open(wait=False)
+                    self._start_health_checker()
+                    return self.pool
+        except Exception as err:
+            msg = f"AsyncPostgresConnection: unable to establish connection. {str(err)}"
+            raise StoreErrors.Connection(msg)
+
+    async def is_connected(self, connection: Optional[AsyncConnectionPool]) -> bool:
+        return connection is not None and not connection.closed
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            "primary": self.pool.get_stats(),
+            **{f"replica-{x.address}": x.pool.get_stats() for x in self.replicas.items},
+        }
+
+    async def close(self):
+        if self._health_checker is not None:
+            self._health_checker.cancel()
+        for replica in self.replicas.items:
+            await replica.pool.close()
+        await self.pool.close()
+
+    def _start_health_checker(self):
+        if self.config.pool_check_interval_seconds <= 0 or self._health_checker is not None:
+            return
+        self._health_checker = asyncio.create_task(self._health_check())
+
+    async def _health_check(self):
+        while True:
+            await asyncio.sleep(self.config.pool_check_interval_seconds)
+            for pool in [self.pool, *(x.pool for x in self.replicas.items)]:
+                try:
+                    await pool.check()
+                except Exception as err:
+                    msg = f"AsyncPostgresConnection: pool {pool.name} health check failed. {err}"
+                    self.logger.warning(msg)
+
+    async def create_session(
+        self,
+        connection: AsyncConnectionPool,
+        autocommit: bool,
+        pipeline: bool = False,
+        read_only: bool = False,
+        statement_timeout_ms: Optional[int] = None,
+        lock_timeout_ms: Optional[int] = None,
+        **options,
+    ) -> Tuple[psycopg.AsyncCursor, Optional[AsyncContextManager]]:
+        session_manager = AsyncExitStack()
+        conn = None
+        for replica in self.replicas.select() if read_only else []:
+            try:
+                conn = await session_manager.enter_async_context(
+                    replica.pool.connection(timeout=self.config.replica_checkout_timeout)
+                )
+                break
+            except Exception as err:
+                msg = f"AsyncPostgresConnection: replica {replica.address} unavailable. {err}"
+                self.logger.warning(msg)
+                self.replicas.mark_unhealthy(replica)
+        try:
+            if conn is None:
+                conn = await session_manager.enter_async_context(connection.connection())
+            self._mark_checkout()
+            await conn.set_autocommit(autocommit)
+            if read_only:
+                await conn.set_read_only(True)
+                session_manager.push_async_callback(conn.set_read_only, None)
+            timeouts = {
+                "statement_timeout": statement_timeout_ms,
+                "lock_timeout": lock_timeout_ms,
+            }
+            if statement := timeouts_statement(not autocommit, **timeouts):
+                await conn.execute(*statement)
+                if autocommit:
+                    statement = reset_timeouts_statement(timeouts)
+                    session_manager.push_async_callback(conn.execute, *statement)
+            if pipeline:
+                await session_manager.enter_async_context(conn.pipeline())
+            return conn.cursor(), session_manager
+        except BaseException as err:
+            await session_manager.__aexit__(type(err), err, err.__traceback__)
+            raise
+
+    def translate_error(self, err: Exception) -> Exception:
+        return store_error(err) if isinstance(err, psycopg.Error) else err
+
+    async def rollback_session(self, session: psycopg.AsyncCursor):
+        try:
+            await session.connection.rollback()
+        except psycopg.errors.PipelineAborted:
+            await session.connection.rollback()
+
+    async def commit_session(self, session: psycopg.AsyncCursor):
+        try:
+            await session.connection.commit()
+        except psycopg.Error as err:
+            await self.rollback_session(session)
+            raise store_error(err)
+
+    async def close_session(self, session: psycopg.AsyncCursor):
+        pass
+
+    def create_cursor(self, session: psycopg.AsyncCursor) -> AsyncPostgresCursor:
+        return AsyncPostgresCursor(
+            cursor=session,
+            schema_name=self.config.schema_name,
+        )
+
+
+class StatementCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class StatementCache:
+    """Thread safe LRU cache of rendered SQL statements, keyed by the shape of the query"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._statements: OrderedDict[Hashable, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, render: Callable[[], str]) -> str:
+        with self._lock:
+            if (statement := self._statements.get(key)) is not None:
+                self._statements.move_to_end(key)
+                self.hits += 1
+                return statement
+            self.misses += 1
+        statement = render()
+        with self._lock:
+            self._statements[key] = statement
+            if len(self._statements) > self.maxsize:
+                self._statements.popitem(last=False)
+        return statement
+
+    def info(self) -> StatementCacheInfo:
+        with self._lock:
+            return StatementCacheInfo(self.hits, self.misses, self.maxsize, len(self._statements))
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
+            self.hits = self.misses = 0
+
+
+class BasePostgresRepo(Repository, abc.ABC):
+    """Builds the statements of the CRUD helpers, shared by the sync and the async repos"""
+
+    # repositories are created for each request, so the statements are cached per repo class
+    statement_cache_size: int = 256
+    # server-side prepared statements; set to None to leave it to psycopg prepare_threshold
+    prepare_statements: Optional[bool] = True
+    # max number of ids sent in a single query by _get_by_ids
+    get_by_ids_chunk_size: int = 1000
+    # max number of rows sent in a single statement by _upsert_many and _update_many
+    bulk_batch_size: int = 1000
+    _statements: StatementCache = StatementCache(statement_cache_size)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._statements = StatementCache(cls.statement_cache_size)
+
+    @classmethod
+    def statement_cache_info(cls) -> StatementCacheInfo:
+        return cls._statements.info()
+
     def _create_id(self):
         return str(ulid.new())
 
     def _utcnow(self):
         return datetime.utcnow()
 
+    def _statement(
+        self, curs: StoreCursor, key: Hashable, compose: Callable[[], psycopg.sql.Composable]
+    ) -> str:
+        return self._statements.get(
+            (curs.schema_name, *key), lambda: compose().as_string(curs.cursor)
+        )
+
+    def _insert_statement(self, curs: StoreCursor, table_name: str, item: dict) -> Statement:
+        item["id"] = self._create_id()
+        item["created_at"] = item["updated_at"] = self._utcnow()
+        casts = tuple((k, cast_token(v)) for k, v in item.items())
+        query = self._statement(
+            curs,
+            ("insert", table_name, casts),
+            lambda: psycopg.sql.SQL(
+                "INSERT INTO {tbl} ({cols}) VALUES ({placeholders}) RETURNING *;"
+            ).format(
+                tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
+                cols=psycopg.sql.SQL(", ").join(map(psycopg.sql.Identifier, item)),
+                placeholders=psycopg.sql.SQL(", ").join(
+                    psycopg.sql.SQL(f"%({k})s{cast}") for k, cast in casts
+                ),
+            ),
+        )
+        return query, {k: PgJson(v) if isinstance(v, dict) else v for k, v in item.items()}
+
+    def _update_statement(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        supported_attributes: List[str],
+        item_id: str,
+        **kwargs,
+    ) -> Statement:
+        if not (updates := {k: kwargs[k] for k in supported_attributes if k in kwargs}):
+            raise StoreErrors.BaseError("at least one field to update must be passed")
+
+        updates["updated_at"] = self._utcnow()
+        query = self._statement(
+            curs,
+            ("update", table_name, tuple(updates)),
+            lambda: psycopg.sql.SQL(
+                """
+                UPDATE {tbl} SET {placeholders}
+                WHERE id = %(id)s RETURNING *;
+                """
+            ).format(
+                tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
+                placeholders=psycopg.sql.SQL(", ").join(
+                    psycopg.sql.SQL("{col} = {val}").format(
+                        col=psycopg.sql.Identifier(k), val=psycopg.sql.Placeholder(k)
+                    )
+                    for k in updates.keys()
+                ),
+            ),
+        )
+        return query, {"id": item_id, **updates}
+
+    def _get_by_id_statement(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        elem_id: str,
+        for_update: bool,
+        account_id_field: str,
+        account_id_value: Optional[str],
+    ) -> Statement:
+        where_filter = "id = %(id)s"
+        values = {"id": elem_id}
+        account_filter = None
+        if account_id_value and account_id_field:
+            account_filter = account_id_field
+            where_filter += f" AND {account_id_field} = %(account_id)s"
+            values["account_id"] = account_id_value
+        query = self._statement(
+            curs,
+            ("get_by_id", table_name, for_update, account_filter),
+            lambda: psycopg.sql.SQL("SELECT * FROM {tbl} {where} {for_update};").format(
+                tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
+                where=psycopg.sql.SQL(f"WHERE {where_filter}"),
+                for_update=psycopg.sql.SQL("FOR UPDATE" if for_update else ""),
+            ),
+        )
+        return query, values
+
+    def _get_by_ids_statement(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        for_update: bool,
+        account_id_field: Optional[str],
+        account_id_value: Optional[str],
+    ) -> Statement:
+        where_filter = "id = ANY(%(ids)s)"
+        values = {}
+        account_filter = None
+        if account_id_value and account_id_field:
+            account_filter = account_id_field
+            where_filter += f" AND {account_id_field} = %(account_id)s"
+            values["account_id"] = account_id_value
+        # rows are locked in id order, so concurrent multi-gets cannot deadlock
+        query = self._statement(
+            curs,
+            ("get_by_ids", table_name, for_update, account_filter),
+            lambda: psycopg.sql.SQL("SELECT * FROM {tbl} {where} ORDER BY id {for_update};").format(
+                tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
+                where=psycopg.sql.SQL(f"WHERE {where_filter}"),
+                for_update=psycopg.sql.SQL("FOR UPDATE" if for_update else ""),
+            ),
+        )
+        return query, values
+
+    def _get_by_ids_chunks(self, elem_ids: List[str]) -> Iterator[List[str]]:
+        unique_ids = list(dict.fromkeys(elem_ids))
+        for i in range(0, len(unique_ids), self.get_by_ids_chunk_size):
+            yield unique_ids[i : i + self.get_by_ids_chunk_size]
+
+    def _get_by_ids_result(
+        self, elem_ids: List[str], rows: Dict[str, dict], missing: MISSING_POLICY
+    ) -> List[dict]:
+        if missing == "raise" and (not_found := [x for x in elem_ids if x not in rows]):
+            msg = f"elements not found for ids={not_found}"
+            raise StoreErrors.NotFound(msg)
+        return [rows[x] for x in elem_ids if x in rows]
+
+    def _delete_statement(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        elem_id: str,
+        account_id_field: str,
+        account_id_value: Optional[str],
+    ) -> Statement:
+        where_filter = "id = %(id)s"
+        values = {"id": elem_id}
+        account_filter = None
+        if account_id_value and account_id_field:
+            account_filter = account_id_field
+            where_filter += f" AND {account_id_field} = %(account_id)s"
+            values["account_id"] = account_id_value
+        query = self._statement(
+            curs,
+            ("delete", table_name, account_filter),
+            lambda: psycopg.sql.SQL("DELETE FROM {tbl} {where};").format(
+                tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
+                where=psycopg.sql.SQL(f"WHERE {where_filter}"),
+            ),
+        )
+        return query, values
+
+    def _bulk_batches(
+        self, items: List[dict], batch_size: Optional[int]
+    ) -> Iterator[Tuple[datetime, List[dict]]]:
+        batch_size = batch_size or self.bulk_batch_size
+        for i in range(0, len(items), batch_size):
+            yield self._utcnow(), items[i : i + batch_size]
+
+    def _upsert_many_statement(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        columns: Tuple[str, ...],
+        conflict_target: Tuple[str, ...],
+        supported_attributes: List[str],
+    ) -> str:
+        updates = tuple(
+            k for k in supported_attributes if k in columns and k not in conflict_target
+        )
+        sql = psycopg.sql
+        tbl = sql.Identifier(curs.schema_name, table_name)
+        cols = sql.SQL(", ").join(map(sql.Identifier, columns))
+        return self._statement(
+            curs,
+            ("upsert_many", table_name, columns, conflict_target, updates),
+            lambda: sql.SQL(
+                """
+                INSERT INTO {tbl} ({cols}, created_at, updated_at)
+                SELECT {cols}, %(now)s, %(now)s
+                FROM jsonb_populate_recordset(NULL::{tbl}, %(rows)s::JSONB)
+                ON CONFLICT ({target}) DO UPDATE SET {updates}
+                RETURNING *;
+                """
+            ).format(
+                tbl=tbl,
+                cols=cols,
+                target=sql.SQL(", ").join(map(sql.Identifier, conflict_target)),
+                updates=sql.SQL(", ").join(
+                    sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(k))
+                    for k in (*updates, "updated_at")
+                ),
+            ),
+        )
+
+    def _upsert_many_batches(
+        self,
+        items: List[dict],
+        columns: Optional[List[str]],
+        batch_size: Optional[int],
+    ) -> Iterator[Tuple[Tuple[str, ...], dict]]:
+        # items with different keys go in different statements,
+        # so that the missing keys do not overwrite the existing rows with NULL
+        groups: Dict[Tuple[str, ...], List[dict]] = {}
+        for item in items:
+            item.setdefault("id", self._create_id())
+            cols = tuple(
+                k
+                for k in dict.fromkeys([*(columns or item.keys()), "id"])
+                if k in item and k not in ("created_at", "updated_at")
+            )
+            groups.setdefault(cols, []).append({k: recordset_value(item[k]) for k in cols})
+        for cols, group in groups.items():
+            for now, batch in self._bulk_batches(group, batch_size):
+                yield cols, {"now": now, "rows": PgJson(batch)}
+
+    def _update_many_statement(
+        self, curs: StoreCursor, table_name: str, columns: Tuple[str, ...]
+    ) -> str:
+        sql = psycopg.sql
+        tbl = sql.Identifier(curs.schema_name, table_name)
+        return self._statement(
+            curs,
+            ("update_many", table_name, columns),
+            lambda: sql.SQL(
+                """
+                UPDATE {tbl} AS t SET {updates}, updated_at = %(now)s
+                FROM jsonb_populate_recordset(NULL::{tbl}, %(rows)s::JSONB) AS v
+                WHERE t.id = v.id RETURNING t.*;
+                """
+            ).format(
+                tbl=tbl,
+                updates=sql.SQL(", ").join(
+                    sql.SQL("{col} = v.{col}").format(col=sql.Identifier(k)) for k in columns
+                ),
+            ),
+        )
+
+    def _update_many_batches(
+        self, supported_attributes: List[str], items: List[dict], batch_size: Optional[int]
+    ) -> Iterator[Tuple[Tuple[str, ...], dict]]:
+        # items updating different columns go in different statements,
+        # so that the missing keys are not set to NULL
+        groups: Dict[Tuple[str, ...], List[dict]] = {}
+        for item in items:
+            if not (cols := tuple(k for k in supported_attributes if k in item)):
+                raise StoreErrors.BaseError("at least one field to update must be passed")
+            row = {"id": item["id"], **{k: recordset_value(item[k]) for k in cols}}
+            groups.setdefault(cols, []).append(row)
+        for cols, group in groups.items():
+            for now, batch in self._bulk_batches(group, batch_size):
+                yield cols, {"now": now, "rows": PgJson(batch)}
+
+    def _list_request(self, req: "UsecaseListReq") -> "UsecaseListReq":
+        # imported here since the usecases module depends on the stores one
+        from base.common.usecases import Pagination
+
+        return Pagination.parse_cursor(req.cursor, type(req)) if req.cursor else req
+
+    @staticmethod
+    def _list_keys(sorting: Optional[SortingSequence]) -> List[Tuple[str, str]]:
+        keys = [(x.field, x.order.value) for x in sorting or [] if x.field != "id"]
+        # the id breaks ties following the last direction, unless it is explicitly sorted
+        id_order = next((x.order.value for x in sorting or [] if x.field == "id"), None)
+        keys.append(("id", id_order or (keys[-1][1] if keys else "ASC")))
+        return keys
+
+    def _list_statement(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        req: "UsecaseListReq",
+        limit: int,
+        sorting: Optional[SortingSequence] = None,
+        filters: Optional[dict] = None,
+    ) -> Statement:
+        keys = self._list_keys(sorting)
+        filters = filters or {}
+        bounds = {b: v for b, v in (("gt", req.iden_gt), ("lt", req.iden_lt)) if v}
+        # the cursor carries the sort values of the bound row, which is then not read back:
+        # the next page is found even if that row has been deleted in the meantime
+        literals = {}
+        for bound, values in (("gt", req.keys_gt), ("lt", req.keys_lt)):
+            if bound in bounds and values and all(k in values for k, _ in keys[:-1]):
+                row = {"id": bounds[bound], **{k: values[k] for k, _ in keys[:-1]}}
+                literals[f"keys_{bound}"] = PgJson({k: recordset_value(v) for k, v in row.items()})
+        with_literals = tuple(b for b in bounds if f"keys_{b}" in literals)
+        query = self._statement(
+            curs,
+            ("list", table_name, tuple(keys), tuple(bounds), with_literals, tuple(filters)),
+            lambda: self._compose_list(curs, table_name, keys, bounds, filters, with_literals),
+        )
+        params = {f"f_{k}": v for k, v in filters.items()}
+        params.update({f"iden_{b}": v for b, v in bounds.items()})
+        params.update(literals)
+        params["limit"] = limit + 1
+        return query, params
+
+    def _compose_list(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        keys: List[Tuple[str, str]],
+        bounds: dict,
+        filters: dict,
+        with_literals: Tuple[str, ...] = (),
+    ) -> psycopg.sql.Composable:
+        sql = psycopg.sql
+        tbl = sql.Identifier(curs.schema_name, table_name)
+        anchors, sources = [], []
+        conditions = [
+            sql.SQL("t.{col} = {val}").format(col=sql.Identifier(k), val=sql.Placeholder(f"f_{k}"))
+            for k in filters
+        ]
+        for bound in bounds:
+            after = bound == "gt"
+            if len(keys) == 1:
+                # sorted only by id, the bound is compared directly
+                op = sql.SQL(keyset_operator(keys[0][1], after))
+                conditions.append(
+                    sql.SQL("t.id {op} {val}").format(op=op, val=sql.Placeholder(f"iden_{bound}"))
+                )
+                continue
+            source = f"{bound}_anchor"
+            if bound in with_literals:
+                # the values of the cursor are parsed with the types of the sort columns
+                sources.append(
+                    sql.SQL("jsonb_populate_record(NULL::{tbl}, {val}::JSONB) AS {name}").format(
+                        tbl=tbl,
+                        val=sql.Placeholder(f"keys_{bound}"),
+                        name=sql.Identifier(source),
+                    )
+                )
+            else:
+                # the values of the sort columns are read from the row of the bound id
+                sources.append(sql.Identifier(source))
+                anchors.append(
+                    sql.SQL("{anchor} AS (SELECT {cols} FROM {tbl} WHERE id = {val})").format(
+                        anchor=sql.Identifier(source),
+                        cols=sql.SQL(", ").join(sql.Identifier(k) for k, _ in keys),
+                        tbl=tbl,
+                        val=sql.Placeholder(f"iden_{bound}"),
+                    )
+                )
+            conditions.append(
+                keyset_condition(
+                    keys,
+                    lambda k, a=source: sql.SQL("{}.{}").format(
+                        sql.Identifier(a), sql.Identifier(k)
+                    ),
+                    after,
+                )
+            )
+        query = sql.SQL("SELECT t.* FROM {tbl} AS t").format(tbl=tbl)
+        if anchors:
+            query = sql.SQL("WITH {anchors} {query}").format(
+                anchors=sql.SQL(", ").join(anchors), query=query
+            )
+        query += sql.SQL("").join(sql.SQL(", {}").format(x) for x in sources)
+        if conditions:
+            query += sql.SQL(" WHERE {}").format(sql.SQL(" AND ").join(conditions))
+        if "lt" in bounds and "gt" not in bounds:
+            # the page just before the bound is read backwards, then reversed
+            keys = [(k, "DESC" if o == "ASC" else "ASC") for k, o in keys]
+        order = sql.SQL(", ").join(
+            sql.SQL("t.{col} {order}").format(col=sql.Identifier(k), order=sql.SQL(o))
+            for k, o in keys
+        )
+        return query + sql.SQL(" ORDER BY {order} LIMIT %(limit)s;").format(order=order)
+
+    def _list_page(
+        self,
+        req: "UsecaseListReq",
+        rows: List[dict],
+        limit: int,
+        sorting: Optional[SortingSequence] = None,
+    ) -> Tuple[List[dict], "Pagination"]:
+        from base.common.usecases import Pagination
+
+        backward = bool(req.iden_lt and not req.iden_gt)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+        if not has_more:
+            return rows, Pagination(has_more=False)
+        # backwards, the next page is the one before the first row
+        edge, bound = (rows[0], "lt") if backward else (rows[-1], "gt")
+        values = {k: edge[k] for k, _ in self._list_keys(sorting)[:-1]} or None
+        next_req = req.model_copy(
+            update={f"iden_{bound}": edge["id"], f"keys_{bound}": values, "cursor": None}
+        )
+        return rows, Pagination(after_cursor=Pagination.create_cursor(next_req), has_more=has_more)
+
+    def _stream_statement(
+        self,
+        curs: StoreCursor,
+        table_name: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[dict] = None,
+    ) -> Statement:
+        filters = filters or {}
+        query = self._statement(
+            curs,
+            ("stream", table_name, tuple(columns or ()), tuple(filters)),
+            lambda: psycopg.sql.SQL("SELECT {cols} FROM {tbl} {where} ORDER BY id;").format(
+                cols=(
+                    psycopg.sql.SQL(", ").join(map(psycopg.sql.Identifier, columns))
+                    if columns
+                    else psycopg.sql.SQL("*")
+                ),
+                tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
+                where=(
+                    psycopg.sql.SQL("WHERE {}").format(
+                        psycopg.sql.SQL(" AND ").join(
+                            psycopg.sql.SQL("{col} = {val}").format(
+                                col=psycopg.sql.Identifier(k), val=psycopg.sql.Placeholder(k)
+                            )
+                            for k in filters
+                        )
+                    )
+                    if filters
+                    else psycopg.sql.SQL("")
+                ),
+            ),
+        )
+        return query, filters
+
+    def _stream_cursor_options(self, as_tuples: bool) -> dict:
+        return {
+            # named cursors live on the server, the name must be unique in the transaction
+            "name": f"stream_{self._create_id().lower()}",
+            "row_factory": psycopg.rows.tuple_row if as_tuples else psycopg.rows.dict_row,
+        }
+
+
+class PostgresRepo(BasePostgresRepo, abc.ABC):
     def _insert(
         self,
         curs: PostgresCursor,
         table_name: str,
         item: dict,
     ) -> dict:
-        item["id"] = self._create_id()
-        item["created_at"] = item["updated_at"] = self._utcnow()
-        placeholders = [psycopg.sql.SQL(f"%({k})s{cast_token(v)}") for k, v in item.items()]
-        query = psycopg.sql.SQL(
-            "INSERT INTO {tbl} ({cols}) VALUES ({placeholders}) RETURNING *;"
-        ).format(
-            tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
-            cols=psycopg.sql.SQL(", ").join(map(psycopg.sql.Identifier, item)),
-            placeholders=psycopg.sql.SQL(", ").join(placeholders),
+        query, params = self._insert_statement(curs, table_name, item)
+        try:
+            curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+            # in pipeline mode the error is raised when the result is fetched
+            return curs.cursor.fetchone()
+        except psycopg.errors.UniqueViolation as err:
+            msg = f"unique violation: {err}"
+            raise StoreErrors.DuplicateKey(msg)
+
+    def _insert_many(
+        self,
+        curs: PostgresCursor,
+        table_name: str,
+        items: List[dict],
+        returning: bool = False,
+    ) -> List[dict]:
+        """Inserts the items with a COPY for every set of keys, so that the missing keys get
+        the column defaults; the ids and dates are set on the items. With `returning` the
+        inserted rows are read back from the table in the same order."""
+        groups: Dict[Tuple[str, ...], List[dict]] = {}
+        for item in items:
+            groups.setdefault(tuple(sorted(item)), []).append(item)
+        for keys, group in groups.items():
+            self._insert_stream(curs=curs, table_name=table_name, items=group, columns=list(keys))
+        if not returning or not (ids := [x["id"] for x in items]):
+            return items
+        return self._get_by_ids(curs=curs, table_name=table_name, elem_ids=ids)
+
+    def _insert_stream(
+        self,
+        curs: PostgresCursor,
+        table_name: str,
+        items: Iterable[dict],
+        columns: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Loads the items through `COPY ... FROM STDIN`, consuming the iterable lazily.
+        The columns are the passed ones or the keys of the first item, every item must have
+        them all and no other key; returns the new ids. COPY is not supported on pipeline
+        sessions."""
+        items = iter(items)
+        if (first := next(items, None)) is None:
+            return []
+        now = self._utcnow()
+        cols = tuple(dict.fromkeys([*(columns or first.keys()), "id", "created_at", "updated_at"]))
+        expected = set(cols)
+        query = self._statement(
+            curs,
+            ("copy", table_name, cols),
+            lambda: psycopg.sql.SQL("COPY {tbl} ({cols}) FROM STDIN;").format(
+                tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
+                cols=psycopg.sql.SQL(", ").join(map(psycopg.sql.Identifier, cols)),
+            ),
         )
+        ids = []
         try:
-            curs.cursor.execute(
-                query=query,
-                params={k: PgJson(v) if isinstance(v, dict) else v for k, v in item.items()},
-            )
+            with curs.cursor.copy(query) as copy:
+                for item in itertools.chain([first], items):
+                    if mismatched := expected.symmetric_difference(
+                        [*item, "id", "created_at", "updated_at"]
+                    ):
+                        # a NULL would override the column default, an extra key would be lost
+                        msg = f"item keys do not match the copied columns: {sorted(mismatched)}"
+                        raise StoreErrors.BaseError(msg)
+                    item["id"] = self._create_id()
+                    item["created_at"] = item["updated_at"] = now
+                    ids.append(item["id"])
+                    copy.write_row([copy_value(item.get(k)) for k in cols])
         except psycopg.errors.UniqueViolation as err:
             msg = f"unique violation: {err}"
             raise StoreErrors.DuplicateKey(msg)
-        return curs.cursor.fetchone()
+        return ids
+
+    def _upsert_many(
+        self,
+        curs: PostgresCursor,
+        table_name: str,
+        items: List[dict],
+        supported_attributes: List[str],
+        conflict_target: Tuple[str, ...] = ("id",),
+        columns: Optional[List[str]] = None,
+        batch_size: Optional[int] = None,
+    ) -> List[dict]:
+        """Inserts the items, updating the `supported_attributes` of the rows already
+        matching the `conflict_target`, with a statement every `batch_size` items.
+        The written columns are the keys of each item (restricted to `columns` if passed):
+        items with different keys go in different statements, so that a missing key keeps
+        the existing value. The same conflict key cannot appear twice in a batch.
+        Returns the inserted/updated rows, grouped by the keys of the items."""
+        result = []
+        for cols, params in self._upsert_many_batches(items, columns, batch_size):
+            query = self._upsert_many_statement(
+                curs, table_name, cols, tuple(conflict_target), supported_attributes
+            )
+            try:
+                curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+                result.extend(curs.cursor.fetchall())
+            except psycopg.errors.UniqueViolation as err:
+                msg = f"unique violation: {err}"
+                raise StoreErrors.DuplicateKey(msg)
+        return result
+
+    def _update_many(
+        self,
+        curs: PostgresCursor,
+        table_name: str,
+        supported_attributes: List[str],
+        items: List[dict],
+        batch_size: Optional[int] = None,
+    ) -> List[dict]:
+        """Updates the `supported_attributes` of each item by id, with a statement every
+        `batch_size` items. Returns the updated rows, the ids not found are left out."""
+        result = []
+        for cols, params in self._update_many_batches(supported_attributes, items, batch_size):
+            query = self._update_many_statement(curs, table_name, cols)
+            curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+            result.extend(curs.cursor.fetchall())
+        return result
 
     def _update(
         self,
@@ -180,26 +1391,10 @@ class PostgresRepo(Repository, abc.ABC):
         item_id: str,
         **kwargs,
     ) -> dict:
-        if not (updates := {k: kwargs[k] for k in supported_attributes if k in kwargs}):
-            raise StoreErrors.BaseError("at least one field to update must be passed")
-
-        updates["updated_at"] = self._utcnow()
-        query = psycopg.sql.SQL(
-            """
-            UPDATE {tbl} SET {placeholders}
-            WHERE id = %(id)s RETURNING *;
-            """
-        ).format(
-            tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
-            placeholders=psycopg.sql.SQL(", ").join(
-                psycopg.sql.SQL("{col} = {val}").format(
-                    col=psycopg.sql.Identifier(k), val=psycopg.sql.Placeholder(k)
-                )
-                for k in updates.keys()
-            ),
+        query, params = self._update_statement(
+            curs, table_name, supported_attributes, item_id, **kwargs
         )
-
-        curs.cursor.execute(query=query, params={"id": item_id, **updates})
+        curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
         if not (result := curs.cursor.fetchone()):
             msg = f"not found for id={item_id}"
             raise StoreErrors.NotFound(msg)
@@ -214,23 +1409,38 @@ class PostgresRepo(Repository, abc.ABC):
         account_id_field: str,
         account_id_value: Optional[str],
     ) -> dict:
-        where_filter = "id = %(id)s"
-        values = {"id": elem_id}
-        if account_id_value and account_id_field:
-            where_filter += f" AND {account_id_field} = %(account_id)s"
-            values["account_id"] = account_id_value
-        query = psycopg.sql.SQL("SELECT * FROM {tbl} {where} {for_update};").format(
-            tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
-            where=psycopg.sql.SQL(f"WHERE {where_filter}"),
-            for_update=psycopg.sql.SQL("FOR UPDATE" if for_update else ""),
+        query, params = self._get_by_id_statement(
+            curs, table_name, elem_id, for_update, account_id_field, account_id_value
         )
-
-        curs.cursor.execute(query=query, params=values)
+        curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
         if not (result := curs.cursor.fetchone()):
             msg = f"element not found for id={elem_id}"
             raise StoreErrors.NotFound(msg)
         return result
 
+    def _get_by_ids(
+        self,
+        curs: PostgresCursor,
+        table_name: str,
+        elem_ids: List[str],
+        for_update: bool = False,
+        account_id_field: Optional[str] = None,
+        account_id_value: Optional[str] = None,
+        missing: MISSING_POLICY = "raise",
+    ) -> List[dict]:
+        """Fetches the elements with a query every `get_by_ids_chunk_size` ids and returns
+        them in the order of `elem_ids`. Missing ids raise NotFound, or are skipped."""
+        query, params = self._get_by_ids_statement(
+            curs, table_name, for_update, account_id_field, account_id_value
+        )
+        rows = {}
+        for chunk in self._get_by_ids_chunks(elem_ids):
+            curs.cursor.execute(
+                query=query, params={**params, "ids": chunk}, prepare=self.prepare_statements
+            )
+            rows.update((row["id"], row) for row in curs.cursor.fetchall())
+        return self._get_by_ids_result(elem_ids, rows, missing)
+
     def _delete(
         self,
         curs: PostgresCursor,
@@ -239,14 +1449,211 @@ class PostgresRepo(Repository, abc.ABC):
         account_id_field: str,
         account_id_value: Optional[str],
     ):
-        where_filter = "id = %(id)s"
-        values = {"id": elem_id}
-        if account_id_value and account_id_field:
-            where_filter += f" AND {account_id_field} = %(account_id)s"
-            values["account_id"] = account_id_value
-        query = psycopg.sql.SQL("DELETE FROM {tbl} {where};").format(
-            tbl=psycopg.sql.Identifier(curs.schema_name, table_name),
-            where=psycopg.sql.SQL(f"WHERE {where_filter}"),
+        query, params = self._delete_statement(
+            curs, table_name, elem_id, account_id_field, account_id_value
+        )
+        curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+
+    def _list(
+        self,
+        curs: PostgresCursor,
+        table_name: str,
+        req: "UsecaseListReq",
+        limit: int,
+        sorting: Optional[SortingSequence] = None,
+        filters: Optional[dict] = None,
+    ) -> Tuple[List[dict], "Pagination"]:
+        """Keyset pagination on the sorting columns plus the id, so that every page costs
+        as the first one. The sorting columns must be not nullable; `iden_gt` and `iden_lt`
+        bound the rows after/before the given id, with only `iden_lt` the page is the one
+        just before it. The next page starts after the sort values of the last row (before
+        the first one, backwards), carried by the cursor."""
+        req = self._list_request(req)
+        query, params = self._list_statement(curs, table_name, req, limit, sorting, filters)
+        curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+        return self._list_page(req, curs.cursor.fetchall(), limit, sorting)
+
+    def _stream(
+        self,
+        curs: PostgresCursor,
+        table_name: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[dict] = None,
+        itersize: int = 2000,
+        batches: bool = False,
+        as_tuples: bool = False,
+    ) -> Iterator[Union[dict, tuple, List[dict], List[tuple]]]:
+        """Lazily yields the rows (or lists of `itersize` rows with `batches`) ordered by id,
+        through a server-side cursor living in the transaction of `curs`, so only `itersize`
+        rows are held in memory. `as_tuples` skips the creation of a dict for every row."""
+        query, params = self._stream_statement(curs, table_name, columns, filters)
+        options = self._stream_cursor_options(as_tuples)
+        with curs.cursor.connection.cursor(**options) as named:
+            named.itersize = itersize
+            named.execute(query=query, params=params)
+            if not batches:
+                yield from named
+                return
+            while rows := named.fetchmany(itersize):
+                yield rows
+
+
+class AsyncPostgresRepo(BasePostgresRepo, abc.ABC):
+    async def _insert(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        item: dict,
+    ) -> dict:
+        query, params = self._insert_statement(curs, table_name, item)
+        try:
+            await curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+            return await curs.cursor.fetchone()
+        except psycopg.errors.UniqueViolation as err:
+            msg = f"unique violation: {err}"
+            raise StoreErrors.DuplicateKey(msg)
+
+    async def _upsert_many(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        items: List[dict],
+        supported_attributes: List[str],
+        conflict_target: Tuple[str, ...] = ("id",),
+        columns: Optional[List[str]] = None,
+        batch_size: Optional[int] = None,
+    ) -> List[dict]:
+        result = []
+        for cols, params in self._upsert_many_batches(items, columns, batch_size):
+            query = self._upsert_many_statement(
+                curs, table_name, cols, tuple(conflict_target), supported_attributes
+            )
+            try:
+                await curs.cursor.execute(
+                    query=query, params=params, prepare=self.prepare_statements
+                )
+                result.extend(await curs.cursor.fetchall())
+            except psycopg.errors.UniqueViolation as err:
+                msg = f"unique violation: {err}"
+                raise StoreErrors.DuplicateKey(msg)
+        return result
+
+    async def _update_many(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        supported_attributes: List[str],
+        items: List[dict],
+        batch_size: Optional[int] = None,
+    ) -> List[dict]:
+        result = []
+        for cols, params in self._update_many_batches(supported_attributes, items, batch_size):
+            query = self._update_many_statement(curs, table_name, cols)
+            await curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+            result.extend(await curs.cursor.fetchall())
+        return result
+
+    async def _update(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        supported_attributes: List[str],
+        item_id: str,
+        **kwargs,
+    ) -> dict:
+        query, params = self._update_statement(
+            curs, table_name, supported_attributes, item_id, **kwargs
         )
+        await curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+        if not (result := await curs.cursor.fetchone()):
+            msg = f"not found for id={item_id}"
+            raise StoreErrors.NotFound(msg)
+        return result
 
-        curs.cursor.execute(query=query, params=values)
+    async def _get_by_id(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        elem_id: str,
+        for_update: bool,
+        account_id_field: str,
+        account_id_value: Optional[str],
+    ) -> dict:
+        query, params = self._get_by_id_statement(
+            curs, table_name, elem_id, for_update, account_id_field, account_id_value
+        )
+        await curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+        if not (result := await curs.cursor.fetchone()):
+            msg = f"element not found for id={elem_id}"
+            raise StoreErrors.NotFound(msg)
+        return result
+
+    async def _get_by_ids(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        elem_ids: List[str],
+        for_update: bool = False,
+        account_id_field: Optional[str] = None,
+        account_id_value: Optional[str] = None,
+        missing: MISSING_POLICY = "raise",
+    ) -> List[dict]:
+        query, params = self._get_by_ids_statement(
+            curs, table_name, for_update, account_id_field, account_id_value
+        )
+        rows = {}
+        for chunk in self._get_by_ids_chunks(elem_ids):
+            await curs.cursor.execute(
+                query=query, params={**params, "ids": chunk}, prepare=self.prepare_statements
+            )
+            rows.update((row["id"], row) for row in await curs.cursor.fetchall())
+        return self._get_by_ids_result(elem_ids, rows, missing)
+
+    async def _delete(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        elem_id: str,
+        account_id_field: str,
+        account_id_value: Optional[str],
+    ):
+        query, params = self._delete_statement(
+            curs, table_name, elem_id, account_id_field, account_id_value
+        )
+        await curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+
+    async def _list(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        req: "UsecaseListReq",
+        limit: int,
+        sorting: Optional[SortingSequence] = None,
+        filters: Optional[dict] = None,
+    ) -> Tuple[List[dict], "Pagination"]:
+        req = self._list_request(req)
+        query, params = self._list_statement(curs, table_name, req, limit, sorting, filters)
+        await curs.cursor.execute(query=query, params=params, prepare=self.prepare_statements)
+        return self._list_page(req, await curs.cursor.fetchall(), limit, sorting)
+
+    async def _stream(
+        self,
+        curs: AsyncPostgresCursor,
+        table_name: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[dict] = None,
+        itersize: int = 2000,
+        batches: bool = False,
+        as_tuples: bool = False,
+    ) -> AsyncIterator[Union[dict, tuple, List[dict], List[tuple]]]:
+        query, params = self._stream_statement(curs, table_name, columns, filters)
+        options = self._stream_cursor_options(as_tuples)
+        async with curs.cursor.connection.cursor(**options) as named:
+            named.itersize = itersize
+            await named.execute(query=query, params=params)
+            if not batches:
+                async for row in named:
+                    yield row
+                return
+            while rows := await named.fetchmany(itersize):
+                yield rows
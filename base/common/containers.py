@@ -1,4 +1,8 @@
-from base.common.adapters.stores.common import StoreConnection, get_db_instance
+from base.common.adapters.stores.common import (
+    AsyncStoreConnection,
+    StoreConnection,
+    get_db_instance,
+)
 from base.common.settings import AppSettings
 from base.common.utils.logger import Logger
 
@@ -25,6 +29,12 @@ class CtnrApplication:
             config=self.get(AppSettings).store_connection,
             parent_logger=self.get(Logger),
         )
+        if async_class_name := self.get(AppSettings).store_connection.async_class_name:
+            self.singletons[AsyncStoreConnection] = get_db_instance(
+                config=self.get(AppSettings).store_connection,
+                parent_logger=self.get(Logger),
+                class_name=async_class_name,
+            )
 
     def __new__(cls):
         if not hasattr(cls, "_instance"):
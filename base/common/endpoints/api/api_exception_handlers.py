@@ -87,6 +87,8 @@ def store_exception_handler(logger: Logger):
             status_code = 409
         if isinstance(exc, StoreErrors.NotFound):
             status_code = 404
+        if isinstance(exc, StoreErrors.Timeout):
+            status_code = 503
         logger.error(f"Store exception: {exc}")
         error_message = exc.detail
         error_content = format_error_response(status=status_code, message=error_message)
@@ -1,5 +1,5 @@
 import abc
-from typing import Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import AnyHttpUrl, Field
 from pydantic_settings import BaseSettings
@@ -19,6 +19,7 @@ class LoggingSettings(BaseSettings):
 class StoreConnectionSettings(BaseSettings):
     class_name: str = Field(..., alias="STORE_CONNECTION_CLASS_NAME")
     class_name_settings: str = Field(..., alias="STORE_CONNECTION_CLASS_NAME_SETTINGS")
+    async_class_name: Optional[str] = Field(default=None, alias="STORE_ASYNC_CONNECTION_CLASS_NAME")
 
 
 class HttpGatewaySettings(BaseSettings, abc.ABC):
@@ -47,6 +48,28 @@ class PostgresConnectionSettings(StoreConnectionSettings):
     pool_max_lifetime: float = Field(default=3600.0, alias="POSTGRES_POOL_MAX_LIFETIME")
     pool_max_idle: int = Field(default=600, alias="POSTGRES_POOL_MAX_IDLE")
     pool_reconnect_timeout: int = Field(default=180, alias="POSTGRES_POOL_RECONNECT_TIMEOUT")
+    pool_check_interval_seconds: float = Field(
+        default=60.0, alias="POSTGRES_POOL_CHECK_INTERVAL_SECONDS"
+    )
+    pool_check_on_checkout: bool = Field(default=True, alias="POSTGRES_POOL_CHECK_ON_CHECKOUT")
+    # comma separated list of host[:port] of the read replicas
+    replica_hosts: str = Field(default="", alias="POSTGRES_REPLICA_HOSTS")
+    replica_selection: Literal["round_robin", "least_busy"] = Field(
+        default="round_robin", alias="POSTGRES_REPLICA_SELECTION"
+    )
+    replica_checkout_timeout: float = Field(default=2.0, alias="POSTGRES_REPLICA_CHECKOUT_TIMEOUT")
+    replica_retry_seconds: float = Field(default=30.0, alias="POSTGRES_REPLICA_RETRY_SECONDS")
+    # json/jsonb codec: auto (orjson when installed), json, orjson or a registered one
+    json_codec: str = Field(default="auto", alias="POSTGRES_JSON_CODEC")
+    # default timeouts of the sessions, sent as startup options only when set (PgBouncer
+    # rejects them), otherwise the ones of the server apply
+    statement_timeout_ms: Optional[int] = Field(default=None, alias="POSTGRES_STATEMENT_TIMEOUT_MS")
+    lock_timeout_ms: Optional[int] = Field(default=None, alias="POSTGRES_LOCK_TIMEOUT_MS")
+    # statements slower than this are logged, with the plan of a sample of the reads
+    slow_query_ms: Optional[float] = Field(default=None, alias="POSTGRES_SLOW_QUERY_MS")
+    slow_query_explain_sample_rate: float = Field(
+        default=0.0, alias="POSTGRES_SLOW_QUERY_EXPLAIN_SAMPLE_RATE"
+    )
 
 
 class MongoConnectionSettings(StoreConnectionSettings):
@@ -69,6 +92,13 @@ class DynamoDbConnectionSettings(StoreConnectionSettings):
     )
 
 
+class InMemoryDynamoDbConnectionSettings(DynamoDbConnectionSettings):
+    # key schema of the tables and of their indexes, e.g. {"gsi1": ["gsi1pk", "gsi1sk"]}
+    hash_key: str = Field(default="pk", alias="DYNAMO_MEMORY_HASH_KEY")
+    range_key: Optional[str] = Field(default="sk", alias="DYNAMO_MEMORY_RANGE_KEY")
+    indexes: Dict[str, List[Optional[str]]] = Field(default={}, alias="DYNAMO_MEMORY_INDEXES")
+
+
 class WebAPISettings(BaseSettings):
     title: str = Field(..., alias="WEBAPP_TITLE")
     root_path: Optional[str] = Field(default=None, alias="WEBAPP_ROOT_PATH")
@@ -1,13 +1,13 @@
 import abc
 import base64
 import json
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from datetime import datetime
-from typing import Any, Optional, Type
+from typing import Any, Dict, Optional, Type, Union
 
 from pydantic import BaseModel, ConfigDict
 
-from base.common.adapters.stores.common import StoreConnection
+from base.common.adapters.stores.common import AsyncStoreConnection, SessionMetrics, StoreConnection
 from base.common.endpoints.security import ADMIN_GROUP
 from base.common.utils.context import CallContext
 from base.common.utils.logger import Logger
@@ -34,25 +34,57 @@ class UsecaseErrors:
 
 
 class WithStoreConnection(abc.ABC):
-    conn: StoreConnection
+    conn: Union[StoreConnection, AsyncStoreConnection]
     logger: Logger
 
     @staticmethod
     def is_admin() -> bool:
         return ADMIN_GROUP in CallContext.get_authenticated_user().groups
 
+    def session_log(self) -> Dict[str, Any]:
+        """Metrics of the last store session, if the connection recorded any"""
+        metrics = getattr(self.conn, "last_session_metrics", lambda: None)()
+        return {"store": asdict(metrics)} if isinstance(metrics, SessionMetrics) else {}
+
     @staticmethod
-    def with_cursor(autocommit=False):
+    def with_cursor(autocommit=False, **options):
+        """Options are passed to the store cursor, e.g. `pipeline` or `statement_timeout_ms`
+        for postgres, `read_only` for postgres and mongo"""
+
         def actual_decorator(func):
             def inner(*args, **kwargs):
                 self: WithStoreConnection = args[0]
                 self.logger.info("starting usecase", req=kwargs.get("req"))
+                session = {}
                 if kwargs.get("curs"):
                     res = func(*args, **kwargs)
                 else:
-                    with self.conn.cursor(autocommit) as curs:
+                    with self.conn.cursor(autocommit, **options) as curs:
                         res = func(*args, **kwargs, curs=curs)
-                self.logger.info("usecase finished")
+                    session = self.session_log()
+                self.logger.info("usecase finished", **session)
+                return res
+
+            return inner
+
+        return actual_decorator
+
+    @staticmethod
+    def with_async_cursor(autocommit=False, **options):
+        """Same as `with_cursor`, for coroutine usecases running on an AsyncStoreConnection"""
+
+        def actual_decorator(func):
+            async def inner(*args, **kwargs):
+                self: WithStoreConnection = args[0]
+                self.logger.info("starting usecase", req=kwargs.get("req"))
+                session = {}
+                if kwargs.get("curs"):
+                    res = await func(*args, **kwargs)
+                else:
+                    async with self.conn.cursor(autocommit, **options) as curs:
+                        res = await func(*args, **kwargs, curs=curs)
+                    session = self.session_log()
+                self.logger.info("usecase finished", **session)
                 return res
 
             return inner
@@ -87,13 +119,20 @@ class UsecaseListReq(UsecaseReq):
 
     iden_lt: Optional[str] = None
     iden_gt: Optional[str] = None
+    # values of the sorting columns of the `iden_gt`/`iden_lt` rows, set by the pagination cursor
+    keys_lt: Optional[Dict[str, Any]] = None
+    keys_gt: Optional[Dict[str, Any]] = None
     cursor: Optional[PaginationCursor] = None
 
 
 class Usecase(WithStoreConnection):
     """Base skeleton for use cases."""
 
-    def __init__(self, parent_logger: Logger, conn: Optional[StoreConnection]):
+    def __init__(
+        self,
+        parent_logger: Logger,
+        conn: Optional[Union[StoreConnection, AsyncStoreConnection]],
+    ):
         self.logger = parent_logger.child(f"usecase.{self.__module__.split('.')[-1]}")
         self.conn = conn
 
@@ -1,5 +1,10 @@
+import threading
+
 import pytest
 
+from tests.helpers import TEST_TABLE
+from tests.mongo_server import FakeMongoServer
+
 
 @pytest.fixture(scope="session")
 def monkeypatch_session():
@@ -33,3 +38,119 @@ def configs_env(monkeypatch_session: pytest.MonkeyPatch):
     monkeypatch_session.setenv("ADMIN_AUTH_ID", "tokenauthid")
     monkeypatch_session.setenv("EXAMPLE_GATEWAY_URL", "http://example-gateway")
     monkeypatch_session.setenv("ACCOUNT_ID", "account-id")
+
+
+@pytest.fixture(scope="module")
+def pg_conn():
+    # import inside fixture so env vars monkeypatch is applied first
+    from base.common.adapters.stores.postgres import PostgresConnection
+    from base.common.settings import PostgresConnectionSettings
+    from base.common.utils.logger import BasicLogger
+
+    conn = PostgresConnection(
+        config=PostgresConnectionSettings(), parent_logger=BasicLogger("bench")
+    )
+    with conn.cursor() as curs:
+        curs.cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {curs.schema_name};")
+        curs.cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {curs.schema_name}.{TEST_TABLE} (
+                "id"            VARCHAR(36) PRIMARY KEY,
+                "created_at"    TIMESTAMP WITH TIME ZONE,
+                "updated_at"    TIMESTAMP WITH TIME ZONE,
+                "name"          VARCHAR(64),
+                "counter"       INTEGER,
+                "json_data"     JSONB,
+                "price"         NUMERIC,
+                "payload"       BYTEA
+            );
+            """
+        )
+    yield conn
+    with conn.cursor() as curs:
+        curs.cursor.execute(f"DROP TABLE IF EXISTS {curs.schema_name}.{TEST_TABLE};")
+    conn.close()
+
+
+@pytest.fixture
+def pg_curs(pg_conn):
+    with pg_conn.cursor() as curs:
+        curs.cursor.execute(f"TRUNCATE {curs.schema_name}.{TEST_TABLE};")
+        yield curs
+
+
+@pytest.fixture
+def pg_repo():
+    from base.common.adapters.stores.postgres import PostgresRepo
+
+    return PostgresRepo()
+
+
+@pytest.fixture
+def dynamo_conn(monkeypatch):
+    from base.common.adapters.stores.dynamo import DynamoDbConnection
+    from base.common.settings import DynamoDbConnectionSettings
+    from base.common.utils.logger import BasicLogger
+
+    monkeypatch.setenv("NAWS_REGION", "eu-west-1")
+    monkeypatch.setenv("DYNAMO_ONE_TABLE_NAME", "bench-table")
+    return DynamoDbConnection(
+        config=DynamoDbConnectionSettings(), parent_logger=BasicLogger("bench")
+    )
+
+
+@pytest.fixture
+def memory_conn(monkeypatch):
+    from base.common.adapters.stores.common import get_db_instance
+    from base.common.settings import StoreConnectionSettings
+    from base.common.utils.logger import BasicLogger
+
+    monkeypatch.setenv("NAWS_REGION", "eu-west-1")
+    monkeypatch.setenv("DYNAMO_ONE_TABLE_NAME", "bench-table")
+    monkeypatch.setenv("DYNAMO_MEMORY_INDEXES", '{"gsi1": ["gsi1pk", "gsi1sk"]}')
+    monkeypatch.setenv(
+        "STORE_CONNECTION_CLASS_NAME", "base.common.adapters.stores.InMemoryDynamoDbConnection"
+    )
+    monkeypatch.setenv(
+        "STORE_CONNECTION_CLASS_NAME_SETTINGS",
+        "base.common.settings.InMemoryDynamoDbConnectionSettings",
+    )
+    return get_db_instance(StoreConnectionSettings(), BasicLogger("bench"))
+
+
+@pytest.fixture
+def memory_repo():
+    from base.common.adapters.stores.dynamo import DynamoDbRepo
+
+    class Repo(DynamoDbRepo):
+        def _get_key_names(self):
+            return ["pk", "sk"]
+
+        def _insert_primary_key(self, item: dict) -> dict:
+            item["pk"], item["sk"] = f"ACCOUNT#{item['n'] % 10}", f"ITEM#{item['n']:06}"
+            item["gsi1pk"], item["gsi1sk"] = f"PARITY#{item['n'] % 2}", item["n"]
+            return {"pk": item["pk"], "sk": item["sk"]}
+
+    return Repo()
+
+
+@pytest.fixture
+def mongo_server():
+    server = FakeMongoServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mongo_conn(monkeypatch, mongo_server):
+    from base.common.adapters.stores.mongo import MongoConnection
+    from base.common.settings import MongoConnectionSettings
+    from base.common.utils.logger import BasicLogger
+
+    monkeypatch.setenv("MONGO_URI_STRINGS", f"mongodb://{mongo_server.address}")
+    monkeypatch.setenv("MONGO_DB", "bench-database")
+    conn = MongoConnection(config=MongoConnectionSettings(), parent_logger=BasicLogger("bench"))
+    yield conn
+    conn.connection.close()
@@ -0,0 +1,44 @@
+import time
+
+TEST_TABLE = "test_table"
+
+
+def timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def best_of(func, repeat: int = 3) -> float:
+    return min(timed(func) for _ in range(repeat))
+
+
+def report(name: str, seconds: float, ops: int):
+    print(f"\n{name}: {seconds * 1000:.2f}ms total, {seconds / ops * 1e6:.1f}us/op")
+
+
+def bench_items(n: int):
+    return [{"name": f"name-{i}", "counter": i, "json_data": {"idx": i}} for i in range(n)]
+
+
+def realistic_item(i: int) -> dict:
+    from datetime import date, datetime
+    from decimal import Decimal
+
+    return {
+        "pk": f"ACCOUNT#{i}",
+        "sk": f"ORDER#{i:08}",
+        "created_at": datetime(2024, 5, 1, 10, 30, i % 60, 123456),
+        "updated_at": datetime(2024, 5, 2, 11, 0, i % 60),
+        "delivery_date": date(2024, 5, 10),
+        "amount": 12.5 + i,
+        "quantity": i,
+        "active": i % 2 == 0,
+        "notes": None,
+        "tags": ["a", "b", "c"],
+        "address": {"street": "Main St", "number": Decimal(i), "zip": "00100"},
+        "lines": [
+            {"sku": f"SKU-{j}", "qty": Decimal(j), "price": Decimal("9.99")} for j in range(10)
+        ],
+        **{f"attr_{j}": f"value-{j}" for j in range(15)},
+    }
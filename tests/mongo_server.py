@@ -0,0 +1,189 @@
+import socketserver
+import struct
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+import bson
+
+OP_REPLY, OP_QUERY, OP_MSG = 1, 2004, 2013
+MISSING = object()
+
+
+def evaluate(expr, doc: dict):
+    """The aggregation expressions used by the update pipelines of the repos"""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:], MISSING)
+    if isinstance(expr, list):
+        return [evaluate(x, doc) for x in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if "$literal" in expr:
+        return expr["$literal"]
+    if "$ifNull" in expr:
+        values = [evaluate(x, doc) for x in expr["$ifNull"]]
+        return next((x for x in values if x not in (None, MISSING)), values[-1])
+    if "$mergeObjects" in expr:
+        merged = {}
+        for x in expr["$mergeObjects"]:
+            merged.update(evaluate(x, doc))
+        return merged
+    values = {k: evaluate(v, doc) for k, v in expr.items()}
+    return {k: v for k, v in values.items() if v is not MISSING}
+
+
+class FakeMongoServer(socketserver.ThreadingTCPServer):
+    """Replica set primary speaking the wire protocol, enough for pymongo to connect and run
+    simple commands: equality finds, inserts with duplicate key errors, $set, replacement and
+    $replaceWith pipeline updates, with upserts.
+    Transactions are accepted but not isolated; every command is recorded"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeMongoHandler)
+        self.address = f"127.0.0.1:{self.server_address[1]}"
+        self.collections = {}
+        # unique fields of each collection, besides the _id
+        self.unique_fields: Dict[str, List[str]] = {}
+        self.commands: List[dict] = []
+        self.lock = threading.Lock()
+
+    def command(self, doc: dict) -> dict:
+        name = next(iter(doc))
+        with self.lock:
+            self.commands.append(doc)
+            handler = getattr(self, f"cmd_{name.lower()}", None)
+            return handler(doc) if handler else {"ok": 1}
+
+    def cmd_hello(self, doc: dict) -> dict:
+        return {
+            "ok": 1,
+            "helloOk": True,
+            "ismaster": True,
+            "isWritablePrimary": True,
+            "setName": "rs0",
+            "hosts": [self.address],
+            "primary": self.address,
+            "me": self.address,
+            "minWireVersion": 0,
+            "maxWireVersion": 21,
+            "maxBsonObjectSize": 16 * 1024 * 1024,
+            "maxMessageSizeBytes": 48000000,
+            "maxWriteBatchSize": 100000,
+            "logicalSessionTimeoutMinutes": 30,
+            "localTime": datetime.utcnow(),
+            "connectionId": 1,
+        }
+
+    cmd_ismaster = cmd_hello
+
+    def cmd_buildinfo(self, doc: dict) -> dict:
+        return {"ok": 1, "version": "7.0.0", "versionArray": [7, 0, 0, 0]}
+
+    def cmd_find(self, doc: dict) -> dict:
+        items = self.collections.get(doc["find"], {}).values()
+        found = [x for x in items if all(x.get(k) == v for k, v in doc.get("filter", {}).items())]
+        if limit := abs(doc.get("limit", 0)):
+            found = found[:limit]
+        ns = f"{doc['$db']}.{doc['find']}"
+        return {"ok": 1, "cursor": {"firstBatch": found, "id": bson.Int64(0), "ns": ns}}
+
+    def cmd_insert(self, doc: dict) -> dict:
+        collection = self.collections.setdefault(doc["insert"], {})
+        inserted, errors = 0, []
+        unique = self.unique_fields.get(doc["insert"], [])
+        for i, item in enumerate(doc["documents"]):
+            duplicate = next(
+                (
+                    {k: item[k]}
+                    for k in ["_id", *unique]
+                    if k in item and any(x.get(k) == item[k] for x in collection.values())
+                ),
+                None,
+            )
+            if duplicate:
+                errmsg = f"E11000 duplicate key error dup key: {duplicate!r}"
+                errors.append({"index": i, "code": 11000, "errmsg": errmsg, "keyValue": duplicate})
+                if doc.get("ordered", True):
+                    break
+                continue
+            collection[item["_id"]] = item
+            inserted += 1
+        return {"ok": 1, "n": inserted, **({"writeErrors": errors} if errors else {})}
+
+    def cmd_update(self, doc: dict) -> dict:
+        collection = self.collections.setdefault(doc["update"], {})
+        matched, upserted = 0, []
+        for i, update in enumerate(doc["updates"]):
+            query, change = update["q"], update["u"]
+            found = [x for x in collection.values() if all(x.get(k) == v for k, v in query.items())]
+            for item in found[: None if update.get("multi") else 1]:
+                matched += 1
+                collection[item["_id"]] = self.apply_update(item, change)
+            if not found and update.get("upsert"):
+                item = self.apply_update(dict(query), change, inserted=True)
+                if item.get("_id") is None:
+                    item["_id"] = bson.ObjectId()
+                collection[item["_id"]] = item
+                upserted.append({"index": i, "_id": item["_id"]})
+        res = {"ok": 1, "n": matched + len(upserted), "nModified": matched}
+        return {**res, **({"upserted": upserted} if upserted else {})}
+
+    @staticmethod
+    def apply_update(item: dict, change, inserted: bool = False) -> dict:
+        if isinstance(change, list):
+            for stage in change:
+                item = {"_id": item.get("_id"), **evaluate(stage["$replaceWith"], item)}
+            return item
+        if any(k.startswith("$") for k in change):
+            return {
+                **item,
+                **change.get("$set", {}),
+                **(change.get("$setOnInsert", {}) if inserted else {}),
+            }
+        return {"_id": item.get("_id"), **change}
+
+
+class FakeMongoHandler(socketserver.BaseRequestHandler):
+    def recv(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            if not (chunk := self.request.recv(size - len(data))):
+                return b""
+            data += chunk
+        return data
+
+    def handle(self):
+        while header := self.recv(16):
+            length, request_id, _, op_code = struct.unpack("<iiii", header)
+            body = self.recv(length - 16)
+            if op_code == OP_QUERY:
+                # the handshake: flags, collection name, skip, limit, query
+                start = body.index(b"\x00", 4) + 9
+                reply = self.server.command(bson.decode(body[start:]))
+                payload = struct.pack("<iqii", 0, 0, 0, 1) + bson.encode(reply)
+                response_code = OP_REPLY
+            else:
+                reply = self.server.command(self.decode_msg(body))
+                payload = struct.pack("<I", 0) + b"\x00" + bson.encode(reply)
+                response_code = OP_MSG
+            self.request.sendall(
+                struct.pack("<iiii", 16 + len(payload), request_id, request_id, response_code)
+                + payload
+            )
+
+    @staticmethod
+    def decode_msg(body: bytes) -> dict:
+        doc, pos = {}, 4
+        while pos < len(body):
+            kind, size = body[pos], struct.unpack("<i", body[pos + 1 : pos + 5])[0]
+            if kind == 0:
+                doc = {**bson.decode(body[pos + 1 : pos + 1 + size]), **doc}
+            else:
+                end = body.index(b"\x00", pos + 5)
+                docs = bson.decode_all(body[end + 1 : pos + 1 + size])
+                doc[body[pos + 5 : end].decode()] = docs
+            pos += 1 + size
+        return doc
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from tests.helpers import best_of, realistic_item, report, timed
+
+pytestmark = [pytest.mark.slow]
+
+BENCH_CURSORS = 50
+
+
+def test_bench_cursor_acquisition(dynamo_conn):
+    import boto3
+
+    def new_resources():
+        # previous behaviour, a new session and resource for every cursor
+        for _ in range(BENCH_CURSORS):
+            session = boto3.session.Session(region_name=dynamo_conn.opts["region_name"])
+            session.resource("dynamodb", **dynamo_conn.opts)
+
+    def cursors():
+        for _ in range(BENCH_CURSORS):
+            with dynamo_conn.cursor():
+                pass
+
+    before = timed(new_resources)
+    after = timed(cursors)
+
+    report("cursor with new session", before, BENCH_CURSORS)
+    report("cursor with thread cached session", after, BENCH_CURSORS)
+
+
+def test_bench_fast_serialization_path():
+    from base.common.adapters.stores.dynamo import (
+        botodynamodeser,
+        botodynamoser,
+        dynamo_direct_deserializer,
+        dynamo_direct_serializer,
+        dynamo_fast_deserializer,
+        dynamo_fast_serializer,
+    )
+
+    items = [realistic_item(i) for i in range(BENCH_CURSORS * 10)]
+    wire = [{k: botodynamoser(v) for k, v in dynamo_direct_serializer(x).items()} for x in items]
+
+    resource_des = best_of(
+        lambda: [
+            dynamo_direct_deserializer({k: botodynamodeser(v) for k, v in x.items()}) for x in wire
+        ]
+    )
+    fast_des = best_of(lambda: [dynamo_fast_deserializer(x) for x in wire])
+    resource_ser = best_of(
+        lambda: [
+            {k: botodynamoser(v) for k, v in dynamo_direct_serializer(x).items()} for x in items
+        ]
+    )
+    fast_ser = best_of(lambda: [dynamo_fast_serializer(x) for x in items])
+
+    report("resource deserialization", resource_des, len(items))
+    report("fast deserialization", fast_des, len(items))
+    report("resource serialization", resource_ser, len(items))
+    report("fast serialization", fast_ser, len(items))
+
+
+def test_bench_in_memory_dynamo(memory_conn, memory_repo):
+    from boto3.dynamodb.conditions import Key
+
+    ops = 2000
+    database = memory_conn.database
+    handle, engine_seconds = database.handle, []
+
+    def timed_handle(*args, **kwargs):
+        start = time.perf_counter()
+        res = handle(*args, **kwargs)
+        engine_seconds.append(time.perf_counter() - start)
+        return res
+
+    database.handle = timed_handle
+    with memory_conn.cursor() as curs:
+        table = curs.table()
+        for name, func in [
+            ("insert", lambda i: memory_repo._insert(table, {"n": i, **realistic_item(i)})),
+            (
+                "find_one",
+                lambda i: memory_repo._find_one(
+                    table, Key("pk").eq(f"ACCOUNT#{i % 10}") & Key("sk").eq(f"ITEM#{i:06}")
+                ),
+            ),
+            (
+                "update_one",
+                lambda i: memory_repo._update_one(
+                    table,
+                    ["quantity"],
+                    {"pk": f"ACCOUNT#{i % 10}", "sk": f"ITEM#{i:06}"},
+                    quantity=i,
+                ),
+            ),
+        ]:
+            engine_seconds.clear()
+            report(
+                f"in-memory dynamo {name}, repo", timed(lambda: [func(i) for i in range(ops)]), ops
+            )
+            report(f"in-memory dynamo {name}, engine only", sum(engine_seconds), ops)
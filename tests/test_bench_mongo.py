@@ -0,0 +1,76 @@
+from datetime import date
+
+import pytest
+
+from tests.helpers import report, timed
+
+pytestmark = [pytest.mark.slow]
+
+BENCH_CURSORS = 200
+
+
+def test_bench_cursor_without_server_round_trip(mongo_conn, mongo_server):
+    from base.common.adapters.stores.mongo import MongoConnection
+
+    class ServerInfoConnection(MongoConnection):
+        def is_connected(self, connection) -> bool:
+            try:
+                connection.server_info()
+            except Exception:
+                return False
+            return True
+
+    mongo_server.collections["items"] = {"a": {"_id": "a", "n": 1}}
+
+    def find(conn: MongoConnection):
+        for _ in range(BENCH_CURSORS):
+            with conn.cursor() as curs:
+                curs.cursor["items"].find_one({"_id": "a"})
+
+    find(mongo_conn)
+    server_info = ServerInfoConnection.__new__(ServerInfoConnection)
+    server_info.__dict__.update(mongo_conn.__dict__)
+    before = timed(find, server_info)
+    after = timed(find, mongo_conn)
+    report("mongo find with server_info per cursor", before, BENCH_CURSORS)
+    report("mongo find without server round trip", after, BENCH_CURSORS)
+
+
+def test_bench_session_modes(mongo_conn, mongo_server):
+    from base.common.adapters.stores.mongo import MongoRepo
+
+    repo = MongoRepo()
+    mongo_server.collections["items"] = {"a": {"_id": "a", "n": 1}}
+
+    def find(**options):
+        for _ in range(BENCH_CURSORS):
+            with mongo_conn.cursor(**options) as curs:
+                repo._find_one(curs, "items", {"_id": "a"})
+
+    find()
+    for name, options in [
+        ("transaction", {}),
+        ("causal session", {"autocommit": True}),
+        ("secondary preferred", {"read_only": True}),
+    ]:
+        report(f"mongo find in {name}", timed(find, **options), BENCH_CURSORS)
+
+
+def test_bench_insert_many(mongo_conn):
+    from base.common.adapters.stores.mongo import MongoRepo
+
+    repo = MongoRepo()
+    items = [{"n": i, "tags": ["a", "b"], "day": date(2024, 1, 1)} for i in range(1000)]
+
+    def insert_one_by_one():
+        with mongo_conn.cursor() as curs:
+            for item in items:
+                repo._insert(curs, "one_by_one", item)
+
+    def insert_many():
+        with mongo_conn.cursor() as curs:
+            repo._insert_many(curs, "many", items)
+
+    one_by_one, many = timed(insert_one_by_one), timed(insert_many)
+    report("mongo _insert x1000", one_by_one, len(items))
+    report("mongo _insert_many 1000", many, len(items))
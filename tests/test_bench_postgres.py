@@ -0,0 +1,100 @@
+import pytest
+
+from tests.helpers import TEST_TABLE, bench_items, report, timed
+
+pytestmark = [pytest.mark.integration, pytest.mark.slow]
+
+BENCH_ROWS = 2000
+
+
+def test_bench_insert_many_vs_row_by_row(pg_curs, pg_repo):
+    def row_by_row():
+        for item in bench_items(BENCH_ROWS):
+            pg_repo._insert(curs=pg_curs, table_name=TEST_TABLE, item=item)
+
+    loop = timed(row_by_row)
+    bulk = timed(
+        pg_repo._insert_many, curs=pg_curs, table_name=TEST_TABLE, items=bench_items(BENCH_ROWS)
+    )
+
+    report("_insert loop", loop, BENCH_ROWS)
+    report("_insert_many", bulk, BENCH_ROWS)
+
+
+def test_bench_cursor_acquisition_without_pool_check(monkeypatch):
+    from base.common.adapters.stores.postgres import PostgresConnection
+    from base.common.settings import PostgresConnectionSettings
+    from base.common.utils.logger import BasicLogger
+
+    monkeypatch.setenv("POSTGRES_POOL_MIN_SIZE", "20")
+    monkeypatch.setenv("POSTGRES_POOL_MAX_SIZE", "20")
+    conn = PostgresConnection(
+        config=PostgresConnectionSettings(), parent_logger=BasicLogger("bench")
+    )
+    requests = 200
+
+    def acquire(probe_pool: bool):
+        for _ in range(requests):
+            if probe_pool:
+                # previous behaviour of is_connected, probing every idle connection
+                conn.pool.check()
+            with conn.cursor() as curs:
+                curs.cursor.execute("SELECT 1;")
+
+    before = timed(acquire, probe_pool=True)
+    after = timed(acquire, probe_pool=False)
+    conn.close()
+
+    report("cursor with pool.check()", before, requests)
+    report("cursor with checkout check", after, requests)
+
+
+def test_bench_get_by_ids_vs_get_by_id_loop(pg_curs, pg_repo):
+    ids = [x["id"] for x in pg_repo._insert_many(pg_curs, TEST_TABLE, bench_items(BENCH_ROWS))]
+
+    def loop():
+        for elem_id in ids:
+            pg_repo._get_by_id(pg_curs, TEST_TABLE, elem_id, False, None, None)
+
+    before = timed(loop)
+    after = timed(pg_repo._get_by_ids, pg_curs, TEST_TABLE, ids)
+
+    report("_get_by_id loop", before, BENCH_ROWS)
+    report("_get_by_ids", after, BENCH_ROWS)
+
+
+def test_bench_update_many_vs_row_by_row(pg_curs, pg_repo):
+    items = pg_repo._insert_many(pg_curs, TEST_TABLE, bench_items(BENCH_ROWS))
+
+    def row_by_row():
+        for item in items:
+            pg_repo._update(pg_curs, TEST_TABLE, ["counter"], item["id"], counter=item["counter"])
+
+    loop = timed(row_by_row)
+    results = {}
+    for batch_size in (100, 1000):
+        results[batch_size] = timed(
+            pg_repo._update_many, pg_curs, TEST_TABLE, ["counter"], items, batch_size=batch_size
+        )
+    upsert = timed(pg_repo._upsert_many, pg_curs, TEST_TABLE, items, ["counter"])
+
+    report("_update loop", loop, BENCH_ROWS)
+    for batch_size, seconds in results.items():
+        report(f"_update_many batch_size={batch_size}", seconds, BENCH_ROWS)
+    report("_upsert_many", upsert, BENCH_ROWS)
+
+
+def test_bench_json_codecs():
+    from datetime import datetime
+
+    from base.common.adapters.stores.postgres import JsonCodec, OrjsonCodec, orjson_supported
+
+    if not orjson_supported():
+        pytest.skip("orjson extra not installed")
+    payload = {"at": datetime.utcnow(), "items": [{"idx": i, "name": f"n-{i}"} for i in range(200)]}
+    results = {}
+    for codec in (JsonCodec(), OrjsonCodec()):
+        results[type(codec).__name__] = seconds = timed(
+            lambda: [codec.loads(codec.dumps(payload)) for _ in range(BENCH_ROWS)]
+        )
+        report(f"{type(codec).__name__} dumps+loads", seconds, BENCH_ROWS)
@@ -0,0 +1,545 @@
+import itertools
+import threading
+import time
+from typing import List
+
+import pytest
+
+from tests.helpers import realistic_item
+
+
+def test_resources_are_cached_per_thread(dynamo_conn):
+    resources = []
+
+    def acquire():
+        for _ in range(2):
+            with dynamo_conn.cursor() as curs:
+                resources.append(curs.cursor)
+
+    threads = [threading.Thread(target=acquire) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert resources[0] is resources[1]
+    assert resources[2] is resources[3]
+    assert resources[0] is not resources[2]
+
+
+def test_cursor_rejects_unsupported_options(dynamo_conn):
+    from base.common.adapters.stores import StoreErrors
+
+    with pytest.raises(StoreErrors.BaseError, match="read_only"):
+        with dynamo_conn.cursor(read_only=True):
+            pass  # pragma: no cover
+    assert dynamo_conn.stats.snapshot()["sessions"] == 0
+
+
+def test_low_level_requests_need_the_cursor_table(dynamo_conn):
+    from base.common.adapters.stores import StoreErrors
+    from base.common.adapters.stores.dynamo import low_level_client
+
+    with dynamo_conn.cursor() as curs:
+        table = curs.table()
+        assert table.name == "bench-table"
+        assert low_level_client(table) is curs.client is not curs.cursor.meta.client
+        with pytest.raises(StoreErrors.BaseError):
+            low_level_client(curs.cursor.Table("bench-table"))
+
+
+class FakeBatchClient:
+    """Low level client answering batch_get_item, leaving unprocessed half of the first keys"""
+
+    def __init__(self, table_name: str, items: dict):
+        self.table_name = table_name
+        self.items = items
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def batch_get_item(self, RequestItems: dict):
+        request = RequestItems[self.table_name]
+        with self.lock:
+            self.requests.append(len(request["Keys"]))
+            first = len(self.requests) == 1
+        keys = request["Keys"]
+        processed, unprocessed = (
+            (keys[: len(keys) // 2], keys[len(keys) // 2 :]) if first else (keys, [])
+        )
+        res = {
+            "Responses": {
+                self.table_name: [
+                    self.items[x["pk"]["S"]] for x in processed if x["pk"]["S"] in self.items
+                ]
+            }
+        }
+        if unprocessed:
+            res["UnprocessedKeys"] = {self.table_name: {**request, "Keys": unprocessed}}
+        return res
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_find_many_keeps_keys_order(workers):
+    from types import SimpleNamespace
+
+    from base.common.adapters.stores.dynamo import DynamoDbRepo
+
+    class Repo(DynamoDbRepo):
+        batch_backoff_seconds = 0.001
+
+        def _get_key_names(self):
+            return ["pk"]
+
+    items = {f"k{i}": {"pk": {"S": f"k{i}"}, "n": {"N": str(i)}} for i in range(250)}
+    client = FakeBatchClient("bench-table", items)
+    table = SimpleNamespace(name="bench-table", low_level_client=client)
+    keys = [{"pk": f"k{i}"} for i in range(249, -1, -1)] + [{"pk": "missing"}, {"pk": "k3"}]
+
+    found = Repo()._find_many(table, keys, workers=workers)
+
+    assert [x["pk"] for x in found] == [f"k{i}" for i in range(249, -1, -1)] + ["k3"]
+    # 3 chunks of up to 100 keys, plus the retry of the unprocessed keys
+    assert len(client.requests) == 4 and max(client.requests) == 100
+
+
+def test_find_many_maps_client_errors(write_repo):
+    from types import SimpleNamespace
+
+    from botocore.exceptions import ClientError
+
+    from base.common.adapters.stores.common import StoreErrors
+
+    class Client:
+        def batch_get_item(self, RequestItems: dict):
+            error = {"Error": {"Code": "ResourceNotFoundException", "Message": "no table"}}
+            raise ClientError(error, "BatchGetItem")
+
+    repo, _ = write_repo
+    table = SimpleNamespace(name="bench-table", low_level_client=Client())
+
+    with pytest.raises(StoreErrors.BaseError, match="ResourceNotFoundException"):
+        repo._find_many(table, [{"pk": "k1"}])
+
+
+class FakeWriteClient:
+    """Low level client storing the written items, leaving unprocessed the first request"""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.items = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems: dict):
+        with self.lock:
+            self.requests += 1
+            if self.requests == 1:
+                return {"UnprocessedItems": RequestItems}
+            for request in RequestItems[self.table_name]:
+                if put := request.get("PutRequest"):
+                    self.items[put["Item"]["pk"]["S"]] = put["Item"]
+                else:
+                    self.items.pop(request["DeleteRequest"]["Key"]["pk"]["S"])
+        return {}
+
+    def transact_write_items(self, TransactItems: list):
+        from botocore.exceptions import ClientError
+
+        keys = [x["Put"]["Item"]["pk"]["S"] for x in TransactItems]
+        if any(k in self.items for k in keys):
+            reasons = [
+                {"Code": "ConditionalCheckFailed" if k in self.items else "None"} for k in keys
+            ]
+            error = {
+                "Error": {"Code": "TransactionCanceledException"},
+                "CancellationReasons": reasons,
+            }
+            raise ClientError(error, "TransactWriteItems")
+        self.items.update((k, x["Put"]["Item"]) for k, x in zip(keys, TransactItems))
+
+
+@pytest.fixture
+def write_repo():
+    from types import SimpleNamespace
+
+    from base.common.adapters.stores.dynamo import DynamoDbRepo
+
+    class Repo(DynamoDbRepo):
+        batch_backoff_seconds = 0.001
+
+        def _get_key_names(self):
+            return ["pk"]
+
+        def _insert_primary_key(self, item: dict) -> dict:
+            item["pk"] = item.get("pk") or self._create_id()
+            return {"pk": item["pk"]}
+
+    client = FakeWriteClient("bench-table")
+    return Repo(), SimpleNamespace(name="bench-table", low_level_client=client)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_insert_many_and_delete_many(write_repo, workers):
+    repo, table = write_repo
+
+    items = repo._insert_many(table, [{"n": i} for i in range(60)], workers=workers)
+    repo._delete_many(table, [{"pk": x["pk"]} for x in items[:10]], workers=workers)
+
+    assert sorted(table.low_level_client.items) == sorted(x["pk"] for x in items[10:])
+    assert table.low_level_client.requests == 3 + 1 + 1
+    assert all(x["created_at"] == items[0]["created_at"] for x in items)
+
+
+def test_transact_insert_many_keeps_duplicate_key_condition(write_repo):
+    from base.common.adapters.stores.common import StoreErrors
+
+    repo, table = write_repo
+    items = repo._transact_insert_many(table, [{"n": i} for i in range(3)])
+
+    with pytest.raises(StoreErrors.DuplicateKey, match=items[1]["pk"]):
+        repo._transact_insert_many(table, [{"n": 10}, {"pk": items[1]["pk"], "n": 11}])
+    assert len(table.low_level_client.items) == 3
+
+
+class FakeScanClient:
+    """Low level client scanning its items by segment, in pages of 10"""
+
+    def __init__(self, items: List[dict]):
+        self.items = items
+        self.requests = []
+
+    def scan(self, **args):
+        self.requests.append(args)
+        segment = [
+            x for i, x in enumerate(self.items) if i % args["TotalSegments"] == args["Segment"]
+        ]
+        start = args.get("ExclusiveStartKey", {}).get("idx", 0)
+        res = {"Items": [{"pk": {"S": x["pk"]}} for x in segment[start : start + 10]]}
+        res["ConsumedCapacity"] = {"CapacityUnits": 5.0}
+        if start + 10 < len(segment):
+            res["LastEvaluatedKey"] = {"idx": start + 10}
+        return res
+
+
+def test_scan_parallel_streams_every_item(write_repo):
+    from boto3.dynamodb.conditions import Attr
+
+    repo, table = write_repo
+    table.low_level_client = FakeScanClient([{"pk": f"k{i}"} for i in range(200)])
+
+    start = time.perf_counter()
+    items = list(
+        repo._scan_parallel(
+            table,
+            total_segments=4,
+            workers=2,
+            further_condition=Attr("n").gt(1),
+            project_attributes=["pk"],
+            max_capacity_per_second=500,
+        )
+    )
+    elapsed = time.perf_counter() - start
+    first = list(itertools.islice(repo._scan_parallel(table, total_segments=4), 5))
+
+    assert sorted(x["pk"] for x in items) == sorted(f"k{i}" for i in range(200))
+    # 20 pages of 5 units at 500 units per second
+    assert elapsed >= 0.18
+    assert table.low_level_client.requests[0]["ExpressionAttributeValues"] == {":v0": {"N": "1"}}
+    assert len(first) == 5
+
+
+class FakeQueryTable:
+    """Table answering query in pages of at most 10 items, ignoring the conditions"""
+
+    def __init__(self, items: List[dict]):
+        self.items = items
+        self.requests = []
+
+    def query(self, **args):
+        self.requests.append(args)
+        # the keys decoded from a cursor have Decimal numbers
+        start = int(args.get("ExclusiveStartKey", {}).get("idx", 0))
+        end = min(start + min(args.get("Limit", 10), 10), len(self.items))
+        res = {"Items": self.items[start:end]}
+        if end < len(self.items):
+            res["LastEvaluatedKey"] = {"idx": end}
+        return res
+
+
+def test_iter_all_stops_exactly_at_limit(write_repo):
+    from boto3.dynamodb.conditions import Key
+
+    from base.common.adapters.stores.dynamo import decode_start_key, encode_start_key
+
+    repo, _ = write_repo
+    table = FakeQueryTable([{"pk": f"k{i:02}"} for i in range(35)])
+
+    def page(limit, start_key=None):
+        gen = repo._iter_all(
+            table, Key("pk").begins_with("k"), limit=limit, exclusive_start_key=start_key
+        )
+        items = []
+        while True:
+            try:
+                items.append(next(gen))
+            except StopIteration as stop:
+                return items, stop.value
+
+    first, last_key = page(limit=25)
+    second, end_key = page(limit=25, start_key=decode_start_key(encode_start_key(last_key)))
+
+    assert [x["pk"] for x in first + second] == [f"k{i:02}" for i in range(35)]
+    assert [x.get("Limit") for x in table.requests] == [25, 15, 5, 25]
+    assert end_key is None
+    assert repo._find_all(table, Key("pk").begins_with("k"), limit=12) == first[:12]
+
+
+def test_fast_serialization_matches_the_resource_one():
+    from base.common.adapters.stores.dynamo import (
+        botodynamodeser,
+        botodynamoser,
+        dynamo_direct_deserializer,
+        dynamo_direct_serializer,
+        dynamo_fast_deserializer,
+        dynamo_fast_serializer,
+    )
+
+    items = [realistic_item(i) for i in range(100)]
+    wire = [{k: botodynamoser(v) for k, v in dynamo_direct_serializer(x).items()} for x in items]
+
+    assert [dynamo_fast_serializer(x) for x in items] == wire
+    assert [dynamo_fast_deserializer(x) for x in wire] == [
+        dynamo_direct_deserializer({k: botodynamodeser(v) for k, v in x.items()}) for x in wire
+    ]
+
+
+def test_low_level_client_queries(write_repo):
+    from types import SimpleNamespace
+
+    from boto3.dynamodb.conditions import Attr, Key
+
+    from base.common.adapters.stores.dynamo import dynamo_fast_serializer
+
+    class Client:
+        def __init__(self):
+            self.requests = []
+
+        def query(self, **args):
+            self.requests.append(args)
+            start = int(args.get("ExclusiveStartKey", {}).get("idx", {}).get("N", 0))
+            res = {"Items": [dynamo_fast_serializer(realistic_item(start))]}
+            if start < 2:
+                res["LastEvaluatedKey"] = {"idx": {"N": str(start + 1)}}
+            return res
+
+    repo, _ = write_repo
+    repo.use_low_level_client = True
+    table = SimpleNamespace(name="bench-table", low_level_client=Client())
+
+    items = repo._find_all(
+        table, Key("pk").eq("ACCOUNT#0"), further_condition=Attr("quantity").gte(0)
+    )
+    found = repo._find_one(table, Key("pk").eq("ACCOUNT#0"))
+
+    assert items == [{**realistic_item(i), "amount": 12.5 + i} for i in range(3)]
+    assert found["created_at"] == realistic_item(0)["created_at"]
+    assert table.low_level_client.requests[0]["KeyConditionExpression"] == "#n0 = :v0"
+    assert table.low_level_client.requests[0]["ExpressionAttributeValues"] == {
+        ":v0": {"S": "ACCOUNT#0"},
+        ":v1": {"N": "0"},
+    }
+
+
+class FakeCachedTable(FakeQueryTable):
+    """Query table accepting the single item writes, with a batch get client"""
+
+    name = "bench-table"
+
+    def __init__(self, items: List[dict]):
+        super().__init__(items)
+        self.writes = []
+        client = FakeBatchClient(self.name, {x["pk"]: {"pk": {"S": x["pk"]}} for x in items})
+        self.low_level_client = client
+
+    def put_item(self, **args):
+        self.writes.append(args)
+
+    def update_item(self, **args):
+        self.writes.append(args)
+
+    def delete_item(self, **args):
+        self.writes.append(args)
+
+
+def test_item_cache_reads_through_and_invalidates(write_repo):
+    from boto3.dynamodb.conditions import Attr, Key
+
+    repo, _ = write_repo
+
+    class CachedRepo(type(repo)):
+        item_cache_ttl_seconds = 60
+
+    repo = CachedRepo()
+    table = FakeCachedTable([{"pk": "k1"}])
+
+    first = repo._find_one(table, Key("pk").eq("k1"))
+    first["pk"] = "changed"
+    assert repo._find_one(table, Key("pk").eq("k1")) == {"pk": "k1"}
+    repo._find_one(table, Key("pk").eq("k1"), further_condition=Attr("n").gt(1))
+    assert len(table.requests) == 2
+
+    repo._update_one(table, ["n"], {"pk": "k1"}, n=2)
+    repo._find_one(table, Key("pk").eq("k1"))
+    assert len(table.requests) == 3
+
+    repo._insert(table, {"pk": "k2"})
+    repo._find_one(table, Key("pk").eq("k1"))
+    assert len(table.requests) == 4
+
+    # updating another item can change which item a query finds
+    repo._update_one(table, ["n"], {"pk": "k2"}, n=3)
+    repo._find_one(table, Key("pk").eq("k1"))
+    assert len(table.requests) == 5
+
+    with repo.item_cache_bypass():
+        repo._find_one(table, Key("pk").eq("k1"))
+    assert len(table.requests) == 6
+
+    repo._find_many(table, [{"pk": "k1"}, {"pk": "k2"}])
+    assert repo._find_many(table, [{"pk": "k1"}, {"pk": "k2"}]) == [{"pk": "k1"}]
+    repo._delete(table, {"pk": "k1"})
+    repo._find_many(table, [{"pk": "k1"}])
+    # the missing key is requested every time, k1 again after the delete
+    assert table.low_level_client.requests == [2, 1, 1, 1]
+
+    info = CachedRepo.item_cache_info()
+    assert (info.hits, info.misses) == (2, 9)
+    assert info.hit_ratio == 2 / 11
+    assert type(repo).item_cache_info().currsize == 1
+
+
+def test_item_cache_keys_conditions_on_maps(write_repo):
+    from boto3.dynamodb.conditions import Attr, Key
+
+    repo, _ = write_repo
+
+    class CachedRepo(type(repo)):
+        item_cache_ttl_seconds = 60
+
+    repo = CachedRepo()
+    table = FakeCachedTable([{"pk": "k1"}])
+    for meta in [{"a": 1, "b": [{"c": {2}}]}, {"b": [{"c": {2}}], "a": 1}, {"a": 2}]:
+        repo._find_one(table, Key("pk").eq("k1"), further_condition=Attr("meta").eq(meta))
+
+    assert len(table.requests) == 2
+
+
+def test_item_cache_bounds():
+    from base.common.adapters.stores.dynamo import ItemCache, approx_size
+
+    cache = ItemCache(maxsize=3, max_bytes=10 * approx_size({"pk": "k0"}))
+    for i in range(4):
+        cache.set(i, {"pk": f"k{i}"}, [("t", i)], ttl_seconds=60)
+        cache.get(0)
+    assert [cache.get(i) is not None for i in range(4)] == [True, False, True, True]
+
+    cache.set("big", {"pk": "x" * 10000}, [], ttl_seconds=60)
+    cache.set("short", {"pk": "k"}, [], ttl_seconds=0.01)
+    time.sleep(0.02)
+    assert cache.get("big") is None and cache.get("short") is None
+    assert cache.info().currsize == 2 and cache.info().currbytes <= cache.max_bytes
+
+
+def test_in_memory_dynamo_serves_the_repo(memory_conn, memory_repo):
+    from boto3.dynamodb.conditions import Attr, Key
+
+    from base.common.adapters.stores import InMemoryDynamoDbConnection, StoreErrors
+
+    repo = memory_repo
+    assert isinstance(memory_conn, InMemoryDynamoDbConnection)
+    with memory_conn.cursor() as curs:
+        table = curs.table()
+        repo._insert_many(table, [{"n": i, "tags": {"a", "b"}} for i in range(1, 200)], workers=2)
+        repo._transact_insert_many(table, [{"n": 0, "data": {"blob": b"\x00\x01"}}])
+        with pytest.raises(StoreErrors.DuplicateKey):
+            repo._transact_insert_many(table, [{"n": 200}, {"n": 0}])
+        # the resource client would serialize the typed attributes a second time
+        resource_table = curs.cursor.Table(curs.one_table_name)
+        with pytest.raises(StoreErrors.BaseError):
+            repo._insert_many(resource_table, [{"n": 201}])
+        with pytest.raises(StoreErrors.BaseError):
+            repo._find_many(resource_table, [{"pk": "ACCOUNT#1", "sk": "ITEM#000001"}])
+
+        def find_all(condition, **kwargs) -> List[dict]:
+            return repo._find_all(table, condition, project_attributes=["n"], **kwargs)
+
+        account = Key("pk").eq("ACCOUNT#3")
+        between = find_all(account & Key("sk").between("ITEM#000050", "ITEM#000099"))
+        assert [x["n"] for x in between] == [53, 63, 73, 83, 93]
+        descending = find_all(account, further_condition=Attr("n").gt(150), ascending=False)
+        assert [x["n"] for x in descending] == [193, 183, 173, 163, 153]
+        odd = find_all(Key("gsi1pk").eq("PARITY#1") & Key("gsi1sk").lt(10), key_name="gsi1")
+        assert [x["n"] for x in odd] == [1, 3, 5, 7, 9]
+
+        item = repo._find_one(table, Key("pk").eq("ACCOUNT#0") & Key("sk").eq("ITEM#000000"))
+        assert item == {"pk": "ACCOUNT#0", "sk": "ITEM#000000"}
+        repo._update_one(table, ["n"], item, n=1000)
+        assert find_all(Key("pk").eq("ACCOUNT#0") & Key("sk").eq("ITEM#000000")) == [{"n": 1000}]
+
+        keys = [{"pk": f"ACCOUNT#{i % 10}", "sk": f"ITEM#{i:06}"} for i in range(250, -1, -1)]
+        assert len(repo._find_many(table, keys, workers=2)) == 200
+        repo._delete_many(table, keys[-100:])
+        repo._delete(table, keys[-101])
+        assert len(list(repo._scan_parallel(table, total_segments=4, workers=2))) == 99
+
+        repo.use_low_level_client = True
+        assert len(list(repo._iter_all(table, Key("pk").eq("ACCOUNT#1"), page_size=3))) == 10
+
+
+def test_in_memory_scan_resumes_after_writes(memory_conn, memory_repo):
+    from boto3.dynamodb.conditions import Key
+
+    with memory_conn.cursor() as curs:
+        table = curs.table()
+        memory_repo._insert_many(table, [{"n": i} for i in range(10)])
+        seen, start_key = [], {}
+        while True:
+            page = curs.client.scan(TableName=table.name, Limit=3, **start_key)
+            seen.extend(int(x["n"]["N"]) for x in page["Items"])
+            if "LastEvaluatedKey" not in page:
+                break
+            start_key = {"ExclusiveStartKey": page["LastEvaluatedKey"]}
+            # the start item is deleted and a scanned one is updated before the next page
+            last = memory_repo._find_one(table, Key("pk").eq(page["LastEvaluatedKey"]["pk"]["S"]))
+            memory_repo._delete(table, {"pk": last["pk"], "sk": last["sk"]})
+            first = {"pk": f"ACCOUNT#{seen[0] % 10}", "sk": f"ITEM#{seen[0]:06}"}
+            memory_repo._update_one(table, ["m"], first, m=1)
+
+    assert sorted(seen) == list(range(10))
+
+
+def test_in_memory_update_reads_the_item_before_the_update(memory_conn):
+    from botocore.exceptions import ClientError
+
+    key = {"pk": {"S": "ACCOUNT#0"}, "sk": {"S": "ITEM#000000"}}
+    with memory_conn.cursor() as curs:
+        client, name = curs.client, curs.one_table_name
+        client.put_item(TableName=name, Item={**key, "b": {"N": "1"}, "s": {"SS": ["x"]}})
+        res = client.update_item(
+            TableName=name,
+            Key=key,
+            UpdateExpression="SET a = b, c = s ADD b :one, s :y",
+            ExpressionAttributeValues={":one": {"N": "1"}, ":y": {"SS": ["y"]}},
+            ReturnValues="ALL_NEW",
+        )
+        with pytest.raises(ClientError, match="overlap"):
+            client.update_item(
+                TableName=name,
+                Key=key,
+                UpdateExpression="SET b = :one ADD b :one",
+                ExpressionAttributeValues={":one": {"N": "1"}},
+            )
+
+    item = res["Attributes"]
+    assert (item["a"], item["b"]) == ({"N": "1"}, {"N": "2"})
+    assert (item["c"], sorted(item["s"]["SS"])) == ({"SS": ["x"]}, ["x", "y"])
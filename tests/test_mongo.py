@@ -0,0 +1,133 @@
+from datetime import date, datetime
+
+import pytest
+
+
+def test_keeps_the_client_after_connection_errors(mongo_conn, mongo_server):
+    from pymongo.errors import AutoReconnect
+
+    from base.common.adapters.stores import StoreErrors
+
+    client = mongo_conn.connection
+    with mongo_conn.cursor() as curs:
+        curs.cursor["items"].find_one({})
+    assert not any("buildinfo" in x for x in mongo_server.commands)
+
+    for _ in range(2):
+        with pytest.raises(StoreErrors.Connection):
+            with mongo_conn.cursor():
+                raise AutoReconnect("connection reset")
+    # pymongo recovers within the same client, which other threads may be using
+    with mongo_conn.cursor() as curs:
+        curs.cursor["items"].find_one({})
+    assert mongo_conn.connection is client
+    client["bench-database"]["items"].find_one({})
+
+
+def test_session_modes(mongo_conn, mongo_server):
+    from base.common.adapters.stores import StoreErrors
+    from base.common.adapters.stores.mongo import MongoRepo
+
+    repo = MongoRepo()
+    with mongo_conn.cursor() as curs:
+        repo._insert(curs, "items", {"n": 1}, new_id="a")
+    with mongo_conn.cursor(autocommit=True) as curs:
+        assert repo._find_one(curs, "items", {"_id": "a"})["n"] == 1
+    with mongo_conn.cursor(read_only=True) as curs:
+        assert repo._find_one(curs, "items", {"_id": "a"})["n"] == 1
+    with pytest.raises(StoreErrors.BaseError, match="readonly"):
+        with mongo_conn.cursor(readonly=True):
+            pass  # pragma: no cover
+
+    insert, causal_find, secondary_find = [
+        x for x in mongo_server.commands if "insert" in x or "find" in x
+    ]
+    assert insert["startTransaction"] and insert["readConcern"] == {"level": "snapshot"}
+    assert any("commitTransaction" in x for x in mongo_server.commands)
+    for find in causal_find, secondary_find:
+        assert "lsid" in find and "txnNumber" not in find
+        assert find["readConcern"] == {"level": "majority"}
+    assert "$readPreference" not in causal_find
+    assert secondary_find["$readPreference"] == {"mode": "secondaryPreferred"}
+
+
+def test_bulk_writes(mongo_conn, mongo_server):
+    from base.common.adapters.stores import StoreErrors
+    from base.common.adapters.stores.mongo import MongoRepo, WriteRequest
+
+    class Repo(MongoRepo):
+        bulk_write_max_ops = 3
+
+    repo = Repo()
+    with mongo_conn.cursor() as curs:
+        items = repo._insert_many(
+            curs, "items", [{"n": i, "day": date(2024, 1, i)} for i in [1, 2]]
+        )
+        items += repo._insert_many(curs, "items", [{"id": "c", "n": 3}, {"id": "d", "n": 4}])
+        with pytest.raises(StoreErrors.DuplicateKey, match="'c'"):
+            repo._insert_many(curs, "items", [{"id": "e"}, {"id": "c"}, {"id": "f"}])
+        with pytest.raises(StoreErrors.DuplicateKey, match="'c', 'd'"):
+            repo._insert_many(curs, "items", [{"id": x} for x in "cghdi"], ordered=False)
+    stored = mongo_server.collections["items"]
+    assert [x["id"] for x in items[2:]] == ["c", "d"] and items[0]["id"] in stored
+    assert stored[items[0]["id"]]["day"] == datetime(2024, 1, 1)
+    assert all(x["created_at"] == x["updated_at"] for x in stored.values())
+    assert "e" in stored and "f" not in stored
+    assert {"g", "h", "i"} <= set(stored)
+    inserts = [x for x in mongo_server.commands if "insert" in x]
+    assert [len(x["documents"]) for x in inserts] == [2, 2, 3, 3, 2]
+
+    created_at = {k: stored[k]["created_at"] for k in "eg"}
+    with mongo_conn.cursor() as curs:
+        updated = repo._update_many(
+            curs, "items", ["n"], [{"id": "c", "n": 30, "x": 1}, {"id": "missing", "n": 0}]
+        )
+        totals = repo._bulk_write(
+            curs,
+            "items",
+            [
+                WriteRequest.update({"_id": "d"}, {"$set": {"n": 40}}),
+                WriteRequest.replace({"_id": "e"}, {"n": 50}),
+                WriteRequest.replace({"_id": "f"}, {"n": 60}, upsert=True),
+                WriteRequest.replace({"_id": "g"}, {"n": 70, "created_at": None}, upsert=True),
+            ],
+        )
+        with pytest.raises(StoreErrors.BaseError):
+            repo._update_many(curs, "items", ["n"], [{"id": "c", "x": 1}])
+    assert [x["id"] for x in updated] == ["c", "missing"]
+    assert totals == {"inserted": 0, "matched": 3, "modified": 3, "upserted": 1}
+    assert stored["c"]["n"] == 30 and "x" not in stored["c"]
+    assert stored["d"]["n"] == 40 and stored["d"]["updated_at"] > stored["d"]["created_at"]
+    # the replacements keep the creation date, the upserted ones get it
+    assert stored["e"] == {
+        "_id": "e",
+        "n": 50,
+        "created_at": created_at["e"],
+        "updated_at": stored["e"]["updated_at"],
+    }
+    assert (stored["g"]["n"], stored["g"]["created_at"]) == (70, created_at["g"])
+    assert stored["f"]["n"] == 60 and stored["f"]["created_at"] == stored["f"]["updated_at"]
+
+
+def test_bulk_write_chunks_by_size(mongo_conn, mongo_server):
+    from base.common.adapters.stores.mongo import MongoRepo
+
+    class Repo(MongoRepo):
+        bulk_write_max_bytes = 2500
+
+    with mongo_conn.cursor() as curs:
+        Repo()._insert_many(curs, "items", [{"data": "x" * 1000} for _ in range(5)])
+    inserts = [x for x in mongo_server.commands if "insert" in x]
+    assert [len(x["documents"]) for x in inserts] == [2, 2, 1]
+
+
+def test_bulk_write_duplicates_report_the_ids(mongo_conn, mongo_server):
+    from base.common.adapters.stores import StoreErrors
+    from base.common.adapters.stores.mongo import MongoRepo
+
+    mongo_server.unique_fields["users"] = ["email"]
+    repo = MongoRepo()
+    with mongo_conn.cursor() as curs:
+        repo._insert_many(curs, "users", [{"id": "a", "email": "a@x"}])
+        with pytest.raises(StoreErrors.DuplicateKey, match=r"\['b'\]"):
+            repo._insert_many(curs, "users", [{"id": "b", "email": "a@x"}])
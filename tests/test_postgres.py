@@ -0,0 +1,579 @@
+import asyncio
+
+import pytest
+
+from tests.helpers import TEST_TABLE, bench_items
+
+pytestmark = [pytest.mark.integration]
+
+
+def test_insert_many_returning(pg_curs, pg_repo):
+    res = pg_repo._insert_many(
+        curs=pg_curs, table_name=TEST_TABLE, items=bench_items(3), returning=True
+    )
+
+    assert [x["counter"] for x in res] == [0, 1, 2]
+    assert [x["json_data"] for x in res] == [{"idx": 0}, {"idx": 1}, {"idx": 2}]
+
+
+def test_insert_many_with_different_keys(pg_curs, pg_repo):
+    from decimal import Decimal
+
+    from base.common.adapters.stores.common import StoreErrors
+
+    items = [{"name": "a", "counter": 1}, {"name": "b"}, {"name": "c", "price": Decimal(3)}]
+    res = pg_repo._insert_many(curs=pg_curs, table_name=TEST_TABLE, items=items, returning=True)
+
+    assert [(x["name"], x["counter"], x["price"]) for x in res] == [
+        ("a", 1, None),
+        ("b", None, None),
+        ("c", None, Decimal(3)),
+    ]
+    with pytest.raises(StoreErrors.BaseError, match="counter"):
+        pg_repo._insert_stream(
+            curs=pg_curs, table_name=TEST_TABLE, items=[{"name": "d"}, {"name": "e", "counter": 5}]
+        )
+
+
+def test_statement_cache_reuses_rendered_queries(pg_curs, pg_repo):
+    pg_repo._statements.clear()
+    item = pg_repo._insert_many(curs=pg_curs, table_name=TEST_TABLE, items=bench_items(1))[0]
+
+    for _ in range(3):
+        pg_repo._get_by_id(
+            curs=pg_curs,
+            table_name=TEST_TABLE,
+            elem_id=item["id"],
+            for_update=False,
+            account_id_field="name",
+            account_id_value=item["name"],
+        )
+
+    info = pg_repo.statement_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 2, 2)
+
+
+def test_async_repo_crud(pg_conn):
+    from base.common.adapters.stores.postgres import AsyncPostgresConnection, AsyncPostgresRepo
+    from base.common.settings import PostgresConnectionSettings
+    from base.common.utils.logger import BasicLogger
+
+    async def crud():
+        conn = AsyncPostgresConnection(
+            config=PostgresConnectionSettings(), parent_logger=BasicLogger("bench")
+        )
+        pg_repo = AsyncPostgresRepo()
+        async with conn.cursor() as curs:
+            item = await pg_repo._insert(curs=curs, table_name=TEST_TABLE, item=bench_items(1)[0])
+            await pg_repo._update(
+                curs=curs,
+                table_name=TEST_TABLE,
+                supported_attributes=["counter"],
+                item_id=item["id"],
+                counter=10,
+            )
+        async with conn.cursor() as curs:
+            found = await pg_repo._get_by_id(
+                curs=curs,
+                table_name=TEST_TABLE,
+                elem_id=item["id"],
+                for_update=True,
+                account_id_field=None,
+                account_id_value=None,
+            )
+            await pg_repo._delete(
+                curs=curs,
+                table_name=TEST_TABLE,
+                elem_id=item["id"],
+                account_id_field=None,
+                account_id_value=None,
+            )
+        await conn.close()
+        return found
+
+    assert asyncio.run(crud())["counter"] == 10
+
+
+@pytest.mark.parametrize("sorting", [None, ["counter:desc"], ["name:asc", "counter:desc"]])
+def test_list_walks_every_page_once(pg_curs, pg_repo, sorting):
+    from base.common.entities.sorting import Sorting, SortingSequence
+    from base.common.usecases import UsecaseListReq
+
+    items = pg_repo._insert_many(curs=pg_curs, table_name=TEST_TABLE, items=bench_items(25))
+    for item in items:
+        item["name"] = f"name-{item['counter'] % 3}"
+        pg_repo._update(
+            curs=pg_curs,
+            table_name=TEST_TABLE,
+            supported_attributes=["name"],
+            item_id=item["id"],
+            name=item["name"],
+        )
+    sorting = SortingSequence(Sorting(x) for x in sorting or [])
+
+    seen, pages, req = [], 0, UsecaseListReq()
+    while True:
+        rows, pagination = pg_repo._list(
+            curs=pg_curs, table_name=TEST_TABLE, req=req, limit=10, sorting=sorting
+        )
+        seen.extend(rows)
+        pages += 1
+        if not pagination.has_more:
+            break
+        req = UsecaseListReq(cursor=pagination.after_cursor)
+
+    expected = sorted(items, key=lambda x: x["id"], reverse=bool(sorting))
+    for x in reversed(sorting):
+        expected.sort(key=lambda i: i[x.field], reverse=x.order.value == "DESC")
+    assert pages == 3
+    assert [x["id"] for x in seen] == [x["id"] for x in expected]
+
+
+@pytest.mark.parametrize("sorting", [["counter:asc"], ["name:asc", "counter:desc"]])
+def test_list_next_page_survives_deleted_last_row(pg_curs, pg_repo, sorting):
+    from base.common.entities.sorting import Sorting, SortingSequence
+    from base.common.usecases import UsecaseListReq
+
+    pg_repo._insert_many(curs=pg_curs, table_name=TEST_TABLE, items=bench_items(25))
+    sorting = SortingSequence(Sorting(x) for x in sorting)
+    first, pagination = pg_repo._list(
+        curs=pg_curs, table_name=TEST_TABLE, req=UsecaseListReq(), limit=10, sorting=sorting
+    )
+    expected, _ = pg_repo._list(
+        curs=pg_curs,
+        table_name=TEST_TABLE,
+        req=UsecaseListReq(cursor=pagination.after_cursor),
+        limit=10,
+        sorting=sorting,
+    )
+    pg_repo._delete(
+        curs=pg_curs,
+        table_name=TEST_TABLE,
+        elem_id=first[-1]["id"],
+        account_id_field=None,
+        account_id_value=None,
+    )
+
+    rows, _ = pg_repo._list(
+        curs=pg_curs,
+        table_name=TEST_TABLE,
+        req=UsecaseListReq(cursor=pagination.after_cursor),
+        limit=10,
+        sorting=sorting,
+    )
+
+    assert len(rows) == 10
+    assert [x["id"] for x in rows] == [x["id"] for x in expected]
+
+
+@pytest.mark.parametrize("sorting", ["price:asc", "created_at:desc"])
+def test_list_pages_on_exact_numeric_and_timestamp_values(pg_curs, pg_repo, sorting):
+    from decimal import Decimal
+
+    from base.common.entities.sorting import Sorting, SortingSequence
+    from base.common.usecases import UsecaseListReq
+
+    # the values differ beyond the precision of a float, and by a microsecond
+    items = [
+        {**x, "price": Decimal("12345678901234567.001") + Decimal(i // 2) / 1000}
+        for i, x in enumerate(bench_items(25))
+    ]
+    items = pg_repo._insert_many(curs=pg_curs, table_name=TEST_TABLE, items=items)
+    pg_curs.cursor.execute(
+        f"UPDATE {pg_curs.schema_name}.{TEST_TABLE} "
+        "SET created_at = created_at + make_interval(secs => counter / 2 / 1e6);"
+    )
+    sorting = SortingSequence([Sorting(sorting)])
+
+    seen, req = [], UsecaseListReq()
+    while True:
+        rows, pagination = pg_repo._list(
+            curs=pg_curs, table_name=TEST_TABLE, req=req, limit=4, sorting=sorting
+        )
+        seen.extend(rows)
+        if not pagination.has_more:
+            break
+        req = UsecaseListReq(cursor=pagination.after_cursor)
+
+    field, reverse = sorting[0].field, sorting[0].order.value == "DESC"
+    expected = sorted(seen, key=lambda x: (x[field], x["id"]), reverse=reverse)
+    assert len(seen) == 25 and {x["id"] for x in seen} == {x["id"] for x in items}
+    assert [x["id"] for x in seen] == [x["id"] for x in expected]
+
+
+def test_list_before_an_id_returns_the_previous_page(pg_curs, pg_repo):
+    from base.common.entities.sorting import Sorting, SortingSequence
+    from base.common.usecases import UsecaseListReq
+
+    items = pg_repo._insert_many(curs=pg_curs, table_name=TEST_TABLE, items=bench_items(25))
+    sorting = SortingSequence([Sorting("counter:asc")])
+
+    rows, pagination = pg_repo._list(
+        curs=pg_curs,
+        table_name=TEST_TABLE,
+        req=UsecaseListReq(iden_lt=items[15]["id"]),
+        limit=10,
+        sorting=sorting,
+    )
+    first, last = pg_repo._list(
+        curs=pg_curs,
+        table_name=TEST_TABLE,
+        req=UsecaseListReq(cursor=pagination.after_cursor),
+        limit=10,
+        sorting=sorting,
+    )
+
+    assert [x["counter"] for x in rows] == list(range(5, 15)) and pagination.has_more
+    assert [x["counter"] for x in first] == list(range(5)) and not last.has_more
+
+
+def test_stream_yields_rows_lazily(pg_curs, pg_repo):
+    items = pg_repo._insert_many(curs=pg_curs, table_name=TEST_TABLE, items=bench_items(25))
+    ids = sorted(x["id"] for x in items)
+
+    rows = pg_repo._stream(curs=pg_curs, table_name=TEST_TABLE, itersize=10)
+    batches = pg_repo._stream(
+        curs=pg_curs,
+        table_name=TEST_TABLE,
+        columns=["id", "counter"],
+        itersize=10,
+        batches=True,
+        as_tuples=True,
+    )
+
+    assert [x["id"] for x in rows] == ids
+    assert [[x[0] for x in batch] for batch in batches] == [ids[:10], ids[10:20], ids[20:]]
+
+
+def test_pipeline_session_maps_errors_raised_on_commit(pg_conn, pg_repo):
+    from base.common.adapters.stores.common import StoreErrors
+
+    with pg_conn.cursor(pipeline=True) as curs:
+        item = pg_repo._insert(curs=curs, table_name=TEST_TABLE, item=bench_items(1)[0])
+        pg_repo._delete(
+            curs=curs,
+            table_name=TEST_TABLE,
+            elem_id=item["id"],
+            account_id_field=None,
+            account_id_value=None,
+        )
+
+    with pytest.raises(StoreErrors.DuplicateKey):
+        with pg_conn.cursor(pipeline=True) as curs:
+            query = f"INSERT INTO {curs.schema_name}.{TEST_TABLE} (id) VALUES (%s);"
+            curs.cursor.execute(query, ("dup",))
+            curs.cursor.execute(query, ("dup",))
+
+    with pg_conn.cursor() as curs:
+        curs.cursor.execute(f"SELECT id FROM {curs.schema_name}.{TEST_TABLE} WHERE id = 'dup';")
+        assert curs.cursor.fetchone() is None
+
+
+def test_read_only_cursor_skips_unavailable_replicas(monkeypatch):
+    from base.common.adapters.stores.postgres import PostgresConnection
+    from base.common.settings import PostgresConnectionSettings
+    from base.common.utils.logger import BasicLogger
+
+    monkeypatch.setenv("POSTGRES_REPLICA_HOSTS", "localhost:1,localhost")
+    monkeypatch.setenv("POSTGRES_REPLICA_CHECKOUT_TIMEOUT", "0.2")
+    conn = PostgresConnection(
+        config=PostgresConnectionSettings(), parent_logger=BasicLogger("bench")
+    )
+    down, up = conn.replicas.items
+
+    for _ in range(3):
+        with conn.cursor(read_only=True) as curs:
+            curs.cursor.execute("SHOW transaction_read_only;")
+            assert curs.cursor.fetchone()["transaction_read_only"] == "on"
+    conn.replicas.mark_unhealthy(up)
+    with conn.cursor(read_only=True) as curs:
+        curs.cursor.execute("SELECT 1;")
+    with conn.cursor() as curs:
+        curs.cursor.execute("SHOW transaction_read_only;")
+        assert curs.cursor.fetchone()["transaction_read_only"] == "off"
+    conn.close()
+
+    assert not down.healthy
+    assert up.pool.get_stats()["connections_num"] > 0
+
+
+def test_connection_records_session_metrics(pg_conn):
+    from base.common.adapters.stores.common import StoreMetricsSink
+
+    class ListSink(StoreMetricsSink):
+        def __init__(self):
+            self.recorded = []
+
+        def record(self, metrics):
+            self.recorded.append(metrics)
+
+    pg_conn.metrics_sink = sink = ListSink()
+    before = pg_conn.metrics()
+    with pg_conn.cursor() as curs:
+        curs.cursor.execute("SELECT 1;")
+    with pytest.raises(ZeroDivisionError):
+        with pg_conn.cursor():
+            1 / 0
+    after = pg_conn.metrics()
+    del pg_conn.metrics_sink
+
+    assert after["commits"] - before["commits"] == 1
+    assert after["rollbacks"] - before["rollbacks"] == 1
+    assert after["pool"]["primary"]["pool_size"] > 0
+    assert [x.outcome for x in sink.recorded] == ["commit", "rollback"]
+    assert pg_conn.last_session_metrics() is sink.recorded[-1]
+
+
+def test_checkout_wait_excludes_the_session_setup(pg_conn, monkeypatch):
+    from base.common.adapters.stores import postgres
+
+    monkeypatch.setattr(postgres, "timeouts_statement", lambda *_, **__: ("SELECT pg_sleep(0.2);",))
+    with pg_conn.cursor(autocommit=True) as curs:
+        curs.cursor.execute("SELECT 1;")
+    metrics = pg_conn.last_session_metrics()
+
+    assert metrics.checkout_ms < 100
+    assert metrics.session_ms >= 200
+
+
+def test_usecase_logs_the_store_session(pg_conn):
+    from unittest.mock import MagicMock
+
+    from base.common.usecases import WithStoreConnection
+
+    class Usecase(WithStoreConnection):
+        def __init__(self, conn):
+            self.conn = conn
+            self.logger = MagicMock()
+
+        @WithStoreConnection.with_cursor()
+        def execute(self, curs=None):
+            return "done"
+
+    real, mocked = Usecase(pg_conn), Usecase(MagicMock())
+
+    assert real.execute() == mocked.execute() == "done"
+    assert real.logger.info.call_args.kwargs["store"]["outcome"] == "commit"
+    assert mocked.logger.info.call_args.kwargs == {}
+
+
+def test_get_by_ids_keeps_request_order(pg_curs, pg_repo, monkeypatch):
+    from base.common.adapters.stores.common import StoreErrors
+
+    monkeypatch.setattr(pg_repo, "get_by_ids_chunk_size", 2)
+    ids = [x["id"] for x in pg_repo._insert_many(pg_curs, TEST_TABLE, bench_items(5))]
+    requested = [ids[3], "missing", ids[0], ids[4], ids[3]]
+
+    rows = pg_repo._get_by_ids(pg_curs, TEST_TABLE, requested, for_update=True, missing="skip")
+    scoped = pg_repo._get_by_ids(
+        pg_curs,
+        TEST_TABLE,
+        ids,
+        account_id_field="name",
+        account_id_value="name-1",
+        missing="skip",
+    )
+
+    assert [x["id"] for x in rows] == [ids[3], ids[0], ids[4], ids[3]]
+    assert [x["id"] for x in scoped] == [ids[1]]
+    with pytest.raises(StoreErrors.NotFound):
+        pg_repo._get_by_ids(pg_curs, TEST_TABLE, requested)
+
+
+def test_upsert_many_and_update_many(pg_curs, pg_repo):
+    items = pg_repo._insert_many(pg_curs, TEST_TABLE, bench_items(3), returning=True)
+    created_at = {x["id"]: x["created_at"] for x in items}
+
+    upserted = pg_repo._upsert_many(
+        pg_curs,
+        TEST_TABLE,
+        [{"id": items[0]["id"], "name": "changed", "counter": 100}, *bench_items(1)],
+        supported_attributes=["counter"],
+        batch_size=1,
+    )
+    updated = pg_repo._update_many(
+        pg_curs,
+        TEST_TABLE,
+        ["name", "counter"],
+        [
+            {"id": items[1]["id"], "counter": 11},
+            {"id": items[2]["id"], "name": "other", "counter": 12},
+            {"id": "missing", "counter": 0},
+        ],
+    )
+
+    assert [(x["name"], x["counter"]) for x in upserted] == [("name-0", 100), ("name-0", 0)]
+    assert upserted[0]["created_at"] == created_at[items[0]["id"]]
+    assert sorted((x["name"], x["counter"]) for x in updated) == [("name-1", 11), ("other", 12)]
+    assert all(x["updated_at"] > x["created_at"] for x in updated)
+
+
+def test_upsert_many_keeps_the_columns_missing_from_an_item(pg_curs, pg_repo):
+    items = pg_repo._insert_many(pg_curs, TEST_TABLE, bench_items(2), returning=True)
+
+    upserted = pg_repo._upsert_many(
+        pg_curs,
+        TEST_TABLE,
+        [
+            {"id": items[0]["id"], "name": "changed", "counter": 100},
+            {"id": items[1]["id"], "counter": 101},
+        ],
+        supported_attributes=["name", "counter", "json_data"],
+    )
+
+    rows = {x["id"]: x for x in upserted}
+    assert (rows[items[0]["id"]]["name"], rows[items[0]["id"]]["counter"]) == ("changed", 100)
+    assert rows[items[0]["id"]]["json_data"] == items[0]["json_data"]
+    assert (rows[items[1]["id"]]["name"], rows[items[1]["id"]]["counter"]) == ("name-1", 101)
+    assert rows[items[1]["id"]]["json_data"] == items[1]["json_data"]
+
+
+def test_bulk_writes_keep_exact_numeric_and_bytes(pg_curs, pg_repo):
+    from decimal import Decimal
+
+    price, payload = Decimal("12345678901234567.123"), b"\x00\xffdata"
+    items = pg_repo._insert_many(pg_curs, TEST_TABLE, bench_items(2), returning=True)
+
+    upserted = pg_repo._upsert_many(
+        pg_curs,
+        TEST_TABLE,
+        [{"id": items[0]["id"], "price": price, "payload": payload}],
+        supported_attributes=["price", "payload"],
+    )
+    updated = pg_repo._update_many(
+        pg_curs, TEST_TABLE, ["price", "payload"], [{"id": items[1]["id"], "price": price}]
+    )
+
+    assert (upserted[0]["price"], bytes(upserted[0]["payload"])) == (price, payload)
+    assert updated[0]["price"] == price
+
+
+@pytest.mark.parametrize("codec", ["json", "orjson"])
+def test_json_codec_round_trip(pg_curs, pg_repo, codec):
+    from datetime import datetime
+    from decimal import Decimal
+
+    from base.common.adapters.stores.postgres import json_adapters, json_codec, orjson_supported
+
+    if codec == "orjson" and not orjson_supported():
+        pytest.skip("orjson extra not installed")
+    pg_curs.cursor.connection.adapters.__init__(json_adapters(json_codec(codec)))
+    payload = {"at": datetime(2024, 1, 2, 3, 4, 5, 6), "price": Decimal("1.5"), "n": {"x": [1]}}
+    item = pg_repo._insert(pg_curs, TEST_TABLE, {"name": "x", "counter": 1, "json_data": payload})
+
+    found = pg_repo._get_by_id(pg_curs, TEST_TABLE, item["id"], False, None, None)
+    assert found["json_data"] == {"at": "2024-01-02T03:04:05.000006", "price": 1.5, "n": {"x": [1]}}
+
+
+def test_json_codec_auto_skips_unsupported_orjson(monkeypatch):
+    from types import SimpleNamespace
+
+    from base.common.adapters.stores import StoreErrors, postgres
+
+    monkeypatch.setattr(postgres, "orjson", SimpleNamespace(__version__="3.8.3"))
+    assert type(postgres.json_codec("auto")) is postgres.JsonCodec
+    with pytest.raises(StoreErrors.Connection, match="orjson>=3.10.6"):
+        postgres.json_codec("orjson")
+    monkeypatch.setattr(postgres, "orjson", SimpleNamespace(__version__="3.13.0"))
+    assert type(postgres.json_codec("auto")) is postgres.OrjsonCodec
+
+
+def test_slow_query_log_with_explain(pg_conn, pg_repo, monkeypatch):
+    import psycopg
+
+    from base.common.adapters.stores.postgres import PostgresConnection
+    from base.common.settings import PostgresConnectionSettings
+    from base.common.utils.context import CallContext
+    from base.common.utils.logger import Logger
+
+    class ListLogger(Logger):
+        def __init__(self):
+            self.records = []
+
+        def child(self, suffix: str, **values) -> Logger:
+            return self
+
+        def warning(self, msg: str, *args, **kwargs):
+            self.records.append((msg, kwargs))
+
+    monkeypatch.setenv("POSTGRES_SLOW_QUERY_MS", "5")
+    monkeypatch.setenv("POSTGRES_SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "1")
+    logger = ListLogger()
+    conn = PostgresConnection(config=PostgresConnectionSettings(), parent_logger=logger)
+    CallContext.set_correlation_id("slow-query-test")
+
+    # only the statements sleeping are run on the logging connection
+    with pg_conn.cursor() as curs:
+        item = pg_repo._insert(curs, TEST_TABLE, bench_items(1)[0])
+    with conn.cursor() as curs:
+        curs.cursor.execute("SELECT pg_sleep(0.01), %(id)s AS id;", {"id": item["id"]})
+        selected = curs.cursor.fetchone()
+        curs.cursor.execute(
+            f"UPDATE {curs.schema_name}.{TEST_TABLE} "
+            "SET counter = counter + (SELECT 0 FROM pg_sleep(0.01));"
+        )
+        curs.cursor.execute(
+            "WITH slept AS (SELECT pg_sleep(0.01)) "
+            f"INSERT INTO {curs.schema_name}.{TEST_TABLE} (id, name) "
+            "SELECT gen_random_uuid()::TEXT, 'slow-cte' FROM slept;"
+        )
+    conn.close()
+    with pg_conn.cursor() as curs:
+        assert type(curs.cursor) is psycopg.Cursor
+
+    slow = [kwargs for msg, kwargs in logger.records if msg == "slow query"]
+    assert selected["id"] == item["id"]
+    assert [x["statement"].split()[0] for x in slow] == ["SELECT", "UPDATE", "WITH"]
+    assert all(x["correlation_id"] == "slow-query-test" for x in slow)
+    assert "Buffers" in slow[0]["plan"] or "Execution Time" in slow[0]["plan"]
+    assert "plan" not in slow[1] and "plan" not in slow[2]
+    with pg_conn.cursor() as curs:
+        curs.cursor.execute(
+            f"SELECT count(*) AS n FROM {curs.schema_name}.{TEST_TABLE} WHERE name = 'slow-cte';"
+        )
+        assert curs.cursor.fetchone()["n"] == 1
+
+
+def test_failed_session_setup_gives_back_the_connection(pg_conn):
+    from base.common.adapters.stores.common import StoreErrors
+
+    def checked_out():
+        stats = pg_conn.pool.get_stats()
+        return stats.get("pool_size", 0) - stats.get("pool_available", 0)
+
+    for _ in range(pg_conn.config.pool_max_size + 1):
+        with pytest.raises(StoreErrors.BaseError):
+            with pg_conn.cursor(statement_timeout_ms=-5):
+                pass  # pragma: no cover
+    assert checked_out() == 0
+    with pg_conn.cursor() as curs:
+        curs.cursor.execute("SELECT 1;")
+
+
+def test_session_timeouts(pg_conn):
+    from base.common.adapters.stores.common import StoreErrors
+
+    def show_timeouts(curs):
+        curs.cursor.execute("SHOW statement_timeout;")
+        statement_timeout = curs.cursor.fetchone()["statement_timeout"]
+        curs.cursor.execute("SHOW lock_timeout;")
+        return statement_timeout, curs.cursor.fetchone()["lock_timeout"]
+
+    with pg_conn.cursor() as curs:
+        defaults = show_timeouts(curs)
+    with pytest.raises(StoreErrors.Timeout):
+        with pg_conn.cursor(statement_timeout_ms=50) as curs:
+            curs.cursor.execute("SELECT pg_sleep(1);")
+    with pg_conn.cursor(autocommit=True, lock_timeout_ms=20) as curs:
+        assert show_timeouts(curs) == (defaults[0], "20ms")
+    for autocommit in (False, True):
+        with pg_conn.cursor(autocommit=autocommit) as curs:
+            assert show_timeouts(curs) == defaults
+
+
+def test_startup_timeouts_only_when_configured(pg_conn):
+    from base.common.adapters.stores.postgres import pool_options
+
+    assert "options" not in pool_options(pg_conn.config)["kwargs"]
+    config = pg_conn.config.model_copy(update={"statement_timeout_ms": 30000})
+    assert pool_options(config)["kwargs"]["options"] == "-c statement_timeout=30000"